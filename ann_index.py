@@ -0,0 +1,173 @@
+import numpy as np
+import faiss
+
+# ========== CONFIG ==========
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw", "pq", "sq8")
+TRAIN_SAMPLE = 100_000  # Max vectors used to train IVF/PQ quantizers
+PQ_M = 64  # PQ sub-quantizers (2048-d / 64 = 32 dims each)
+PQ_BITS = 8
+HNSW_M = 32  # Graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+OVERFETCH = 4  # Filtered searches on indexes without selector support start at k * OVERFETCH
+
+# ========== BUILD ==========
+def default_nlist(n):
+    """Rule-of-thumb IVF list count: ~4*sqrt(N), at least 1 and at most N/39"""
+    return int(max(1, min(4 * np.sqrt(n), n // 39 or 1)))
+
+def make_index(dim, index_type="flat", n=None, nlist=None, pq_m=PQ_M, pq_bits=PQ_BITS, hnsw_m=HNSW_M):
+    """Create an empty (possibly untrained) L2 index of the given type"""
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+    if index_type == "pq":
+        return faiss.IndexPQ(dim, pq_m, pq_bits)  # pq_m bytes per vector, exhaustive scan over codes
+    if index_type == "sq8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)  # 1 byte per dimension
+    nlist = nlist or default_nlist(n or 0)
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist)
+    if index_type == "ivfpq":
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_bits)
+    raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+def train_index(index, features, train_sample=TRAIN_SAMPLE, seed=0):
+    """Train on a random sample of `features` if the index needs it"""
+    if index.is_trained:
+        return
+    rng = np.random.default_rng(seed)
+    n = min(len(features), train_sample)
+    sample = features[rng.choice(len(features), n, replace=False)] if n < len(features) else features
+    index.train(np.ascontiguousarray(sample, dtype="float32"))
+
+def build_index(features, index_type="flat", nlist=None, pq_m=PQ_M, pq_bits=PQ_BITS,
+                hnsw_m=HNSW_M, train_sample=TRAIN_SAMPLE, with_ids=True, ids=None):
+    """Build and fill an index over `features`.
+
+    With `with_ids` the index is wrapped in an IndexIDMap2 whose ids are the
+    row positions (or `ids`), which is what the detection service expects.
+    """
+    features = np.ascontiguousarray(features, dtype="float32")
+    index = make_index(features.shape[1], index_type, len(features), nlist, pq_m, pq_bits, hnsw_m)
+    train_index(index, features, train_sample)
+    if with_ids:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(features, _ids(ids, len(features)))
+    else:
+        index.add(features)
+    return index
+
+# ========== LOAD ==========
+def read_index(path, mmap=False):
+    """Read an index, memory-mapping its storage where the index type allows.
+
+    Flat code storage (newer FAISS, IO_FLAG_MMAP_IFC) and on-disk IVF lists
+    can be mapped read-only and shared across processes via the page cache.
+    Anything else falls back to a normal in-memory read. Returns
+    (index, mapped); a mapped index cannot be modified.
+    """
+    if mmap:
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(str(path), flag | faiss.IO_FLAG_READ_ONLY), True
+        except RuntimeError:
+            pass
+    return faiss.read_index(str(path)), False
+
+# ========== QUERY-TIME TUNING ==========
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Apply nprobe (IVF) / efSearch (HNSW) where the index type supports them"""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # Not applicable to this index type
+
+# ========== FILTERED SEARCH ==========
+def search(index, queries, k, ids=None):
+    """index.search, restricted to `ids` (int64 array) when given.
+
+    The restriction is pushed down to FAISS as an IDSelectorBatch, so
+    excluded vectors are skipped during the scan instead of filtered out of
+    an over-fetched top-k. The index's own nprobe / efSearch are kept.
+    Index types whose search rejects a selector (IndexPQ) fall back to
+    over-fetching and filtering.
+    """
+    if ids is None:
+        return index.search(queries, k)
+    if not isinstance(index, faiss.Index):
+        return index.search(queries, k, ids=ids)  # TwoStageIndex, ShardedIndex, ...
+    ids = np.ascontiguousarray(ids, dtype="int64")
+    if not takes_selector(index):
+        return _overfetch_search(index, queries, k, ids)
+    selector = faiss.IDSelectorBatch(ids)
+    return index.search(queries, k, params=_filter_params(index, selector))
+
+def takes_selector(index):
+    """Whether index.search accepts SearchParameters with an IDSelector"""
+    return not isinstance(_base(index), faiss.IndexPQ)  # "selector not supported" from FAISS
+
+def _base(index):
+    if isinstance(index, faiss.IndexIDMap):  # Selector ids are the map's ids, the params apply underneath
+        return faiss.downcast_index(index.index)
+    return index
+
+def _filter_params(index, selector):
+    """SearchParameters with `selector`, carrying over the tuned nprobe / efSearch"""
+    base = _base(index)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def _overfetch_search(index, queries, k, ids):
+    """Top-k among `ids` by over-fetching, doubling until every row has k allowed hits.
+
+    The first fetch expects k * OVERFETCH allowed hits at the filter's
+    selectivity. Stops at the whole index, so rows with fewer than k allowed
+    vectors are padded with id -1 like FAISS pads a short result.
+    """
+    queries = np.atleast_2d(queries)
+    fetch = min(index.ntotal, max(k, 1) * OVERFETCH * max(1, index.ntotal // max(len(ids), 1)))
+    while True:
+        D, I = index.search(queries, max(fetch, 1))
+        allowed = np.isin(I, ids)
+        if fetch >= index.ntotal or allowed.sum(axis=1).min() >= k:
+            break
+        fetch = min(index.ntotal, fetch * 2)
+
+    worst = np.finfo("float32").max
+    D_out = np.full((len(queries), k), -worst if index.metric_type == faiss.METRIC_INNER_PRODUCT else worst,
+                    dtype="float32")
+    I_out = np.full((len(queries), k), -1, dtype="int64")
+    for row in range(len(queries)):
+        hits = np.flatnonzero(allowed[row])[:k]
+        D_out[row, :len(hits)] = D[row, hits]
+        I_out[row, :len(hits)] = I[row, hits]
+    return D_out, I_out
+
+# ========== COSINE ==========
+def build_cosine_index(features, ids=None):
+    """Inner-product index over L2-normalized features, ids = row positions (or `ids`).
+
+    Inner product of unit vectors is cosine similarity, so FAISS returns the
+    top-k directly instead of scoring and sorting the whole corpus in numpy.
+    """
+    normalized = np.array(features, dtype="float32", copy=True)
+    faiss.normalize_L2(normalized)
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(normalized.shape[1]))
+    index.add_with_ids(normalized, _ids(ids, len(normalized)))
+    return index
+
+def _ids(ids, n):
+    return np.arange(n, dtype="int64") if ids is None else np.ascontiguousarray(ids, dtype="int64")
@@ -0,0 +1,97 @@
+import asyncio
+from collections import Counter
+
+
+class InferenceBatcher:
+    """Groups single-image tensors from concurrent requests into batched forward passes.
+
+    Callers `await submit(tensor)`; a background task takes the first queued
+    item, then keeps collecting until it has `max_batch` items or `max_wait_ms`
+    has passed, runs one forward pass off the event loop and resolves each
+    caller's future with its own (1, dim) feature row. `model` is an
+    embedding.Embedder: a (N, C, H, W) batch in, (N, dim) float32 rows out.
+    `timer(name)`, if given, returns a context manager wrapped around each
+    forward pass (e.g. metrics.Registry.stage).
+    """
+
+    def __init__(self, model, max_batch=16, max_wait_ms=5.0, timer=None):
+        self.model = model
+        self.timer = timer
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.task = None
+        self.batch_sizes = Counter()
+
+    # ========== Lifecycle ==========
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    # ========== Requests ==========
+    async def submit(self, tensor):
+        """Queue one preprocessed (C, H, W) tensor and wait for its feature row"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((tensor, future))
+        return await future
+
+    # ========== Worker ==========
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [(tensor, future) for tensor, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+            self.batch_sizes[len(batch)] += 1
+            try:
+                vecs = await asyncio.to_thread(self._forward, [t for t, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for i, (_, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result(vecs[i:i + 1].copy())  # A view would pin the whole batch in the caches
+
+    def _forward(self, tensors):
+        import torch  # Loaded by the model already; kept off the service's import path
+
+        batch = torch.stack(tensors)
+        if self.timer is None:
+            return self.model(batch)
+        with self.timer("forward"):
+            return self.model(batch)
+
+    # ========== Stats ==========
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        items = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": items / batches if batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
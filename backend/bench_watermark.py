@@ -0,0 +1,80 @@
+"""Per-image post-processing time for generated images: legacy vs cached watermarking.
+
+    python bench_watermark.py --repeat 20
+"""
+import io
+import time
+import base64
+import argparse
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from watermark import process_generated
+
+SIZES = (512, 768, 1024)
+
+
+def legacy_postprocess(output_image_b64):
+    """The original generate_image path: full-frame RGBA layer, font load per call, default PNG"""
+    image = Image.open(io.BytesIO(base64.b64decode(output_image_b64))).convert("RGBA")
+    watermark_layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(watermark_layer)
+    try:
+        font = ImageFont.truetype("arial.ttf", 36)
+    except IOError:
+        font = ImageFont.load_default()
+    watermark_text = "© AI Generated"
+    text_bbox = draw.textbbox((0, 0), watermark_text, font=font)
+    x = image.width - (text_bbox[2] - text_bbox[0]) - 10
+    y = image.height - (text_bbox[3] - text_bbox[1]) - 10
+    draw.text((x, y), watermark_text, font=font, fill=(255, 255, 255, 128))
+    buffer = io.BytesIO()
+    Image.alpha_composite(image, watermark_layer).convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def sd_output(size, rng):
+    """A photo-like (smooth gradient + noise) PNG, base64-encoded like the WebUI returns it"""
+    gradient = np.linspace(0, 255, size, dtype=np.float32)
+    pixels = (gradient[None, :, None] * 0.5 + gradient[:, None, None] * 0.3
+              + rng.normal(0, 12, (size, size, 3))).clip(0, 255).astype("uint8")
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def bench(fn, payload, repeat):
+    fn(payload)  # Warm caches (font, tile) the way a long-running server would
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(payload)
+        times.append((time.perf_counter() - start) * 1000)
+    size = len(out[0] if isinstance(out, tuple) else out)
+    return np.median(times), np.percentile(times, 95), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    variants = [
+        ("legacy png", legacy_postprocess),
+        ("png level 6", lambda b: process_generated(b, "png", png_compress_level=6)),
+        ("png level 1", lambda b: process_generated(b, "png", png_compress_level=1)),
+        ("webp q90", lambda b: process_generated(b, "webp", quality=90)),
+        ("jpeg q90", lambda b: process_generated(b, "jpeg", quality=90)),
+    ]
+    for size in SIZES:
+        payload = sd_output(size, rng)
+        print(f"\n{size}x{size}")
+        for name, fn in variants:
+            p50, p95, nbytes = bench(fn, payload, args.repeat)
+            print(f"  {name:<12} p50={p50:7.1f}ms  p95={p95:7.1f}ms  output={nbytes / 1024:7.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,44 @@
 import os
-import io
+import sys
+import time
+import uuid
+import asyncio
+import contextvars
 import base64
-import pickle
-import requests
+import json
+import hashlib
+import shutil
+import tempfile
+import zipfile
+import httpx
 import numpy as np
-import faiss
-import torch
-from io import BytesIO
 from pathlib import Path
+from functools import partial
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.staticfiles import StaticFiles
 
-import torchvision.transforms as transforms
-from PIL import Image, ImageDraw, ImageFont
-from torchvision.models import resnet50, ResNet50_Weights
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
-from typing import Optional
+from PIL import Image
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, Response, PlainTextResponse
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from batcher import InferenceBatcher
+from sd_client import SDPool, QueueFullError, BackendUnavailableError
+from jobs import JobManager
+from watermark import OUTPUT_FORMATS, process_generated
+from query_cache import LRUCache
+from phash import phash
+from feature_store import load_meta
+from readiness import Readiness
+from thumbnails import THUMBNAIL_FORMATS, ThumbnailCache
+from metrics import Registry, Gauge, Counter, request_timings, server_timing, sample_stacks
+# torch, torchvision and faiss are imported by the background loaders below, not here,
+# so a fresh worker answers /health while they load
 
 
 # ========== FastAPI App Setup ==========
@@ -36,6 +57,57 @@ app.add_middleware(
 BASE_DIR = Path(__file__).parent
 ART_DIR = BASE_DIR / "art_images"  # Directory where your art images are stored
 ART_DIR.mkdir(exist_ok=True)
+INDEX_PATH = BASE_DIR / "../art_index.faiss"
+IMAGE_PATHS_PATH = BASE_DIR / "../image_paths.pkl"
+FEATURES_PATH = BASE_DIR / "../features.npy"
+COSINE_INDEX_PATH = BASE_DIR / "../cosine_index.faiss"
+PHASHES_PATH = BASE_DIR / "../phashes.npy"
+COARSE_INDEX_PATH = BASE_DIR / "../coarse_index.faiss"
+PATCH_INDEX_PATH = BASE_DIR / "../patch_index.faiss"
+METADATA_PATH = BASE_DIR / "../artworks.db"  # Relative path, style, source and hashes per artwork id
+PATHS_ROOT = str(BASE_DIR.parent.resolve())  # Snapshots write image_paths.pkl as absolute paths, like u1.py
+THUMBNAIL_PATH = BASE_DIR / "../thumbnails"  # Derivatives made on demand or by u1.py --thumbnails
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", "60"))  # Seconds between state snapshots
+NPROBE = os.environ.get("NPROBE")  # IVF lists probed per query; unset keeps the value stored in the index
+EF_SEARCH = os.environ.get("EF_SEARCH")  # HNSW search breadth; unset keeps the stored value
+INDEX_MMAP = os.environ.get("INDEX_MMAP", "0") == "1"  # Share index pages across workers; disables live add/remove
+SHARD_DIR = os.environ.get("SHARD_DIR")  # Search shards built by u1.py --shards in parallel threads
+TWO_STAGE = os.environ.get("TWO_STAGE", "0") == "1"  # Compressed coarse index + exact re-rank from mmapped vectors
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "100"))  # K': coarse candidates re-scored per query
+PATCH_MODE = os.environ.get("PATCH_MODE", "0") == "1"  # Load the tile index built by u1.py --tiles for partial=true
+SHARD_SERVERS = [a for a in os.environ.get("SHARD_SERVERS", "").split(",") if a]  # host:port of shard_server.py processes
+EXTRACTOR_BACKEND = os.environ.get("EXTRACTOR_BACKEND", "eager")  # eager, torchscript, compile, int8 or onnx
+CHANNELS_LAST = os.environ.get("CHANNELS_LAST", "0") == "1"  # channels_last memory format for the torch backends
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "16"))  # Images per batched ResNet50 forward pass
+MAX_BATCH_WAIT_MS = float(os.environ.get("MAX_BATCH_WAIT_MS", "5"))  # How long a batch waits to fill up
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", str(min(8, os.cpu_count() or 1))))  # Decode/search/encode threads
+DETECT_CONCURRENCY = int(os.environ.get("DETECT_CONCURRENCY", "32"))  # In-flight detection/registration requests
+SD_BACKENDS = os.environ.get("SD_BACKENDS", "http://127.0.0.1:7860").split(",")  # Stable Diffusion WebUI base URLs
+GENERATE_CONCURRENCY = int(os.environ.get("GENERATE_CONCURRENCY", "1"))  # In-flight generations per SD backend
+SD_MAX_QUEUE = int(os.environ.get("SD_MAX_QUEUE", "16"))  # Generations allowed to wait before answering 429
+SD_TIMEOUT = float(os.environ.get("SD_TIMEOUT", "300"))  # Seconds to wait for one generation
+SD_QUEUE_TIMEOUT = float(os.environ.get("SD_QUEUE_TIMEOUT", "300"))  # Seconds a queued generation waits for a backend
+SD_RETRIES = int(os.environ.get("SD_RETRIES", "2"))  # Retries on connection errors and 502/503/504
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "300"))  # Seconds a finished job's image is kept
+JOB_PROGRESS_INTERVAL = float(os.environ.get("JOB_PROGRESS_INTERVAL", "1"))  # WebUI progress polling period
+JOB_EVENT_INTERVAL = float(os.environ.get("JOB_EVENT_INTERVAL", "0.5"))  # SSE status update period
+OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "png")  # Default generated image format: png, webp or jpeg
+PNG_COMPRESS_LEVEL = int(os.environ.get("PNG_COMPRESS_LEVEL", "6"))  # 0-9; lower is faster and larger
+OUTPUT_QUALITY = int(os.environ.get("OUTPUT_QUALITY", "90"))  # WebP/JPEG quality
+RESULT_CACHE_MB = float(os.environ.get("RESULT_CACHE_MB", "16"))  # Cached detection responses
+EMBEDDING_CACHE_MB = float(os.environ.get("EMBEDDING_CACHE_MB", "64"))  # Cached query embeddings (8 KB each)
+PHASH_PREFILTER = os.environ.get("PHASH_PREFILTER", "1") == "1"  # Answer near-exact copies without the CNN
+PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE", "6"))  # Hamming bits (max 7) for a confident copy
+BATCH_CHUNK = int(os.environ.get("BATCH_CHUNK", "64"))  # Images decoded, embedded and searched together by batch detection
+BATCH_MAX_IMAGES = int(os.environ.get("BATCH_MAX_IMAGES", "10000"))  # Images accepted per batch request
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"  # Per-stage timings, counters and GET /metrics
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"  # Add a Server-Timing header with each request's stages
+PROFILE_ENDPOINT = os.environ.get("PROFILE_ENDPOINT", "0") == "1"  # Expose GET /debug/profile (sampling profiler)
+THUMBNAIL_URLS = os.environ.get("THUMBNAIL_URLS", "1") == "1"  # Detection responses link to thumbnails of the matches
+THUMBNAIL_SIZE = int(os.environ.get("THUMBNAIL_SIZE", "256"))  # Size those links ask for (128, 256 or 512)
+THUMBNAIL_FORMAT = os.environ.get("THUMBNAIL_FORMAT", "webp")  # webp or jpeg
+THUMBNAIL_MAX_AGE = int(os.environ.get("THUMBNAIL_MAX_AGE", "86400"))  # Cache-Control max-age; ETags revalidate after it
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff")
 
 # Mount static directory for serving images
 app.mount("/art_images", StaticFiles(directory=ART_DIR), name="art_images")
@@ -44,71 +116,278 @@ app.mount("/artvee", StaticFiles(directory="D:/faiss3/artvee"), name="artvee")
 # ========== Fix for PyTorch OpenMP ==========
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
-# ========== Load FAISS and Features ==========
-try:
-    index = faiss.read_index(str(BASE_DIR / "../art_index.faiss"))
-    
-    with open(BASE_DIR / "../image_paths.pkl", "rb") as f:
-        image_paths = pickle.load(f)
-    
-    with open(BASE_DIR / "../features.pkl", "rb") as f:
-        features = pickle.load(f)
-    
-    # Normalize features for cosine similarity
-    norm_features = features / np.linalg.norm(features, axis=1, keepdims=True)
-except Exception as e:
-    raise RuntimeError(f"Failed to load FAISS index or features: {str(e)}")
-
-# ========== Load Pretrained ResNet50 ==========
-try:
-    weights = ResNet50_Weights.DEFAULT
-    model = resnet50(weights=weights)
-    model.eval()
-    model = torch.nn.Sequential(*(list(model.children())[:-1]))  # Remove final classification layer
-    
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
-except Exception as e:
-    raise RuntimeError(f"Failed to load ResNet50 model: {str(e)}")
+# ========== Background Loading ==========
+# The index and the embedding model load concurrently after startup; until both
+# are ready, /ready answers 503 and detection endpoints refuse with 503.
+live_index = None
+embedder = None
+two_stage = None
+patch_index = None
+readiness = Readiness(["index", "model"] + (["patches"] if PATCH_MODE else []))
+thumbnail_cache = ThumbnailCache(BASE_DIR.parent, THUMBNAIL_PATH)
+
+# ========== Metrics ==========
+# Stage timings go to one histogram labelled by stage: upload_read, hash, decode,
+# filter, phash, transform, embed (batch queue wait + forward), forward (per batch),
+# search (coarse_search, fetch_vectors and rerank with TWO_STAGE=1), patch_search,
+# resolve_paths, thumbnail, sd_roundtrip, output_decode, watermark and encode.
+metrics = Registry(enabled=METRICS_ENABLED)
+requests_total = metrics.counter("http_requests_total", "HTTP requests by route, method and status",
+                                 ["route", "method", "status"])
+request_duration = metrics.histogram("http_request_duration_seconds", "Time to the response headers by route",
+                                     ["route", "method"])
+requests_in_flight = metrics.gauge("http_requests_in_flight", "Requests being handled")
+detect_in_flight = metrics.gauge("detect_in_flight", "Detection and registration requests holding a slot")
+
+batcher = InferenceBatcher(None, max_batch=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS,
+                           timer=metrics.stage if METRICS_ENABLED else None)
+
+def read_index_meta():
+    """Which backbone and projection produced the indexed vectors; queries must match"""
+    if SHARD_DIR:
+        from shards import load_shard_meta
+        return load_shard_meta(SHARD_DIR)
+    return load_meta(COARSE_INDEX_PATH if TWO_STAGE else INDEX_PATH)
+
+def open_metadata():
+    from metadata_store import MetadataStore
+    from live_index import load_pickle
+
+    if METADATA_PATH.exists():
+        return MetadataStore(METADATA_PATH)
+    # Builds from before artworks.db: create it once from image_paths.pkl, styles from the file names
+    print(f"🗃️ {METADATA_PATH.name} not found; creating it from {IMAGE_PATHS_PATH.name}")
+    paths = [str(BASE_DIR.parent / p) if p is not None else None for p in load_pickle(IMAGE_PATHS_PATH)]
+    return MetadataStore.from_paths(paths, root=BASE_DIR.parent, path=METADATA_PATH)
+
+def load_live_index():
+    global two_stage
+    from live_index import LiveIndex
+    from ann_index import set_search_params
+
+    # Hits resolve to paths relative to the index directory through the metadata store
+    metadata = open_metadata()
+
+    # ID-mapped L2 and cosine (inner-product) indexes, so artworks can be added and removed while serving
+    nprobe, ef_search = (int(NPROBE) if NPROBE else None), (int(EF_SEARCH) if EF_SEARCH else None)
+    if SHARD_DIR or SHARD_SERVERS:
+        # Sharded corpus: fan out to every shard and merge the top-k; read-only like INDEX_MMAP
+        return LiveIndex.from_shards(IMAGE_PATHS_PATH, PHASHES_PATH, SHARD_DIR, SHARD_SERVERS,
+                                     nprobe=nprobe, ef_search=ef_search, metadata=metadata)
+    if TWO_STAGE:
+        # Only PQ/SQ codes in RAM; full vectors are read from disk for the K' candidates. Read-only
+        from rerank import load_two_stage
+        two_stage = load_two_stage(COARSE_INDEX_PATH, RERANK_CANDIDATES, nprobe,
+                                   timer=metrics.stage if METRICS_ENABLED else None)
+        return LiveIndex.from_two_stage(two_stage, IMAGE_PATHS_PATH, PHASHES_PATH, metadata=metadata)
+    index = LiveIndex.load(INDEX_PATH, IMAGE_PATHS_PATH, COSINE_INDEX_PATH, FEATURES_PATH,
+                           PHASHES_PATH, mmap=INDEX_MMAP, metadata=metadata)
+    set_search_params(index.index, nprobe=nprobe, ef_search=ef_search)
+    return index
+
+def load_patch_index():
+    from patches import PatchIndex
+    from embedding import EmbeddingMismatchError, check_compatible
+
+    # Tiles are matched against query tiles embedded by the index's model, so they must agree
+    meta, index_meta = load_meta(PATCH_INDEX_PATH), read_index_meta()
+    check_compatible(meta, index_meta.get("model"), what="patch index")
+    if meta.get("projection") != index_meta.get("projection"):
+        raise EmbeddingMismatchError("patch index was built with another projection than the main index")
+    return PatchIndex.load(PATCH_INDEX_PATH, mmap=INDEX_MMAP)
+
+def load_model(calibration_paths=()):
+    from embedding import load_embedder_for
+
+    # Same backbone, preprocessing and projection as the index; an index built by another
+    # embedding configuration raises EmbeddingMismatchError instead of serving wrong matches
+    return load_embedder_for(read_index_meta(), base_dir=BASE_DIR.parent, backend=EXTRACTOR_BACKEND,
+                             channels_last=CHANNELS_LAST, calibration_paths=calibration_paths)
+
+async def load_components():
+    async def index():
+        global live_index
+        live_index = await readiness.load("index", load_live_index)
+
+    async def model():
+        global embedder
+        calibration_paths = ()
+        if EXTRACTOR_BACKEND == "int8":
+            # int8 is calibrated on indexed artworks, so it waits for the index
+            try:
+                await index_task
+            except Exception:
+                readiness.fail("model", "index failed to load; int8 calibration needs it")
+                raise
+            calibration_paths = [str(BASE_DIR.parent / p) for p in live_index.image_paths if p is not None]
+        embedder = await readiness.load("model", load_model, calibration_paths)
+        batcher.model = embedder
+
+    async def patches():
+        global patch_index
+        patch_index = await readiness.load("patches", load_patch_index)
+
+    index_task = asyncio.create_task(index())
+    tasks = {"index": index_task, "model": model()}
+    if PATCH_MODE:
+        tasks["patches"] = patches()
+    for name, result in zip(tasks, await asyncio.gather(*tasks.values(), return_exceptions=True)):
+        if isinstance(result, Exception):
+            print(f"❌ Failed to load {name}: {result}")
+    if readiness.ready:
+        timings = ", ".join(f"{name} {c['seconds']}s" for name, c in readiness.components.items())
+        print(f"✅ Ready in {readiness.report()['uptime_seconds']:.1f}s ({timings})")
+
+def require_ready():
+    if not readiness.ready:
+        raise HTTPException(status_code=503, detail="Index or model still loading; see /ready",
+                            headers={"Retry-After": "5"})
+
+if METRICS_ENABLED:
+    @app.middleware("http")
+    async def record_request(request: Request, call_next):
+        """Count and time every request; with SERVER_TIMING=1, report its stages in a Server-Timing header"""
+        timings = []
+        token = request_timings.set(timings)
+        requests_in_flight.inc()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            elapsed = time.perf_counter() - start
+            requests_in_flight.dec()
+            request_timings.reset(token)
+            # Label by route template, not the raw path, so ids and unknown URLs don't add series
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            requests_total.inc(route=route, method=request.method, status=status)
+            request_duration.observe(elapsed, route=route, method=request.method)
+        if SERVER_TIMING:
+            response.headers["Server-Timing"] = server_timing(timings, elapsed)
+        return response
+
+# ========== Query Caches ==========
+# Keyed by the SHA-256 of the uploaded bytes. Results also depend on the search
+# parameters and are dropped whenever the live index changes; embeddings only
+# depend on the bytes, so changing k or use_cosine still skips the forward pass.
+result_cache = LRUCache(int(RESULT_CACHE_MB * 2**20))
+embedding_cache = LRUCache(int(EMBEDDING_CACHE_MB * 2**20))
+
+# How each detection query was answered, to see what share skipped the CNN
+query_paths = {"result_cache": 0, "embedding_cache": 0, "near_duplicate": 0, "cnn": 0}
+
+# ========== Concurrency ==========
+# CPU-bound work (PIL decode/encode, transforms, FAISS search) runs on a bounded
+# pool so the event loop keeps answering health checks and other requests.
+cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+detect_limit = asyncio.Semaphore(DETECT_CONCURRENCY)
+
+@asynccontextmanager
+async def detect_slot():
+    """Hold a detect_limit slot, counted by the detect_in_flight gauge"""
+    async with detect_limit:
+        detect_in_flight.inc()
+        try:
+            yield
+        finally:
+            detect_in_flight.dec()
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run a blocking function on the CPU pool, in the caller's context (for its stage timings)"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(cpu_pool, partial(context.run, fn, *args, **kwargs))
+
+async def run_stage(stage, fn, *args, **kwargs):
+    """run_cpu, timed as `stage`"""
+    with metrics.stage(stage):
+        return await run_cpu(fn, *args, **kwargs)
 
 # ========== Helper Functions ==========
-def extract_feature(img: Image.Image) -> np.ndarray:
-    """Extract feature vector from image using ResNet50"""
+async def extract_feature(img: Image.Image) -> np.ndarray:
+    """Extract feature vector from image with the index's embedding model, batched with concurrent requests"""
     try:
-        img_tensor = transform(img).unsqueeze(0)
-        with torch.no_grad():
-            vec = model(img_tensor).squeeze().numpy()
-        return np.expand_dims(vec.astype("float32"), axis=0)
+        img_tensor = await run_stage("transform", embedder.preprocess, img)
+        with metrics.stage("embed"):
+            return await batcher.submit(img_tensor)
     except Exception as e:
         raise ValueError(f"Feature extraction failed: {str(e)}")
 
-def cosine_similarity(query_vec, feature_matrix, top_k=3):
-    """Calculate cosine similarity between query vector and feature matrix"""
-    query_norm = query_vec / np.linalg.norm(query_vec)
-    sims = np.dot(feature_matrix, query_norm.T).flatten()
-    top_indices = np.argsort(sims)[-top_k:][::-1]
-    return top_indices, sims[top_indices]
+async def extract_tiles(img: Image.Image) -> np.ndarray:
+    """Embed the patch index's tile grid of an image; the batcher runs all tiles in one forward pass"""
+    from embedding import tile_crops
 
-def validate_image(file: UploadFile):
-    """Validate uploaded image file"""
+    tensors = await run_stage("transform", lambda: [embedder.preprocess(t) for t in tile_crops(img, patch_index.grids)])
+    with metrics.stage("embed"):
+        return np.concatenate(await asyncio.gather(*(batcher.submit(t) for t in tensors)))
+
+async def detect_partial(img: Image.Image, k: int, ids=None) -> list:
+    """Artworks a crop or collage was cut from: every query tile is searched in one call and voted per artwork"""
+    vectors = await extract_tiles(img)
+    hits = await run_stage("patch_search", lambda: patch_index.search(vectors, k, ids=ids))
+    with metrics.stage("resolve_paths"):
+        return [{"match": live_index.image_paths[a], **thumbnail_field(live_index.image_paths[a]),
+                 "score": score, "tiles_matched": votes}
+                for a, score, votes in hits
+                if a < len(live_index.image_paths) and live_index.image_paths[a] is not None]
+
+def thumbnail_url(path: str) -> str:
+    return f"/thumbnails/{THUMBNAIL_SIZE}/{quote(path)}?format={THUMBNAIL_FORMAT}"
+
+def thumbnail_field(path: str) -> dict:
+    return {"thumbnail": thumbnail_url(path)} if THUMBNAIL_URLS else {}
+
+def match_fields(paths: list) -> dict:
+    """"matches" of a response, plus a parallel "thumbnails" list of URLs unless THUMBNAIL_URLS=0"""
+    if not THUMBNAIL_URLS:
+        return {"matches": paths}
+    return {"matches": paths, "thumbnails": [thumbnail_url(path) for path in paths]}
+
+def parse_filter(value: Optional[str]) -> Optional[tuple]:
+    """'Cubism, Dada' -> ('Cubism', 'Dada'); None when the filter is not set"""
+    if value is None:
+        return None
+    return tuple(v.strip() for v in value.split(",") if v.strip())
+
+async def filter_ids(style: Optional[tuple], source: Optional[tuple]):
+    """Sorted ids of the artworks passing the filters, pushed down into every search; None when unfiltered"""
+    if style is None and source is None:
+        return None
+    return await run_stage("filter", live_index.metadata.ids, style=style, source=source)
+
+def decode_image(contents: bytes) -> Image.Image:
+    from embedding import load_image  # Already imported by the model loader
+
+    # Shared fast path: large JPEGs are decoded at reduced scale, exactly as at index time
+    return load_image(contents)
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Check the upload is an image and return its raw bytes"""
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
-    
+    with metrics.stage("upload_read"):
+        return await file.read()
+
+async def decode_upload(contents: bytes) -> Image.Image:
     try:
-        contents = file.file.read()
-        image = Image.open(BytesIO(contents)).convert("RGB")
-        return image
+        return await run_stage("decode", decode_image, contents)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid image file")
 
+async def validate_image(file: UploadFile):
+    """Validate uploaded image file"""
+    return await decode_upload(await read_upload(file))
+
 # ========== Endpoints ==========
 @app.post("/detect-art-theft/")
 async def detect_art_theft(
     file: UploadFile = File(..., description="Image file to check for similar artwork"),
-    use_cosine: bool = Form(False, description="Use cosine similarity instead of FAISS distance")
+    use_cosine: bool = Form(False, description="Use cosine similarity instead of FAISS distance"),
+    k: int = Form(3, ge=1, le=100, description="Number of matches to return"),
+    min_similarity: Optional[float] = Form(None, ge=-1.0, le=1.0, description="Drop cosine matches below this score"),
+    partial: bool = Form(False, description="Also look for crops and collages of artworks (PATCH_MODE=1)"),
+    style: Optional[str] = Form(None, description="Only match artworks of these styles (comma-separated)"),
+    source: Optional[str] = Form(None, description="Only match artworks from these sources (comma-separated)")
 ):
     """
     Detect similar artwork in the database
@@ -116,38 +395,358 @@ async def detect_art_theft(
     Parameters:
     - file: Uploaded image file
     - use_cosine: If True, uses cosine similarity instead of FAISS distance
+    - k: Number of matches to return
+    - min_similarity: Cosine similarity threshold (only with use_cosine=True)
+    - partial: Also match tiles of the upload against tiles of every artwork
+    - style / source: Restrict every match to these styles / sources (see /filters)
     
     Returns:
     - matches: List of similar image paths
+    - thumbnails: Thumbnail URL of each match (unless THUMBNAIL_URLS=0)
     - distances: List of distances (if use_cosine=False)
     - cosine_similarities: List of similarity scores (if use_cosine=True)
+    - hamming_distances / near_duplicate: Set instead when a near-exact copy was found by perceptual hash
+    - partial_matches: With partial=True, [{match, thumbnail, score, tiles_matched}] by share of matching tiles;
+      always present when requested, including on near-duplicate answers
     """
+    require_ready()
+    if partial and patch_index is None:
+        raise HTTPException(status_code=400, detail="Partial-copy detection needs PATCH_MODE=1 and a patch index")
     try:
-        # Validate and process uploaded image
-        image = validate_image(file)
-        query_feature = extract_feature(image)
-        
-        # Find similar images
-        if use_cosine:
-            top_indices, top_scores = cosine_similarity(query_feature[0], norm_features)
-            matches = [str(Path(image_paths[i]).relative_to(BASE_DIR.parent)) for i in top_indices]
-            return JSONResponse(content={
-                "matches": matches,
-                "cosine_similarities": [float(s) for s in top_scores]
-            })
-        else:
-            D, I = index.search(query_feature, k=3)
-            matches = [str(Path(image_paths[i]).relative_to(BASE_DIR.parent)) for i in I[0]]
-            return JSONResponse(content={
-                "matches": matches,
-                "distances": [float(d) for d in D[0]]
-            })
+        async with detect_slot():
+            contents = await read_upload(file)
+            digest = await run_stage("hash", lambda: hashlib.sha256(contents).hexdigest())
+            style, source = parse_filter(style), parse_filter(source)
+            result_key = (digest, use_cosine, k, min_similarity, partial, style, source)
+            cached = result_cache.get(result_key, version=live_index.version)
+            if cached is not None:
+                query_paths["result_cache"] += 1
+                return JSONResponse(content=cached)
+
+            # Validate and process uploaded image, unless this upload was embedded before
+            version = live_index.version
+            ids = await filter_ids(style, source)
+            image = None
+            query_feature = embedding_cache.get(digest)
+            if query_feature is not None:
+                query_paths["embedding_cache"] += 1
+            else:
+                image = await decode_upload(contents)
+
+                # Re-encodes, resizes and light edits of an indexed artwork: answer from the pHash table
+                if PHASH_PREFILTER:
+                    dups = await run_stage("phash", lambda: live_index.near_duplicates(phash(image), PHASH_MAX_DISTANCE,
+                                                                                         k, ids))
+                    if dups:
+                        query_paths["near_duplicate"] += 1
+                        content = {
+                            **match_fields([path for _, path, _ in dups]),
+                            "hamming_distances": [dist for _, _, dist in dups],
+                            "near_duplicate": True
+                        }
+                        if partial:  # Same response shape whichever path answered
+                            content["partial_matches"] = await detect_partial(image, k, ids)
+                        result_cache.put(result_key, content, len(json.dumps(content)), version=version)
+                        return JSONResponse(content=content)
+
+                query_paths["cnn"] += 1
+                query_feature = await extract_feature(image)
+                embedding_cache.put(digest, query_feature, query_feature.nbytes)
+            
+            # Find similar images
+            if use_cosine:
+                hits = await run_stage("search", live_index.cosine_search, query_feature[0], k, min_similarity, ids)
+                with metrics.stage("resolve_paths"):
+                    matches = [path for _, path, _ in hits]
+                content = {
+                    **match_fields(matches),
+                    "cosine_similarities": [score for _, _, score in hits]
+                }
+            else:
+                hits = await run_stage("search", live_index.search, query_feature, k, ids)
+                with metrics.stage("resolve_paths"):
+                    matches = [path for _, path, _ in hits]
+                content = {
+                    **match_fields(matches),
+                    "distances": [dist for _, _, dist in hits]
+                }
+            if partial:
+                if image is None:
+                    image = await decode_upload(contents)
+                content["partial_matches"] = await detect_partial(image, k, ids)
+            result_cache.put(result_key, content, len(json.dumps(content)), version=version)
+            return JSONResponse(content=content)
             
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
+# ========== Batch Detection ==========
+def spool_batch(spool_dir, files, archive):
+    """Copy uploads (and zip members) to numbered files in `spool_dir`; returns [(name, path)].
+
+    The request's own upload files are closed once the endpoint returns, before
+    a streamed response is sent, so the batch is read from this copy instead.
+    Zip members are extracted under numbered names, never their own paths.
+    """
+    items = []
+    def add(name, source):
+        if len(items) >= BATCH_MAX_IMAGES:
+            raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_IMAGES} images per batch")
+        path = os.path.join(spool_dir, str(len(items)))
+        with open(path, "wb") as f:
+            shutil.copyfileobj(source, f)
+        items.append((name, path))
+
+    for upload in files:
+        upload.file.seek(0)
+        add(upload.filename, upload.file)
+    if archive is not None:
+        archive.file.seek(0)
+        with zipfile.ZipFile(archive.file) as zf:
+            for member in zf.infolist():
+                if member.is_dir() or not member.filename.lower().endswith(IMAGE_SUFFIXES):
+                    continue
+                with zf.open(member) as source:
+                    add(member.filename, source)
+    return items
+
+def load_batch_item(path):
+    """(sha256, decoded image) of a spooled batch file"""
+    with open(path, "rb") as f:
+        contents = f.read()
+    return hashlib.sha256(contents).hexdigest(), decode_image(contents)
+
+async def detect_chunk(chunk, use_cosine, k, min_similarity, ids=None):
+    """Decode a chunk in parallel, embed it in batches and search it with one FAISS call.
+
+    Returns one response dict per item, in order.
+    """
+    loaded = await asyncio.gather(*(run_stage("decode", load_batch_item, path) for _, path in chunk),
+                                  return_exceptions=True)
+    results = [None] * len(chunk)
+    pending = []  # (position, digest, image) still needing an embedding
+    vectors = {}
+    for position, item in enumerate(loaded):
+        if isinstance(item, Exception):
+            results[position] = {"error": "Invalid image file"}
+            continue
+        digest, image = item
+        cached = embedding_cache.get(digest)
+        if cached is not None:
+            query_paths["embedding_cache"] += 1
+            vectors[position] = cached
+            continue
+        if PHASH_PREFILTER:
+            dups = await run_stage("phash", lambda: live_index.near_duplicates(phash(image), PHASH_MAX_DISTANCE,
+                                                                                 k, ids))
+            if dups:
+                query_paths["near_duplicate"] += 1
+                results[position] = {
+                    **match_fields([path for _, path, _ in dups]),
+                    "hamming_distances": [dist for _, _, dist in dups],
+                    "near_duplicate": True
+                }
+                continue
+        pending.append((position, digest, image))
+
+    # Concurrent submissions are coalesced into batched forward passes by the batcher
+    query_paths["cnn"] += len(pending)
+    embedded = await asyncio.gather(*(extract_feature(image) for _, _, image in pending),
+                                    return_exceptions=True)
+    for (position, digest, _), feature in zip(pending, embedded):
+        if isinstance(feature, Exception):
+            results[position] = {"error": str(feature)}
+            continue
+        embedding_cache.put(digest, feature, feature.nbytes)
+        vectors[position] = feature
+
+    if vectors:
+        positions = sorted(vectors)
+        queries = np.concatenate([vectors[p] for p in positions])
+        if use_cosine:
+            hits = await run_stage("search", live_index.cosine_search_batch, queries, k, min_similarity, ids)
+            score_key = "cosine_similarities"
+        else:
+            hits = await run_stage("search", live_index.search_batch, queries, k, ids)
+            score_key = "distances"
+        for position, row in zip(positions, hits):
+            results[position] = {
+                **match_fields([path for _, path, _ in row]),
+                score_key: [score for _, _, score in row]
+            }
+    return results
+
+async def stream_batch(items, spool_dir, use_cosine, k, min_similarity, style=None, source=None):
+    """NDJSON lines, one per image in upload order, then a summary line"""
+    errors = 0
+    try:
+        ids = await filter_ids(style, source)  # Once per request, shared by every chunk
+        for start in range(0, len(items), BATCH_CHUNK):
+            chunk = items[start:start + BATCH_CHUNK]
+            async with detect_slot():
+                results = await detect_chunk(chunk, use_cosine, k, min_similarity, ids)
+            for offset, ((name, _), result) in enumerate(zip(chunk, results)):
+                errors += "error" in result
+                yield json.dumps({"index": start + offset, "filename": name, **result}) + "\n"
+        yield json.dumps({"done": True, "images": len(items), "errors": errors}) + "\n"
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+@app.post("/detect-art-theft/batch/")
+async def detect_art_theft_batch(
+    files: List[UploadFile] = File(None, description="Image files to check"),
+    archive: Optional[UploadFile] = File(None, description="Zip archive of images to check"),
+    use_cosine: bool = Form(False, description="Use cosine similarity instead of FAISS distance"),
+    k: int = Form(3, ge=1, le=100, description="Number of matches to return per image"),
+    min_similarity: Optional[float] = Form(None, ge=-1.0, le=1.0, description="Drop cosine matches below this score"),
+    style: Optional[str] = Form(None, description="Only match artworks of these styles (comma-separated)"),
+    source: Optional[str] = Form(None, description="Only match artworks from these sources (comma-separated)")
+):
+    """
+    Detect similar artwork for many images at once
+    
+    Images are decoded in parallel, embedded in batches and searched BATCH_CHUNK
+    at a time with one index search per chunk.
+    
+    Returns:
+    - application/x-ndjson stream: one line per image with index, filename and
+      the same fields as /detect-art-theft/ (or error), then {"done": true, ...}
+    """
+    require_ready()
+    if not files and archive is None:
+        raise HTTPException(status_code=400, detail="Upload image files and/or a zip archive")
+    spool_dir = tempfile.mkdtemp(prefix="batch_")
+    try:
+        items = await run_cpu(spool_batch, spool_dir, files or [], archive)
+    except HTTPException:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        raise
+    except zipfile.BadZipFile:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+    if not items:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="No images found in upload")
+    return StreamingResponse(stream_batch(items, spool_dir, use_cosine, k, min_similarity,
+                                          parse_filter(style), parse_filter(source)),
+                             media_type="application/x-ndjson")
+
+# ========== Artwork Registration Endpoints ==========
+@app.post("/artworks/")
+async def add_artwork(file: UploadFile = File(..., description="Artwork image to register")):
+    """
+    Register a new artwork so it is matched by detection immediately
+    
+    Returns:
+    - id: Artwork id, used to delete it later
+    - path: Stored image path
+    """
+    require_ready()
+    if live_index.read_only:
+        raise HTTPException(status_code=409, detail="Index is read-only (INDEX_MMAP=1, sharded or TWO_STAGE=1)")
+    try:
+        async with detect_slot():
+            contents = await read_upload(file)
+            digest = await run_stage("hash", lambda: hashlib.sha256(contents).hexdigest())
+            image = await decode_upload(contents)
+            query_feature = await extract_feature(image)
+
+            # Store the upload as sent: `image` may be a reduced-scale decode
+            suffix = Path(file.filename or "").suffix.lower() or ".png"
+            stored_path = ART_DIR / f"{uuid.uuid4().hex}{suffix}"
+            await run_cpu(stored_path.write_bytes, contents)
+            path = stored_path.relative_to(BASE_DIR.parent).as_posix()
+
+            artwork_id = await run_cpu(lambda: live_index.add(query_feature[0], path, phash(image),
+                                                              sha256=digest))
+            if patch_index is not None:
+                tiles = await extract_tiles(image)
+                await run_cpu(patch_index.add, artwork_id, tiles)
+        return {"id": artwork_id, "path": path}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
+
+@app.delete("/artworks/{artwork_id}")
+async def delete_artwork(artwork_id: int):
+    """Remove an artwork from the index; the image file itself is kept"""
+    require_ready()
+    try:
+        path = await run_cpu(live_index.remove, artwork_id)
+        if path is not None and patch_index is not None:
+            await run_cpu(patch_index.remove, artwork_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=f"Index does not support removal: {str(e)}")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artwork not found")
+    return {"id": artwork_id, "removed": True}
+
+# ========== Periodic Snapshots ==========
+async def snapshot_loop():
+    """Persist live index changes every SNAPSHOT_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        if live_index is None:
+            continue
+        try:
+            if await asyncio.to_thread(live_index.snapshot, INDEX_PATH, IMAGE_PATHS_PATH,
+                                         COSINE_INDEX_PATH, PHASHES_PATH, PATHS_ROOT):
+                print(f"💾 Snapshot written ({len(live_index)} artworks)")
+            if patch_index is not None:
+                await asyncio.to_thread(patch_index.snapshot, PATCH_INDEX_PATH)
+        except Exception as e:
+            print(f"⚠️ Snapshot failed: {e}")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.loading_task = asyncio.create_task(load_components())
+    batcher.start()
+    app.state.sd_pool = SDPool(SD_BACKENDS, max_concurrency=GENERATE_CONCURRENCY, max_queue=SD_MAX_QUEUE,
+                               queue_timeout=SD_QUEUE_TIMEOUT, timeout=SD_TIMEOUT, retries=SD_RETRIES)
+    app.state.jobs = JobManager(app.state.sd_pool, finish_generation(OUTPUT_FORMAT), result_ttl=JOB_RESULT_TTL,
+                                progress_interval=JOB_PROGRESS_INTERVAL)
+    app.state.jobs.start()
+    app.state.snapshot_task = asyncio.create_task(snapshot_loop())
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await batcher.stop()
+    await app.state.jobs.stop()
+    await app.state.sd_pool.aclose()
+    app.state.snapshot_task.cancel()
+    if live_index is not None:
+        live_index.snapshot(INDEX_PATH, IMAGE_PATHS_PATH, COSINE_INDEX_PATH, PHASHES_PATH, PATHS_ROOT)
+    if patch_index is not None:
+        patch_index.snapshot(PATCH_INDEX_PATH)
+
+@app.get("/thumbnails/{size}/{image_path:path}")
+async def get_thumbnail(request: Request, size: int, image_path: str, format: str = THUMBNAIL_FORMAT):
+    """
+    Downscaled WebP/JPEG derivative of an art image, made once and cached on disk
+
+    Sizes are 128, 256 and 512 (longest side). Responses carry a strong ETag
+    and Cache-Control; a matching If-None-Match answers 304 from a stat() alone.
+    """
+    try:
+        etag = await run_cpu(thumbnail_cache.etag, image_path, size, format)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={THUMBNAIL_MAX_AGE}"}
+        if thumbnail_cache.not_modified(etag, request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        # Made in the CPU pool; concurrent requests for a missing thumbnail wait for one generation
+        path, etag = await run_stage("thumbnail", thumbnail_cache.get, image_path, size, format)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to make thumbnail: {str(e)}")
+    headers["ETag"] = f'"{etag}"'
+    return FileResponse(path, media_type=THUMBNAIL_FORMATS[format], headers=headers)
+
 @app.get("/art-image/{image_path:path}")
 async def get_art_image(image_path: str):
     """Serve art images from the database"""
@@ -160,14 +759,57 @@ async def get_art_image(image_path: str):
         raise HTTPException(status_code=500, detail=f"Failed to retrieve image: {str(e)}")
 
 # ========== Image Generation Endpoint ==========
-SD_API = "http://127.0.0.1:7860/sdapi/v1"
+def watermark_output(output_image_b64: str, output_format: str):
+    """Decode the Stable Diffusion output, watermark it and encode it"""
+    return process_generated(output_image_b64, output_format, png_compress_level=PNG_COMPRESS_LEVEL,
+                             quality=OUTPUT_QUALITY, timer=metrics.stage if METRICS_ENABLED else None)
+
+def check_output_format(output_format: Optional[str]) -> str:
+    output_format = (output_format or OUTPUT_FORMAT).lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"output_format must be one of {list(OUTPUT_FORMATS)}")
+    return output_format
+
+def build_sd_payload(image_data: bytes, prompt: Optional[str], denoising_strength: float, steps: int) -> dict:
+    """img2img + ControlNet scribble payload for an uploaded sketch"""
+    encoded_image = base64.b64encode(image_data).decode("utf-8")
+    control_image = f"data:image/png;base64,{encoded_image}"
+
+    # Prepare payload for Stable Diffusion
+    payload = {
+        "init_images": [control_image],
+        "steps": steps,
+        "denoising_strength": denoising_strength,
+        "alwayson_scripts": {
+            "controlnet": {
+                "args": [{
+                    "enabled": True,
+                    "input_image": control_image,
+                    "module": "invert",
+                    "model": "control_v11p_sd15_scribble [d4ba51ff]",
+                    "weight": 1.0,
+                    "resize_mode": "Crop and Resize",
+                    "guidance": 1.0,
+                    "control_mode": "Balanced",
+                    "pixel_perfect": True,
+                    "control_guidance_start": 0,
+                    "control_guidance_end": 1
+                }]
+            }
+        }
+    }
+
+    if prompt and prompt.strip():
+        payload["prompt"] = prompt.strip()
+    return payload
 
 @app.post("/generate-image/")
 async def generate_image(
     prompt: Optional[str] = Form(None),
     image: UploadFile = File(...),
     denoising_strength: float = Form(0.75, ge=0.1, le=1.0),
-    steps: int = Form(20, ge=1, le=150)
+    steps: int = Form(20, ge=1, le=150),
+    output_format: Optional[str] = Form(None, description="png, webp or jpeg")
 ):
     """
     Generate an image from a sketch using Stable Diffusion
@@ -177,81 +819,33 @@ async def generate_image(
     - image: Uploaded sketch image
     - denoising_strength: Control how much the image changes (0.1-1.0)
     - steps: Number of diffusion steps
+    - output_format: png (default), webp or jpeg
     
     Returns:
-    - Generated image as PNG
+    - Generated image
     """
+    output_format = check_output_format(output_format)
     try:
         # Validate and encode image
-        image_data = await image.read()
-        encoded_image = base64.b64encode(image_data).decode("utf-8")
-        control_image = f"data:image/png;base64,{encoded_image}"
-
-        # Prepare payload for Stable Diffusion
-        payload = {
-            "init_images": [control_image],
-            "steps": steps,
-            "denoising_strength": denoising_strength,
-            "alwayson_scripts": {
-                "controlnet": {
-                    "args": [{
-                        "enabled": True,
-                        "input_image": control_image,
-                        "module": "invert",
-                        "model": "control_v11p_sd15_scribble [d4ba51ff]",
-                        "weight": 1.0,
-                        "resize_mode": "Crop and Resize",
-                        "guidance": 1.0,
-                        "control_mode": "Balanced",
-                        "pixel_perfect": True,
-                        "control_guidance_start": 0,
-                        "control_guidance_end": 1
-                    }]
-                }
-            }
-        }
-
-        if prompt and prompt.strip():
-            payload["prompt"] = prompt.strip()
+        with metrics.stage("upload_read"):
+            image_data = await image.read()
+        payload = build_sd_payload(image_data, prompt, denoising_strength, steps)
 
-        # Call Stable Diffusion API
-        response = requests.post(f"{SD_API}/img2img", json=payload)
-        response.raise_for_status()
-        result = response.json()
+        # Call Stable Diffusion API on the least-busy backend, queueing if all are busy
+        with metrics.stage("sd_roundtrip"):
+            result = await app.state.sd_pool.img2img(payload)
 
-        # Process and watermark the generated image
-        output_image_b64 = result["images"][0]
-        output_bytes = base64.b64decode(output_image_b64)
-        image = Image.open(BytesIO(output_bytes)).convert("RGBA")
-        
-        # Add watermark
-        watermark_layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(watermark_layer)
-        
-        try:
-            font = ImageFont.truetype("arial.ttf", 36)
-        except IOError:
-            font = ImageFont.load_default()
-        
-        watermark_text = "© AI Generated"
-        text_bbox = draw.textbbox((0, 0), watermark_text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
+        # Process and watermark the generated image on the CPU pool
+        data, media_type = await run_cpu(watermark_output, result["images"][0], output_format)
         
-        x = image.width - text_width - 10
-        y = image.height - text_height - 10
-        draw.text((x, y), watermark_text, font=font, fill=(255, 255, 255, 128))
-        
-        watermarked_image = Image.alpha_composite(image, watermark_layer)
-        
-        # Return the image
-        buffer = BytesIO()
-        watermarked_image.convert("RGB").save(buffer, format="PNG")
-        buffer.seek(0)
-        
-        return StreamingResponse(buffer, media_type="image/png")
+        return Response(content=data, media_type=media_type)
 
-    except requests.RequestException as e:
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=f"Generation queue is full: {str(e)}",
+                            headers={"Retry-After": "10"})
+    except BackendUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Stable Diffusion API error: {str(e)}"
@@ -262,12 +856,192 @@ async def generate_image(
             detail=f"Image generation failed: {str(e)}"
         )
 
+# ========== Generation Jobs ==========
+def finish_generation(output_format: str):
+    """Job finisher: watermark and encode off the event loop"""
+    async def finish(output_image_b64: str):
+        return await run_cpu(watermark_output, output_image_b64, output_format)
+    return finish
+
+def get_job(job_id: str):
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@app.post("/generate-jobs/", status_code=202)
+async def submit_generation_job(
+    prompt: Optional[str] = Form(None),
+    image: UploadFile = File(...),
+    denoising_strength: float = Form(0.75, ge=0.1, le=1.0),
+    steps: int = Form(20, ge=1, le=150),
+    output_format: Optional[str] = Form(None, description="png, webp or jpeg")
+):
+    """
+    Queue a sketch-to-image generation and return immediately
+    
+    Returns:
+    - job_id: Id to poll, stream and fetch the result with
+    - status_url / events_url / result_url: Where to follow the job
+    """
+    output_format = check_output_format(output_format)
+    image_data = await image.read()
+    payload = build_sd_payload(image_data, prompt, denoising_strength, steps)
+    try:
+        job = app.state.jobs.submit("/sdapi/v1/img2img", payload, finish_generation(output_format))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=f"Generation queue is full: {str(e)}",
+                            headers={"Retry-After": "10"})
+    except BackendUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {
+        "job_id": job.id,
+        "status_url": f"/generate-jobs/{job.id}",
+        "events_url": f"/generate-jobs/{job.id}/events",
+        "result_url": f"/generate-jobs/{job.id}/result",
+    }
+
+@app.get("/generate-jobs/{job_id}")
+async def generation_job_status(job_id: str):
+    """Queue position, step progress and state of a generation job"""
+    return app.state.jobs.status(get_job(job_id))
+
+@app.get("/generate-jobs/{job_id}/events")
+async def generation_job_events(job_id: str):
+    """Server-Sent Events stream of job status until it finishes"""
+    job = get_job(job_id)
+
+    async def events():
+        while True:
+            status = app.state.jobs.status(job)
+            yield f"data: {json.dumps(status)}\n\n"
+            if status["state"] in ("done", "failed", "cancelled"):
+                return
+            await asyncio.sleep(JOB_EVENT_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/generate-jobs/{job_id}/result")
+async def generation_job_result(job_id: str):
+    """Fetch the finished, watermarked image; it can be fetched once"""
+    job = get_job(job_id)
+    if job.state == "failed":
+        raise HTTPException(status_code=502, detail=f"Generation failed: {job.error}")
+    if job.state != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.state}")
+    result = app.state.jobs.take_result(job)
+    if result is None:
+        raise HTTPException(status_code=410, detail="Result was already fetched")
+    data, media_type = result
+    return Response(content=data, media_type=media_type)
+
+# ========== Stats ==========
+@app.get("/stats")
+async def stats():
+    """Inference batching and Stable Diffusion queue statistics"""
+    total_queries = sum(query_paths.values())
+    return {
+        "extractor": embedder.name if embedder else None,
+        "two_stage": two_stage.stats() if two_stage else None,
+        "thumbnails": thumbnail_cache.stats(),
+        "patch_index": {"artworks": len(patch_index), "tiles": patch_index.index.ntotal,
+                        "grids": patch_index.grids} if patch_index else None,
+        "batcher": batcher.stats(),
+        "result_cache": result_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "detection_queries": {
+            **query_paths,
+            "cnn_skip_rate": 1 - query_paths["cnn"] / total_queries if total_queries else 0.0,
+        },
+        "stable_diffusion": app.state.sd_pool.stats(),
+        "generation_jobs": app.state.jobs.stats(),
+    }
+
+@app.get("/filters")
+async def filters():
+    """Styles and sources detection can be restricted to, with their artwork counts"""
+    require_ready()
+    metadata = live_index.metadata
+    return {"style": await run_cpu(metadata.values, "style"), "source": await run_cpu(metadata.values, "source")}
+
+# ========== Metrics ==========
+def family(kind, name, help, values, labels=()):
+    """Scrape-time Gauge or Counter family from {label values tuple (or ()): value}"""
+    metric = kind(name, help, labels)
+    metric.values.update(values)
+    return metric
+
+@metrics.collector
+def collect_state():
+    caches = {"result": result_cache.stats(), "embedding": embedding_cache.stats()}
+    batches = batcher.stats()
+    sd = app.state.sd_pool.stats()
+    loaded = live_index is not None
+    thumbnails = thumbnail_cache.stats()
+    return [
+        family(Gauge, "index_vectors", "Vectors in the search index", {(): len(live_index) if loaded else 0}),
+        family(Gauge, "patch_index_tiles", "Tiles in the partial-copy patch index",
+               {(): patch_index.index.ntotal if patch_index is not None else 0}),
+        family(Gauge, "index_read_only", "1 when the index is mmapped, sharded or two-stage",
+               {(): int(live_index.read_only) if loaded else 0}),
+        family(Gauge, "component_ready", "1 once a startup component has loaded",
+               {(name,): int(c["state"] == "ready") for name, c in readiness.components.items()}, ["component"]),
+        family(Gauge, "component_load_seconds", "How long a startup component took to load",
+               {(name,): c["seconds"] for name, c in readiness.components.items() if c["seconds"] is not None},
+               ["component"]),
+        *(family(Gauge, f"cache_{field}", f"Query cache {field}",
+                 {(cache,): stats[field] for cache, stats in caches.items()}, ["cache"])
+          for field in ("entries", "bytes")),
+        *(family(Counter, f"cache_{field}_total", f"Query cache {field}",
+                 {(cache,): stats[field] for cache, stats in caches.items()}, ["cache"])
+          for field in ("hits", "misses", "evictions", "invalidations")),
+        family(Counter, "thumbnails_total", "Thumbnail requests by how they were answered",
+               {(result,): thumbnails[result] for result in ("generated", "hits", "revalidated")}, ["result"]),
+        family(Counter, "detection_queries_total", "Detection queries by how they were answered",
+               {(path,): count for path, count in query_paths.items()}, ["path"]),
+        family(Gauge, "batcher_queue_depth", "Images waiting for a forward pass", {(): batches["queue_depth"]}),
+        family(Counter, "batcher_batches_total", "Forward passes run", {(): batches["batches"]}),
+        family(Counter, "batcher_items_total", "Images embedded by forward passes", {(): batches["items"]}),
+        family(Gauge, "sd_queue_depth", "Generations waiting for a Stable Diffusion backend", {(): sd["queue_depth"]}),
+        family(Gauge, "sd_in_flight", "Generations running per Stable Diffusion backend",
+               {(b["url"],): b["in_flight"] for b in sd["backends"]}, ["backend"]),
+        family(Gauge, "sd_available", "1 while a Stable Diffusion backend is considered up",
+               {(b["url"],): int(b["available"]) for b in sd["backends"]}, ["backend"]),
+        family(Gauge, "generation_jobs", "Generation jobs by state",
+               {(state,): count for state, count in app.state.jobs.stats()["by_state"].items()}, ["state"]),
+    ]
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text-format metrics: request counters and durations, per-stage timing
+    histograms, in-flight gauges, index size and cache statistics"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=0)")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+if PROFILE_ENDPOINT:
+    @app.get("/debug/profile")
+    async def profile(seconds: float = 10.0, interval_ms: float = 5.0, cpu_only: bool = False):
+        """Sample all threads' Python stacks for `seconds` and return collapsed stacks,
+        ready for flamegraph.pl or speedscope; cpu_only keeps just the CPU pool threads"""
+        if not 0 < seconds <= 60:
+            raise HTTPException(status_code=400, detail="seconds must be in (0, 60]")
+        stacks = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000,
+                                         "cpu" if cpu_only else None)
+        return PlainTextResponse(stacks)
+
 # ========== Health Check ==========
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness: the process is up and serving, whether or not the index and model have loaded"""
     return {"status": "healthy", "message": "Art theft detection service is running"}
 
+@app.get("/ready")
+async def ready_check():
+    """Readiness: 200 once the index and model are loaded, else 503; reports each component's state and load time"""
+    return JSONResponse(content=readiness.report(), status_code=200 if readiness.ready else 503)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,139 @@
+import time
+import uuid
+import asyncio
+
+
+class Job:
+    """One queued or running Stable Diffusion generation"""
+
+    def __init__(self, waiter, finish):
+        self.id = uuid.uuid4().hex
+        self.finish = finish
+        self.state = "queued"
+        self.waiter = waiter
+        self.backend = None
+        self.progress = 0.0
+        self.sampling_step = 0
+        self.sampling_steps = 0
+        self.eta = None
+        self.error = None
+        self.result = None
+        self.result_fetched = False
+        self.created = time.time()
+        self.finished = None
+        self.task = None
+
+
+class JobManager:
+    """Runs generations in the background and tracks their progress.
+
+    `submit` reserves a slot in the SD pool's FIFO queue up front, so a full
+    queue is rejected before a job id is handed out. While a job runs, the
+    backend's /sdapi/v1/progress endpoint is polled for step progress. The
+    finished image is produced by the awaitable `finish(image_b64)` (decode,
+    watermark, encode) and kept for `result_ttl` seconds or until fetched once.
+    """
+
+    def __init__(self, pool, finish, result_ttl=300.0, progress_interval=1.0):
+        self.pool = pool
+        self.finish = finish
+        self.result_ttl = result_ttl
+        self.progress_interval = progress_interval
+        self.jobs = {}
+        self.cleanup_task = None
+
+    # ========== Lifecycle ==========
+    def start(self):
+        self.cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self):
+        if self.cleanup_task:
+            self.cleanup_task.cancel()
+        for job in self.jobs.values():
+            if job.task and not job.task.done():
+                job.task.cancel()
+
+    # ========== Jobs ==========
+    def submit(self, path, payload, finish=None):
+        """Queue a generation; raises QueueFullError/BackendUnavailableError when rejected"""
+        job = Job(self.pool.enqueue(), finish or self.finish)
+        job.task = asyncio.create_task(self._run(job, path, payload))
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def status(self, job):
+        position = self.pool.queue_position(job.waiter) if job.state == "queued" else None
+        return {
+            "job_id": job.id,
+            "state": job.state,
+            "queue_position": position,
+            "progress": job.progress,
+            "sampling_step": job.sampling_step,
+            "sampling_steps": job.sampling_steps,
+            "eta_seconds": job.eta,
+            "error": job.error,
+            "result_available": job.state == "done" and not job.result_fetched,
+        }
+
+    def take_result(self, job):
+        """Hand out the finished image once; later calls return None"""
+        result, job.result = job.result, None
+        if result is not None:
+            job.result_fetched = True
+        return result
+
+    async def _run(self, job, path, payload):
+        try:
+            backend = await self.pool.acquire(job.waiter)
+        except asyncio.CancelledError:
+            job.state, job.finished = "cancelled", time.time()
+            raise
+        except Exception as e:  # BackendUnavailableError after waiting queue_timeout
+            job.state, job.error, job.finished = "failed", str(e), time.time()
+            return
+        job.state, job.backend = "running", backend
+        poller = asyncio.create_task(self._poll_progress(job))
+        try:
+            result = await backend.post(path, payload)
+            job.result = await job.finish(result["images"][0])
+            job.state, job.progress = "done", 1.0
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            raise
+        except Exception as e:
+            job.state, job.error = "failed", str(e)
+        finally:
+            poller.cancel()
+            job.finished = time.time()
+            self.pool.release(backend)
+
+    async def _poll_progress(self, job):
+        """Proxy the WebUI's progress endpoint into the job while it runs"""
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                progress = await job.backend.get("/sdapi/v1/progress?skip_current_image=true")
+            except Exception:
+                continue
+            state = progress.get("state", {})
+            job.progress = float(progress.get("progress", 0.0))
+            job.eta = progress.get("eta_relative")
+            job.sampling_step = state.get("sampling_step", 0)
+            job.sampling_steps = state.get("sampling_steps", 0)
+
+    async def _cleanup_loop(self):
+        """Drop finished jobs (and their images) once they are older than result_ttl"""
+        while True:
+            await asyncio.sleep(min(self.result_ttl, 30))
+            cutoff = time.time() - self.result_ttl
+            for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished < cutoff]:
+                del self.jobs[job_id]
+
+    def stats(self):
+        states = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {"jobs": len(self.jobs), "by_state": states}
@@ -0,0 +1,242 @@
+import os
+import pickle
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import faiss
+
+from ann_index import build_cosine_index, read_index, search
+from feature_store import load_features
+from phash import MultiIndexHash
+from shards import open_shards
+from rwlock import ReadWriteLock
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class LiveIndex:
+    """L2 and cosine FAISS indexes plus the path table, mutable while serving.
+
+    Artwork ids are FAISS ids: both indexes are IndexIDMap2 so that removals
+    work, and `image_paths[id]` is None for removed artworks. Ids are never
+    reused, and `version` is bumped on every change so callers can invalidate
+    cached results. Cosine search is an inner-product index over normalized vectors,
+    so no separate feature matrix is kept in RAM. Searches share a
+    reader/writer lock and run concurrently; mutations take it exclusively
+    and briefly, embedding happens outside it, and snapshots copy under the
+    shared read lock, so searches keep running. Memory-mapped, sharded and two-stage indexes are read-only: add/remove
+    raise RuntimeError on them and searches take no lock at all. Perceptual
+    hashes of the artworks sit in a multi-index hash table for near-duplicate
+    lookups.
+    With a `metadata` store (metadata_store.MetadataStore) the paths come from
+    it, registrations and removals are written through to it, and every
+    search accepts `ids` from `metadata.ids(...)` to restrict its results.
+    """
+
+    def __init__(self, index, image_paths, cosine_index, features=None, read_only=False, phashes=None,
+                 metadata=None):
+        if isinstance(index, faiss.Index) and not isinstance(index, faiss.IndexIDMap2):
+            features = np.ascontiguousarray(features, dtype="float32")
+            base = faiss.clone_index(index)
+            base.reset()
+            index = faiss.IndexIDMap2(base)
+            index.add_with_ids(features, np.arange(len(features), dtype="int64"))
+
+        self.index = index
+        self.cosine_index = cosine_index
+        self.metadata = metadata
+        self.image_paths = metadata.paths() if metadata is not None else list(image_paths)
+        self.read_only = read_only
+        self.near_dups = MultiIndexHash()
+        if phashes is not None:
+            for artwork_id, h in enumerate(phashes[:len(self.image_paths)]):
+                if h and self.image_paths[artwork_id] is not None:
+                    self.near_dups.add(artwork_id, int(h))
+        self.version = 0
+        self.dirty = False
+        self.dirty_lock = threading.Lock()  # Snapshots test-and-clear `dirty` while sharing the read lock
+        self.lock = ReadWriteLock()
+
+    @classmethod
+    def load(cls, index_path, paths_path, cosine_path, features_path, phashes_path=None, mmap=False, metadata=None):
+        """Load saved state; the feature store is only read for legacy index files.
+
+        The independent files are read concurrently: FAISS and NumPy release the
+        GIL while reading, so startup takes about as long as the largest file.
+        """
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            index_future = pool.submit(read_index, index_path, mmap)
+            cosine_future = pool.submit(read_index, cosine_path, mmap) if os.path.exists(cosine_path) else None
+            paths_future = pool.submit(load_pickle, paths_path) if metadata is None else None
+            phashes_future = (pool.submit(np.load, phashes_path)
+                              if phashes_path and os.path.exists(phashes_path) else None)
+
+            index, mapped = index_future.result()
+            features = None
+            if cosine_future is None or not isinstance(index, faiss.IndexIDMap2):
+                features = load_features(features_path)
+            if cosine_future is not None:
+                cosine_index, cosine_mapped = cosine_future.result()
+                mapped = mapped or cosine_mapped
+            else:
+                cosine_index = build_cosine_index(features)
+            image_paths = paths_future.result() if paths_future else None
+            phashes = phashes_future.result() if phashes_future else None
+        return cls(index, image_paths, cosine_index, features, read_only=mapped, phashes=phashes, metadata=metadata)
+
+    @classmethod
+    def from_shards(cls, paths_path, phashes_path=None, shard_dir=None, servers=None, nprobe=None, ef_search=None,
+                    metadata=None):
+        """Read-only state searching local shard files or shard servers in parallel"""
+        l2, cosine_index = open_shards(shard_dir, servers, nprobe, ef_search)
+        image_paths = load_pickle(paths_path) if metadata is None else None
+        phashes = np.load(phashes_path) if phashes_path and os.path.exists(phashes_path) else None
+        return cls(l2, image_paths, cosine_index, read_only=True, phashes=phashes, metadata=metadata)
+
+    @classmethod
+    def from_two_stage(cls, two_stage, paths_path, phashes_path=None, metadata=None):
+        """Read-only state answering both metrics by coarse search plus exact re-rank (rerank.TwoStage).
+
+        Being read-only, its searches run without the lock, so the re-rank's
+        mmapped reads from disk never hold up concurrent queries.
+        """
+        image_paths = load_pickle(paths_path) if metadata is None else None
+        phashes = np.load(phashes_path) if phashes_path and os.path.exists(phashes_path) else None
+        return cls(two_stage.view("l2"), image_paths, two_stage.view("ip"), read_only=True, phashes=phashes,
+                   metadata=metadata)
+
+    # ========== Queries ==========
+    def reading(self):
+        """Lock held by searches: none for read-only state, which nothing mutates.
+
+        Sharded searches wait on shard RPCs, so one slow shard would otherwise
+        hold up every other query behind a waiting writer.
+        """
+        return nullcontext() if self.read_only else self.lock.read()
+
+    def search(self, query, k, ids=None):
+        """L2 search; returns [(id, path, distance)]"""
+        return self.search_batch(query, k, ids)[0]
+
+    def search_batch(self, queries, k, ids=None):
+        """L2 search of stacked queries in one FAISS call; one hit list per row"""
+        queries = np.atleast_2d(np.ascontiguousarray(queries, dtype="float32"))
+        with self.reading():
+            D, I = search(self.index, queries, k, ids)
+            return [[(int(i), self.image_paths[i], float(d)) for i, d in zip(ids, dists) if i >= 0]
+                    for ids, dists in zip(I, D)]
+
+    def cosine_search(self, query, k, min_similarity=None, ids=None):
+        """Cosine search; returns [(id, path, similarity)] at or above `min_similarity`"""
+        return self.cosine_search_batch(query, k, min_similarity, ids)[0]
+
+    def cosine_search_batch(self, queries, k, min_similarity=None, ids=None):
+        """Cosine search of stacked queries in one FAISS call; one hit list per row"""
+        queries = np.atleast_2d(np.array(queries, dtype="float32"))
+        faiss.normalize_L2(queries)
+        with self.reading():
+            S, I = search(self.cosine_index, queries, k, ids)
+            return [[(int(i), self.image_paths[i], float(s)) for i, s in zip(ids, sims)
+                     if i >= 0 and (min_similarity is None or s >= min_similarity)]
+                    for ids, sims in zip(I, S)]
+
+    def near_duplicates(self, h, max_distance, k, ids=None):
+        """Artworks whose pHash is within `max_distance` bits; returns [(id, path, distance)]"""
+        with self.reading():
+            hits = self.near_dups.search(h, max_distance)
+            if ids is not None:
+                hits = [hit for hit, keep in zip(hits, np.isin([i for _, i in hits], ids)) if keep]
+            hits = hits[:k]
+            return [(i, self.image_paths[i], d) for d, i in hits]
+
+    def __len__(self):
+        return self.index.ntotal
+
+    # ========== Mutations ==========
+    def add(self, vector, path, phash=None, **fields):
+        """Add one embedded artwork and return its new id; `fields` (source, sha256) go to the metadata store"""
+        if self.read_only:
+            raise RuntimeError("index is memory-mapped read-only")
+        vector = np.ascontiguousarray(vector, dtype="float32").reshape(1, -1)
+        normalized = vector.copy()
+        faiss.normalize_L2(normalized)
+        with self.lock.write():
+            new_id = len(self.image_paths)
+            ids = np.array([new_id], dtype="int64")
+            self.index.add_with_ids(vector, ids)
+            self.cosine_index.add_with_ids(normalized, ids)
+            self.image_paths.append(path)
+            if self.metadata is not None:
+                self.metadata.add(new_id, path, phash=phash, **fields)
+            if phash is not None:
+                self.near_dups.add(new_id, phash)
+            self.version += 1
+            self.dirty = True
+            return new_id
+
+    def remove(self, artwork_id):
+        """Remove an artwork; returns its path, or None if the id is unknown"""
+        if self.read_only:
+            raise RuntimeError("index is memory-mapped read-only")
+        with self.lock.write():
+            if not 0 <= artwork_id < len(self.image_paths) or self.image_paths[artwork_id] is None:
+                return None
+            ids = np.array([artwork_id], dtype="int64")
+            self.index.remove_ids(ids)
+            self.cosine_index.remove_ids(ids)
+            path = self.image_paths[artwork_id]
+            self.image_paths[artwork_id] = None
+            if self.metadata is not None:
+                self.metadata.remove(artwork_id)
+            self.near_dups.remove(artwork_id)
+            self.version += 1
+            self.dirty = True
+            return path
+
+    # ========== Persistence ==========
+    def snapshot(self, index_path, paths_path, cosine_path, phashes_path=None, paths_root=None):
+        """Write the current state to disk; returns False if nothing changed.
+
+        With `paths_root`, relative paths (from the metadata store) are written
+        to image_paths.pkl joined onto it, in the index builder's absolute format.
+        Serializing only needs the index not to change, so it shares the read
+        lock with searches; registrations and removals wait for the copy.
+        """
+        with self.lock.read():
+            with self.dirty_lock:
+                if not self.dirty:
+                    return False
+                self.dirty = False
+            index_bytes = faiss.serialize_index(self.index)
+            cosine_bytes = faiss.serialize_index(self.cosine_index)
+            image_paths = list(self.image_paths)
+            if paths_root is not None:
+                image_paths = [None if p is None else os.path.normpath(os.path.join(paths_root, p))
+                               for p in image_paths]
+            phashes = np.zeros(len(image_paths), dtype="uint64")
+            for artwork_id, h in self.near_dups.hashes.items():
+                phashes[artwork_id] = h
+
+        try:
+            _write_atomic(index_path, lambda f: f.write(index_bytes.tobytes()))
+            _write_atomic(cosine_path, lambda f: f.write(cosine_bytes.tobytes()))
+            _write_atomic(paths_path, lambda f: pickle.dump(image_paths, f))
+            if phashes_path:
+                _write_atomic(phashes_path, lambda f: np.save(f, phashes))
+        except Exception:
+            with self.dirty_lock:
+                self.dirty = True
+            raise
+        return True
+
+
+def _write_atomic(path, write):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
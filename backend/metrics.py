@@ -0,0 +1,220 @@
+import sys
+import time
+import threading
+import traceback
+from bisect import bisect_left
+from collections import Counter as Tally
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+# Seconds; covers a cached lookup (~0.1 ms) up to a slow Stable Diffusion round-trip
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Stage timings of the current request, for its Server-Timing header; None outside a timed request
+request_timings = ContextVar("request_timings", default=None)
+NO_STAGE = nullcontext()  # Shared by every stage while metrics are disabled
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Metric:
+    """One metric family in the Prometheus text format, with fixed label names"""
+
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(labels[n] for n in self.labels)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{format_labels(self.labels, key)} {value:.17g}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram; each label set keeps bucket counts, sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labels + ("le",)
+        with self.lock:
+            snapshot = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{format_labels(names, key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total:.17g}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class StageTimer:
+    """Times one stage into the stage histogram and the request's Server-Timing list"""
+
+    __slots__ = ("histogram", "name", "start")
+
+    def __init__(self, histogram, name):
+        self.histogram = histogram
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.histogram.observe(elapsed, stage=self.name)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+class Registry:
+    """Metric families plus scrape-time collectors, rendered for GET /metrics.
+
+    When disabled, `stage()` hands out one shared no-op context manager and
+    nothing is recorded, so instrumented code costs a function call per stage.
+    Collectors are called on every scrape and return metrics built from
+    current state (index size, cache counters...), so nothing is double-kept.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.metrics = []
+        self.collectors = []
+        self.stages = self.histogram("stage_duration_seconds", "Time spent per request stage", ["stage"])
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn):
+        """Register `fn() -> [Metric]`, called at scrape time; usable as a decorator"""
+        self.collectors.append(fn)
+        return fn
+
+    def stage(self, name):
+        """`with metrics.stage("decode"):` around sync code or awaits alike"""
+        if not self.enabled:
+            return NO_STAGE
+        return StageTimer(self.stages, name)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            try:
+                for metric in collect():
+                    lines.extend(metric.render())
+            except Exception as e:  # A broken collector must not take /metrics down
+                lines.append(f"# collector {getattr(collect, '__name__', collect)} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def server_timing(timings, total=None):
+    """Server-Timing header value; repeated stages (e.g. batched forwards) are summed"""
+    durations = {}
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0.0) + seconds
+    if total is not None:
+        durations["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items())
+
+
+# ========== Sampling Profiler ==========
+def sample_stacks(seconds=10.0, interval=0.005, thread_prefix=None):
+    """Sample every thread's Python stack for `seconds`; returns collapsed stacks.
+
+    Output is one "frame;frame;frame count" line per distinct stack, the input
+    format of flamegraph.pl and speedscope. Only threads whose name starts with
+    `thread_prefix` are sampled when given. Nothing runs between calls, so it
+    costs nothing unless someone is profiling.
+    """
+    me = threading.get_ident()
+    stacks = Tally()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            name = names.get(ident, str(ident))
+            if ident == me or (thread_prefix and not name.startswith(thread_prefix)):
+                continue
+            frames = [f"{f.name} ({f.filename.rsplit('/', 1)[-1]}:{f.lineno})"
+                      for f in traceback.extract_stack(frame)]
+            stacks[";".join([name] + frames)] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,43 @@
+import time
+import asyncio
+
+
+class Readiness:
+    """Load state and timing of the service's startup components.
+
+    Components load in worker threads after the server is already accepting
+    connections, so liveness probes answer immediately while `/ready` reports
+    each component as pending, loading, ready or failed until all are ready.
+    """
+
+    def __init__(self, names):
+        self.started = time.time()
+        self.components = {name: {"state": "pending", "seconds": None, "error": None} for name in names}
+
+    async def load(self, name, fn, *args):
+        """Run the blocking loader `fn(*args)` in a thread, recording state and duration"""
+        component = self.components[name]
+        component["state"] = "loading"
+        start = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            self.fail(name, str(e), time.perf_counter() - start)
+            raise
+        component.update(state="ready", seconds=round(time.perf_counter() - start, 3))
+        return result
+
+    def fail(self, name, error, seconds=None):
+        self.components[name].update(state="failed", error=error,
+                                     seconds=round(seconds, 3) if seconds is not None else None)
+
+    @property
+    def ready(self):
+        return all(c["state"] == "ready" for c in self.components.values())
+
+    def report(self):
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.time() - self.started, 3),
+            "components": self.components,
+        }
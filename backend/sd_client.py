@@ -0,0 +1,216 @@
+import time
+import asyncio
+from collections import deque
+
+import httpx
+
+
+class QueueFullError(Exception):
+    """Every backend is busy and the wait queue is at capacity"""
+
+
+class BackendUnavailableError(Exception):
+    """No Stable Diffusion backend is currently reachable"""
+
+
+class SDBackend:
+    """One Stable Diffusion WebUI, reached through a persistent connection pool"""
+
+    def __init__(self, base_url, max_concurrency=1, timeout=300.0, connect_timeout=5.0,
+                 retries=2, retry_backoff=0.5, cooldown=10.0):
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.cooldown = cooldown
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_concurrency + 2,
+                                max_keepalive_connections=max_concurrency + 2),
+        )
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.down_until = 0.0
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+    @property
+    def load(self):
+        return self.in_flight / self.max_concurrency
+
+    async def post(self, path, payload):
+        """POST JSON, retrying connection failures and 502/503/504 with backoff"""
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.post(path, json=payload)
+                if response.status_code not in (502, 503, 504) or attempt == self.retries:
+                    response.raise_for_status()
+                    self.completed += 1
+                    return response.json()
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt == self.retries:
+                    self.failed += 1
+                    self.down_until = time.monotonic() + self.cooldown
+                    raise
+            except httpx.HTTPError:
+                self.failed += 1
+                raise
+            await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+    async def get(self, path):
+        response = await self.client.get(path)
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self):
+        return {
+            "url": self.base_url,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "available": self.available,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+class SDPool:
+    """Routes generations to the least-busy backend through a bounded FIFO queue.
+
+    Each backend runs at most `max_concurrency` jobs. When all are busy,
+    callers wait in arrival order; once `max_queue` callers are waiting,
+    further requests fail fast with QueueFullError so the API can answer 429
+    instead of piling work onto a single-GPU WebUI. While every backend with
+    a free slot is cooling down after connection failures, a timer re-runs
+    dispatch when the first cooldown ends; a caller waiting longer than
+    `queue_timeout` gets BackendUnavailableError.
+    """
+
+    def __init__(self, urls, max_concurrency=1, max_queue=16, queue_timeout=300.0, **backend_options):
+        self.backends = [SDBackend(url, max_concurrency, **backend_options) for url in urls]
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiters = deque()
+        self.retry_timer = None  # Pending dispatch at the end of a backend cooldown
+
+    # ========== Scheduling ==========
+    def _pick(self):
+        """Least-loaded available backend with a free slot, or None"""
+        candidates = [b for b in self.backends if b.available and b.in_flight < b.max_concurrency]
+        return min(candidates, key=lambda b: b.load, default=None)
+
+    def enqueue(self):
+        """Reserve a backend slot; returns a future that resolves to the backend.
+
+        The future is already resolved when a slot is free. Raises
+        QueueFullError / BackendUnavailableError immediately, so callers can
+        reject work before accepting it.
+        """
+        if not any(b.available for b in self.backends):
+            raise BackendUnavailableError("All Stable Diffusion backends are down")
+        self._dispatch()  # Serve earlier waiters first, e.g. a backend just came back from cooldown
+        waiter = asyncio.get_running_loop().create_future()
+        backend = None if self.waiters else self._pick()
+        if backend is not None:
+            backend.in_flight += 1
+            waiter.set_result(backend)
+            return waiter
+        if len(self.waiters) >= self.max_queue:
+            raise QueueFullError(f"{len(self.waiters)} generations already queued")
+        self.waiters.append(waiter)
+        return waiter
+
+    async def acquire(self, waiter=None):
+        """Wait up to `queue_timeout` seconds for a backend slot in FIFO order"""
+        if waiter is None:
+            waiter = self.enqueue()
+        try:
+            return await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(waiter.result())  # Dispatched as the timeout fired
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            raise BackendUnavailableError(f"No Stable Diffusion backend was free within {self.queue_timeout:.0f}s")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(waiter.result())
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self, backend):
+        backend.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.waiters:
+            backend = self._pick()
+            if backend is None:
+                self._retry_after_cooldown()
+                return
+            waiter = self.waiters.popleft()
+            if waiter.done():
+                continue
+            backend.in_flight += 1
+            waiter.set_result(backend)
+
+    def _retry_after_cooldown(self):
+        """Dispatch again when the first cooled-down backend with a free slot comes back.
+
+        Busy backends dispatch from release(); a backend in cooldown with
+        nothing in flight never releases, so without this timer its queue
+        would wait forever.
+        """
+        now = time.monotonic()
+        cooling = [b.down_until - now for b in self.backends
+                   if not b.available and b.in_flight < b.max_concurrency]
+        if not cooling or (self.retry_timer is not None and not self.retry_timer.cancelled()):
+            return
+
+        def retry():
+            self.retry_timer = None
+            self._dispatch()
+
+        self.retry_timer = asyncio.get_running_loop().call_later(max(0.0, min(cooling)), retry)
+
+    def queue_position(self, waiter):
+        """0-based position of a waiting future in the FIFO queue, or None"""
+        try:
+            return self.waiters.index(waiter)
+        except ValueError:
+            return None
+
+    # ========== Requests ==========
+    async def post(self, path, payload):
+        """Run one request on the least-busy backend once a slot is free"""
+        backend = await self.acquire()
+        try:
+            return await backend.post(path, payload)
+        finally:
+            self.release(backend)
+
+    async def img2img(self, payload):
+        return await self.post("/sdapi/v1/img2img", payload)
+
+    async def txt2img(self, payload):
+        return await self.post("/sdapi/v1/txt2img", payload)
+
+    async def aclose(self):
+        if self.retry_timer is not None:
+            self.retry_timer.cancel()
+        for backend in self.backends:
+            await backend.aclose()
+
+    def stats(self):
+        return {
+            "queue_depth": len(self.waiters),
+            "max_queue": self.max_queue,
+            "backends": [b.stats() for b in self.backends],
+        }
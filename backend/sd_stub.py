@@ -0,0 +1,109 @@
+"""Minimal stand-in for the Stable Diffusion WebUI API, for local testing.
+
+Serves /sdapi/v1/img2img, /sdapi/v1/txt2img and /sdapi/v1/progress. Each
+generation sleeps for --delay seconds (one job at a time, like a single-GPU
+WebUI) and returns a solid-colour PNG the size of the init image.
+
+    python sd_stub.py --port 7861 --delay 2
+    SD_BACKENDS=http://127.0.0.1:7861,http://127.0.0.1:7862 uvicorn full2:app
+"""
+import io
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+
+class StubState:
+    def __init__(self, delay, steps, fail_rate):
+        self.delay = delay
+        self.steps = steps
+        self.fail_rate = fail_rate
+        self.gpu = threading.Lock()
+        self.started = None
+        self.waiting = 0
+
+
+def render(payload):
+    """Solid-colour PNG matching the init image size (512x512 for txt2img)"""
+    size = (payload.get("width", 512), payload.get("height", 512))
+    if payload.get("init_images"):
+        data = payload["init_images"][0].split(",", 1)[-1]
+        size = Image.open(io.BytesIO(base64.b64decode(data))).size
+    image = Image.new("RGB", size, tuple(random.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if self.path not in ("/sdapi/v1/img2img", "/sdapi/v1/txt2img"):
+                return self._send(404, {"detail": "Not Found"})
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if random.random() < state.fail_rate:
+                return self._send(503, {"detail": "Stub failure"})
+
+            state.waiting += 1
+            with state.gpu:
+                state.waiting -= 1
+                state.started = time.monotonic()
+                time.sleep(state.delay)
+                state.started = None
+            self._send(200, {"images": [render(payload)], "parameters": {}, "info": "{}"})
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/sdapi/v1/progress":
+                return self._send(404, {"detail": "Not Found"})
+            started = state.started
+            progress = 0.0
+            if started is not None:
+                progress = min(1.0, (time.monotonic() - started) / state.delay) if state.delay else 1.0
+            self._send(200, {
+                "progress": progress,
+                "eta_relative": max(0.0, state.delay * (1 - progress)) if started else 0.0,
+                "state": {
+                    "job_count": state.waiting + (started is not None),
+                    "sampling_step": int(progress * state.steps),
+                    "sampling_steps": state.steps,
+                },
+                "current_image": None,
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Stable Diffusion WebUI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--delay", type=float, default=2.0, help="Seconds per generation")
+    parser.add_argument("--steps", type=int, default=20, help="Sampling steps reported by /progress")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    state = StubState(args.delay, args.steps, args.fail_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"🧪 Stub SD API on http://{args.host}:{args.port} ({args.delay}s per image)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import io
+import binascii
+from functools import lru_cache
+from contextlib import nullcontext
+
+from PIL import Image, ImageDraw, ImageFont
+
+# ========== CONFIG ==========
+WATERMARK_TEXT = "© AI Generated"
+FONT_FILE = "arial.ttf"
+FONT_SIZE = 36
+MARGIN = 10  # Pixels from the bottom-right corner
+FILL = (255, 255, 255, 128)
+OUTPUT_FORMATS = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+# ========== Cached Rendering ==========
+@lru_cache(maxsize=8)
+def load_font(font_file=FONT_FILE, font_size=FONT_SIZE):
+    """Load the watermark font once per (file, size) instead of once per image"""
+    try:
+        return ImageFont.truetype(font_file, font_size)
+    except IOError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=64)
+def watermark_tile(text, font_size, resolution):
+    """Pre-rendered RGBA tile of the watermark text and the box it covers.
+
+    The tile is only as large as the text's bounding box and is positioned
+    exactly where drawing the text on a full-frame layer would put it, so
+    compositing just that box gives the same pixels as the full-frame version.
+    Returns (tile, (left, top, right, bottom)) clipped to `resolution`.
+    """
+    font = load_font(FONT_FILE, font_size)
+    width, height = resolution
+    probe = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    left, top, right, bottom = probe.textbbox((0, 0), text, font=font)
+
+    # Same anchor as the original full-layer code: text origin at (x, y)
+    x = width - (right - left) - MARGIN
+    y = height - (bottom - top) - MARGIN
+    tile = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+    ImageDraw.Draw(tile).text((-left, -top), text, font=font, fill=FILL)
+
+    box = (x + left, y + top, x + right, y + bottom)
+    clipped = (max(box[0], 0), max(box[1], 0), min(box[2], width), min(box[3], height))
+    tile = tile.crop((clipped[0] - box[0], clipped[1] - box[1],
+                      clipped[2] - box[0], clipped[3] - box[1]))
+    return tile, clipped
+
+
+# ========== Processing ==========
+def apply_watermark(image, text=WATERMARK_TEXT, font_size=FONT_SIZE):
+    """Composite the cached watermark onto `image` in place, touching only its bounding box"""
+    tile, box = watermark_tile(text, font_size, image.size)
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return image
+    region = image.crop(box).convert("RGBA")
+    region.alpha_composite(tile)
+    image.paste(region.convert(image.mode), box[:2])
+    return image
+
+
+def encode_image(image, output_format="png", png_compress_level=6, quality=90):
+    """Encode to PNG/WebP/JPEG; returns (bytes, media type)"""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format {output_format!r}, expected one of {list(OUTPUT_FORMATS)}")
+    buffer = io.BytesIO()
+    if output_format == "png":
+        image.save(buffer, format="PNG", compress_level=png_compress_level)
+    elif output_format == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue(), OUTPUT_FORMATS[output_format]
+
+
+def decode_generated(output_image_b64):
+    """RGB image from a base64 Stable Diffusion output"""
+    data = output_image_b64.split(",", 1)[-1]  # Tolerate data: URLs
+    image = Image.open(io.BytesIO(binascii.a2b_base64(data)))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def process_generated(output_image_b64, output_format="png", png_compress_level=6, quality=90,
+                      text=WATERMARK_TEXT, font_size=FONT_SIZE, timer=None):
+    """Decode a base64 Stable Diffusion output, watermark it and encode it.
+
+    `timer(name)`, if given, returns a context manager wrapped around each step.
+    """
+    timer = timer or (lambda name: nullcontext())
+    with timer("output_decode"):
+        image = decode_generated(output_image_b64)
+    with timer("watermark"):
+        apply_watermark(image, text, font_size)
+    with timer("encode"):
+        return encode_image(image, output_format, png_compress_level, quality)
@@ -0,0 +1,124 @@
+import os
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # For OpenMP issue on Windows
+
+import sys
+import json
+import time
+import pickle
+import argparse
+
+import faiss
+from torch.utils.data import DataLoader
+
+from ann_index import read_index, set_search_params
+from shards import open_shards, load_shard_meta
+from feature_store import load_meta
+from embedding import BACKENDS, load_embedder_for
+from u1 import BATCH_SIZE, NUM_WORKERS, PREFETCH_FACTOR, ArtworkDataset, collate_skip_errors
+
+# ========== CONFIG ==========
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+# ========== INPUT ==========
+def list_images(directory):
+    """Image files under `directory`, recursively, in a stable order"""
+    found = []
+    for root, _, names in os.walk(directory):
+        found.extend(os.path.join(root, name) for name in names if name.lower().endswith(IMAGE_SUFFIXES))
+    return sorted(found)
+
+def load_search_index(args):
+    """(index, image_paths, meta) to scan against: one FAISS file or a sharded set"""
+    with open(args.paths, "rb") as f:
+        image_paths = pickle.load(f)
+    meta = load_shard_meta(args.shard_dir) if args.shard_dir else load_meta(args.index)
+    if args.shard_dir or args.shard_servers:
+        l2, ip = open_shards(args.shard_dir, args.shard_servers, args.nprobe, args.ef_search)
+        return (ip if args.cosine else l2), image_paths, meta
+    index, _ = read_index(args.cosine_index if args.cosine else args.index, mmap=True)
+    set_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+    return index, image_paths, meta
+
+# ========== SCAN ==========
+def scan(paths, model, index, image_paths, out, k=3, cosine=False, min_similarity=None,
+         batch_size=BATCH_SIZE, num_workers=NUM_WORKERS):
+    """Embed `paths` in batches and search each batch with one index call.
+
+    Writes one JSON line per image as soon as its batch is searched; images that
+    fail to decode are reported at the end. Returns (scanned, failed).
+    """
+    loader = DataLoader(
+        ArtworkDataset(paths),
+        batch_size=batch_size,
+        num_workers=num_workers,
+        collate_fn=collate_skip_errors,
+        prefetch_factor=PREFETCH_FACTOR if num_workers > 0 else None,
+    )
+    score_key = "cosine_similarities" if cosine else "distances"
+    seen = set()
+    for batch in loader:
+        if batch is None:
+            continue
+        tensors, positions, _ = batch
+        queries = model(tensors)
+        if cosine:
+            faiss.normalize_L2(queries)
+        D, I = index.search(queries, k)
+        for position, ids, scores in zip(positions, I, D):
+            hits = [(int(i), float(s)) for i, s in zip(ids, scores) if i >= 0 and image_paths[i] is not None
+                    and (not cosine or min_similarity is None or s >= min_similarity)]
+            out.write(json.dumps({"file": paths[position],
+                                  "matches": [image_paths[i] for i, _ in hits],
+                                  score_key: [s for _, s in hits]}) + "\n")
+            seen.add(position)
+        out.flush()
+
+    failed = [path for position, path in enumerate(paths) if position not in seen]
+    for path in failed:
+        out.write(json.dumps({"file": path, "error": "Invalid image file"}) + "\n")
+    return len(seen), len(failed)
+
+# ========== MAIN ==========
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scan a directory of images for copies of indexed artwork (NDJSON out).")
+    parser.add_argument("directory", help="Folder of images to check, scanned recursively")
+    parser.add_argument("--out", default="-", help="NDJSON output file ('-' for stdout)")
+    parser.add_argument("--k", type=int, default=3, help="Matches per image")
+    parser.add_argument("--cosine", action="store_true", help="Rank by cosine similarity instead of L2 distance")
+    parser.add_argument("--min-similarity", type=float, default=None, help="Drop cosine matches below this score")
+    parser.add_argument("--index", default="art_index.faiss")
+    parser.add_argument("--cosine-index", default="cosine_index.faiss")
+    parser.add_argument("--paths", default="image_paths.pkl")
+    parser.add_argument("--shard-dir", default=None, help="Search shards built by u1.py --shards")
+    parser.add_argument("--shard-servers", nargs="*", default=None, help="host:port of shard_server.py processes")
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Feature extractor backend")
+    parser.add_argument("--channels-last", action="store_true", help="channels_last memory format (torch backends)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Decode/preprocess worker processes")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    paths = list_images(args.directory)
+    print(f"✅ Found {len(paths)} images.", file=sys.stderr)
+    index, image_paths, meta = load_search_index(args)
+    # Embed with the backbone and projection the index was built with; refuses foreign indexes
+    model = load_embedder_for(meta, backend=args.backend, channels_last=args.channels_last,
+                              calibration_paths=paths)
+
+    start = time.perf_counter()
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        scanned, failed = scan(paths, model, index, image_paths, out, args.k, args.cosine,
+                               args.min_similarity, args.batch_size, args.workers)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"⏱️ Scanned {scanned} images ({failed} failed) in {elapsed:.1f}s "
+          f"({scanned / max(elapsed, 1e-9):.1f} images/sec)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # For OpenMP issue on Windows
+
+import argparse
+import time
+import numpy as np
+import faiss
+
+from feature_store import FEATURES_FILE, load_features
+from ann_index import build_index, set_search_params, PQ_M, HNSW_M
+
+# ========== CONFIG ==========
+NUM_QUERIES = 500  # Held-out corpus vectors used as queries
+TOP_K = 10
+NPROBES = (1, 4, 8, 16, 32, 64, 128)
+EF_SEARCHES = (16, 32, 64, 128, 256)
+
+# ========== HELPERS ==========
+def recall_at_k(approx, exact, k):
+    """Mean fraction of the exact top-k found in the approximate top-k"""
+    hits = [len(set(a[:k]) & set(e[:k])) for a, e in zip(approx, exact)]
+    return np.mean(hits) / k
+
+def time_queries(index, queries, k):
+    """Search one query at a time, as the API does; returns (I, per-query ms)"""
+    results, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, I = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(I[0])
+    return np.array(results), np.array(latencies)
+
+def report(name, param, index, queries, exact, k, build_s):
+    approx, ms = time_queries(index, queries, k)
+    print(f"{name:<8} {param:<14} recall@{k}={recall_at_k(approx, exact, k):.3f}  "
+          f"p50={np.percentile(ms, 50):.2f}ms  p95={np.percentile(ms, 95):.2f}ms  "
+          f"qps={1000 / ms.mean():.0f}  build={build_s:.1f}s")
+
+# ========== CLI ==========
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recall@k and latency of ANN indexes against the exact flat index")
+    parser.add_argument("--features", default=FEATURES_FILE)
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--pq-m", type=int, default=PQ_M)
+    parser.add_argument("--hnsw-m", type=int, default=HNSW_M)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (1 mimics one API request)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    faiss.omp_set_num_threads(args.threads)
+
+    features = np.ascontiguousarray(load_features(args.features, mmap=False), dtype="float32")
+
+    # Hold the queries out of the corpus so nobody finds itself at distance 0
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(features))
+    queries, corpus = features[order[:args.queries]], features[order[args.queries:]]
+    print(f"📏 Corpus {corpus.shape}, {len(queries)} queries, k={args.k}")
+
+    start = time.perf_counter()
+    flat = build_index(corpus, "flat", with_ids=False)
+    build_s = time.perf_counter() - start
+    exact, _ = time_queries(flat, queries, args.k)
+    report("flat", "exact", flat, queries, exact, args.k, build_s)
+
+    for index_type in ("ivf", "ivfpq", "hnsw"):
+        start = time.perf_counter()
+        index = build_index(corpus, index_type, nlist=args.nlist, pq_m=args.pq_m,
+                            hnsw_m=args.hnsw_m, with_ids=False)
+        build_s = time.perf_counter() - start
+        if index_type == "hnsw":
+            for ef in EF_SEARCHES:
+                set_search_params(index, ef_search=ef)
+                report(index_type, f"efSearch={ef}", index, queries, exact, args.k, build_s)
+        else:
+            for nprobe in NPROBES:
+                set_search_params(index, nprobe=nprobe)
+                report(index_type, f"nprobe={nprobe}", index, queries, exact, args.k, build_s)
+
+if __name__ == "__main__":
+    main()
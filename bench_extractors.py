@@ -0,0 +1,112 @@
+import os
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # For OpenMP issue on Windows
+
+import copy
+import argparse
+import time
+from glob import glob
+
+import numpy as np
+import torch
+import faiss
+
+from bench_ann import recall_at_k
+from embedding import BACKENDS, transform, load_image, load_backbone, load_extractor, calibration_batches
+from feature_store import FEATURES_FILE, load_features
+from u1 import dataset_path
+
+# ========== CONFIG ==========
+NUM_IMAGES = 256  # Evaluation images, disjoint from the int8 calibration images
+TOP_K = 10
+BATCH_SIZE = 32
+LATENCY_RUNS = 32  # Single-image forward passes timed per backend
+
+# ========== HELPERS ==========
+def load_tensors(paths):
+    tensors = []
+    for path in paths:
+        try:
+            tensors.append(transform(load_image(path)))
+        except Exception as e:
+            print(f"⚠️ Skipping {path}: {e}")
+    return torch.stack(tensors)
+
+def embed(extractor, tensors, batch_size):
+    """(features, images/sec) over all tensors in batches"""
+    extractor(tensors[:batch_size])  # Warm-up: JIT/compile/ORT allocations
+    start = time.perf_counter()
+    features = np.concatenate([extractor(tensors[i:i + batch_size])
+                               for i in range(0, len(tensors), batch_size)])
+    return features, len(tensors) / (time.perf_counter() - start)
+
+def single_latency(extractor, tensors, runs):
+    extractor(tensors[:1])
+    ms = []
+    for i in range(min(runs, len(tensors))):
+        start = time.perf_counter()
+        extractor(tensors[i:i + 1])
+        ms.append((time.perf_counter() - start) * 1000)
+    return np.array(ms)
+
+def cosine_rows(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+# ========== CLI ==========
+def parse_args():
+    parser = argparse.ArgumentParser(description="Embedding drift, recall@k and speed of extractor backends vs fp32 eager")
+    parser.add_argument("--dataset", default=dataset_path, help="Folder of artwork images")
+    parser.add_argument("--images", type=int, default=NUM_IMAGES)
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--channels-last", action="store_true", help="Also run each torch fp32 backend in channels_last")
+    parser.add_argument("--features", default=FEATURES_FILE, help="fp32 corpus to measure recall against")
+    parser.add_argument("--threads", type=int, default=None, help="Torch intra-op threads")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    paths = sorted(glob(os.path.join(args.dataset, "*.jpg")))
+    rng = np.random.default_rng(0)
+    rng.shuffle(paths)
+    eval_paths, calibration_paths = paths[:args.images], paths[args.images:]
+    tensors = load_tensors(eval_paths)
+    print(f"📏 {len(tensors)} images, batch_size={args.batch_size}, k={args.k}, torch threads={torch.get_num_threads()}")
+
+    base = load_backbone()
+    reference, _ = embed(load_extractor("eager", module=copy.deepcopy(base)), tensors, args.batch_size)
+
+    # Recall is measured against the fp32 index when there is one, else among the images themselves
+    corpus = load_features(args.features, mmap=False)
+    corpus = reference if corpus is None else np.ascontiguousarray(corpus, dtype="float32")
+    index = faiss.IndexFlatL2(corpus.shape[1])
+    index.add(corpus)
+    _, exact = index.search(reference, args.k)
+    print(f"🎯 Recall against {len(corpus)} fp32 vectors")
+
+    configs = [(backend, False) for backend in args.backends]
+    if args.channels_last:
+        configs += [(backend, True) for backend in args.backends if backend in ("eager", "torchscript", "compile")]
+    for backend, channels_last in configs:
+        try:
+            calibration = calibration_batches(calibration_paths) if backend == "int8" else None
+            extractor = load_extractor(backend, channels_last, calibration, module=copy.deepcopy(base))
+        except Exception as e:
+            print(f"{backend:<24} unavailable: {e}")
+            continue
+        features, throughput = embed(extractor, tensors, args.batch_size)
+        ms = single_latency(extractor, tensors, LATENCY_RUNS)
+        cos = cosine_rows(features, reference)
+        _, approx = index.search(features, args.k)
+        print(f"{extractor.name:<24} cos_mean={cos.mean():.4f}  cos_min={cos.min():.4f}  "
+              f"recall@{args.k}={recall_at_k(approx, exact, args.k):.3f}  "
+              f"p50={np.percentile(ms, 50):.1f}ms  p95={np.percentile(ms, 95):.1f}ms  "
+              f"throughput={throughput:.1f} img/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # For OpenMP issue on Windows
+
+import io
+import csv
+import argparse
+import time
+from glob import glob
+
+import numpy as np
+import torch
+import faiss
+from PIL import Image
+
+from ann_index import INDEX_TYPES, build_index
+from embedding import MODELS, OPQ_M, transform, load_image, load_extractor, train_projection, apply_projection
+from u1 import dataset_path
+
+# ========== CONFIG ==========
+NUM_IMAGES = 2000  # Corpus images embedded per model
+NUM_QUERIES = 200  # Corpus images re-encoded and cropped into query copies
+TOP_K = 10
+BATCH_SIZE = 32
+PROJECTIONS = ("none", "pca256", "pca512", "opq256")
+
+# ========== DATA ==========
+def make_copy(image, rng):
+    """A plausible stolen copy: cropped by up to 10%, downscaled and re-encoded as JPEG"""
+    width, height = image.size
+    dx, dy = (int(rng.uniform(0, 0.1) * width), int(rng.uniform(0, 0.1) * height))
+    image = image.crop((dx, dy, width - dx // 2, height - dy // 2))
+    scale = rng.uniform(0.5, 1.0)
+    image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=int(rng.integers(60, 90)))
+    return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+
+def embed(extractor, images, batch_size):
+    """(features, images/sec); preprocessing is included, as in the builder"""
+    start = time.perf_counter()
+    features = np.concatenate([extractor(torch.stack([transform(im) for im in images[i:i + batch_size]]))
+                               for i in range(0, len(images), batch_size)])
+    return features, len(images) / (time.perf_counter() - start)
+
+# ========== MEASURE ==========
+def project(name, corpus, queries):
+    if name == "none":
+        return corpus, queries
+    kind, dim = name[:3], int(name[3:])
+    projection = train_projection(corpus, kind, dim, opq_m=OPQ_M)
+    return apply_projection(projection, corpus), apply_projection(projection, queries)
+
+def measure(corpus, queries, truth, k, index_type):
+    """Index bytes per vector, ms per single query, and copy recall@1/@k"""
+    index = build_index(corpus, index_type, with_ids=False)
+    size = faiss.serialize_index(index).size
+    latencies, found = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, I = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(I[0])
+    found = np.array(found)
+    return {
+        "bytes_per_vector": size / len(corpus),
+        "search_ms": float(np.median(latencies)),
+        "recall@1": float(np.mean(found[:, 0] == truth)),
+        f"recall@{k}": float(np.mean([t in row for t, row in zip(truth, found)])),
+    }
+
+# ========== CLI ==========
+def parse_args():
+    parser = argparse.ArgumentParser(description="Size, speed and copy-detection recall per backbone and projection")
+    parser.add_argument("--dataset", default=dataset_path, help="Folder of artwork images")
+    parser.add_argument("--images", type=int, default=NUM_IMAGES)
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    parser.add_argument("--projections", nargs="+", choices=PROJECTIONS, default=list(PROJECTIONS))
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--out", default=None, help="Also write the report as CSV")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    faiss.omp_set_num_threads(1)  # One query at a time, as the API searches
+
+    rng = np.random.default_rng(0)
+    paths = sorted(glob(os.path.join(args.dataset, "*.jpg")))
+    paths = [paths[i] for i in rng.permutation(len(paths))[:args.images]]
+    images = [load_image(path) for path in paths]
+    truth = rng.choice(len(images), min(args.queries, len(images)), replace=False)
+    copies = [make_copy(images[i], rng) for i in truth]
+    print(f"📏 {len(images)} corpus images, {len(copies)} query copies, k={args.k}, index={args.index_type}")
+
+    rows = []
+    for model_name in args.models:
+        extractor = load_extractor("eager", model_name=model_name)
+        corpus, throughput = embed(extractor, images, args.batch_size)
+        queries, _ = embed(extractor, copies, args.batch_size)
+        for name in args.projections:
+            try:
+                projected_corpus, projected_queries = project(name, corpus, queries)
+            except ValueError as e:
+                print(f"{model_name:<20} {name:<8} skipped: {e}")
+                continue
+            row = {"model": model_name, "projection": name, "dim": projected_corpus.shape[1],
+                   "embed_img_per_s": throughput,
+                   **measure(projected_corpus, projected_queries, truth, args.k, args.index_type)}
+            rows.append(row)
+            print(f"{model_name:<20} {name:<8} dim={row['dim']:<5} {row['bytes_per_vector']:>7.0f} B/vec  "
+                  f"embed={throughput:6.1f} img/s  search={row['search_ms']:.3f}ms  "
+                  f"recall@1={row['recall@1']:.3f}  recall@{args.k}={row[f'recall@{args.k}']:.3f}")
+
+    if args.out and rows:
+        with open(args.out, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"💾 Saved report to {args.out}")
+
+if __name__ == "__main__":
+    main()
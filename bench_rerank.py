@@ -0,0 +1,104 @@
+import os
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # For OpenMP issue on Windows
+
+import argparse
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+import faiss
+
+from ann_index import PQ_M, build_index, build_cosine_index, set_search_params
+from feature_store import FEATURES_FILE, load_features, load_meta
+from rerank import COARSE_FILE, COARSE_TYPES, TwoStage, build_coarse_index
+from bench_ann import recall_at_k
+
+# ========== CONFIG ==========
+NUM_QUERIES = 500  # Held-out store rows used as queries
+TOP_K = 10
+CANDIDATES = (10, 20, 50, 100, 200, 500)  # K' values swept
+STAGES = ("coarse_search", "fetch_vectors", "rerank")
+
+# ========== HELPERS ==========
+class StageClock:
+    """TwoStage timer that keeps every stage's durations, in ms"""
+
+    def __init__(self):
+        self.ms = defaultdict(list)
+
+    @contextmanager
+    def __call__(self, name):
+        start = time.perf_counter()
+        yield
+        self.ms[name].append((time.perf_counter() - start) * 1000)
+
+def exact_search(corpus, ids, queries, k, metric):
+    """Exact top-k ids over the corpus rows, by L2 or cosine"""
+    if metric == "ip":
+        index = build_cosine_index(corpus, ids)
+        queries = queries.copy()
+        faiss.normalize_L2(queries)
+    else:
+        index = build_index(corpus, "flat", ids=ids)
+    return index.search(queries, k)[1]
+
+# ========== CLI ==========
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recall@k, per-stage latency and RAM of two-stage search "
+                                                 "(compressed coarse index + exact re-rank from disk)")
+    parser.add_argument("--vectors", default=None,
+                        help=f"Index-space vector store (default: the one named by {COARSE_FILE}, else {FEATURES_FILE})")
+    parser.add_argument("--coarse-types", nargs="+", choices=COARSE_TYPES, default=["pq", "sq8"])
+    parser.add_argument("--candidates", nargs="+", type=int, default=list(CANDIDATES), help="K' values to sweep")
+    parser.add_argument("--metric", choices=("ip", "l2"), default="ip", help="Exact re-rank metric (ip = cosine)")
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=32, help="IVF lists probed (ivfpq)")
+    parser.add_argument("--pq-m", type=int, default=PQ_M)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (1 mimics one API request)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    faiss.omp_set_num_threads(args.threads)
+
+    path = args.vectors or load_meta(COARSE_FILE).get("vectors", FEATURES_FILE)
+    store = load_features(path, mmap=True)  # The re-rank reads rows from this mapping, as the service does
+
+    # Hold the queries out of the corpus so nobody finds itself at distance 0
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(store))
+    query_ids, corpus_ids = np.sort(order[:args.queries]), np.sort(order[args.queries:])
+    queries = np.asarray(store[query_ids], dtype="float32")
+    corpus = np.asarray(store[corpus_ids], dtype="float32")
+    full_bytes = store.shape[1] * store.dtype.itemsize
+    print(f"📏 {path}: corpus {corpus.shape} ({full_bytes} B/vec on disk), {len(queries)} queries, "
+          f"k={args.k}, metric={args.metric}")
+
+    exact = exact_search(corpus, corpus_ids, queries, args.k, args.metric)
+    for index_type in args.coarse_types:
+        start = time.perf_counter()
+        coarse = build_coarse_index(corpus, index_type, nlist=args.nlist, pq_m=args.pq_m, ids=corpus_ids)
+        build_s = time.perf_counter() - start
+        set_search_params(coarse, nprobe=args.nprobe)
+        code_bytes = coarse.index.sa_code_size()
+        print(f"{index_type:<6} {code_bytes} B/vec in RAM ({full_bytes / code_bytes:.0f}x smaller), "
+              f"build={build_s:.1f}s")
+
+        for candidates in args.candidates:
+            clock = StageClock()
+            two_stage = TwoStage(coarse, store, candidates, timer=clock)
+            found, latencies = [], []
+            for q in queries:  # One query at a time, as the API searches
+                start = time.perf_counter()
+                _, I = two_stage.search(q[None, :], args.k, args.metric)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found.append(I[0])
+            stages = "  ".join(f"{stage}={np.median(clock.ms[stage]):.2f}ms" for stage in STAGES)
+            print(f"  K'={candidates:<5} recall@{args.k}={recall_at_k(found, exact, args.k):.3f}  "
+                  f"p50={np.percentile(latencies, 50):.2f}ms  p95={np.percentile(latencies, 95):.2f}ms  {stages}")
+
+if __name__ == "__main__":
+    main()
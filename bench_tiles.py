@@ -0,0 +1,142 @@
+import os
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # For OpenMP issue on Windows
+
+import io
+import csv
+import argparse
+import time
+from glob import glob
+
+import numpy as np
+import faiss
+from PIL import Image
+
+from ann_index import build_cosine_index
+from embedding import MODELS, TILE_GRIDS, tiles_per_image, load_image, load_embedder
+from patches import PATCH_TYPES, PatchIndex, build_patch_index
+from u1 import dataset_path
+
+# ========== CONFIG ==========
+NUM_IMAGES = 1000  # Corpus images indexed by both modes
+NUM_QUERIES = 100  # Queries per kind (crop, collage)
+TOP_K = 5
+
+# ========== QUERIES ==========
+def jpeg(image, rng):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=int(rng.integers(60, 90)))
+    return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+
+def random_crop(image, rng, min_side=0.35, max_side=0.7):
+    """A region covering 35-70% of each side, anywhere in the image"""
+    width, height = image.size
+    w, h = int(width * rng.uniform(min_side, max_side)), int(height * rng.uniform(min_side, max_side))
+    x, y = int(rng.integers(0, width - w + 1)), int(rng.integers(0, height - h + 1))
+    return image.crop((x, y, x + w, y + h))
+
+def make_crop(image, rng):
+    return jpeg(random_crop(image, rng), rng)
+
+def make_collage(image, fillers, rng, size=512):
+    """A 2x2 collage: a crop of `image` in one cell, crops of unrelated images in the others"""
+    canvas = Image.new("RGB", (size, size))
+    cell = size // 2
+    target = int(rng.integers(4))
+    for i in range(4):
+        source = image if i == target else fillers[int(rng.integers(len(fillers)))]
+        canvas.paste(random_crop(source, rng).resize((cell, cell)), ((i % 2) * cell, (i // 2) * cell))
+    return jpeg(canvas, rng)
+
+# ========== MODES ==========
+def index_bytes(index):
+    return faiss.serialize_index(index).size
+
+def recall(found, truth, k):
+    return {"recall@1": float(np.mean([f[:1] == [t] for f, t in zip(found, truth)])),
+            f"recall@{k}": float(np.mean([t in f[:k] for f, t in zip(found, truth)]))}
+
+def whole_image_mode(embedder, paths, query_sets, k):
+    """Both modes' build times include decoding the corpus from disk"""
+    start = time.perf_counter()
+    index = build_cosine_index(embedder.embed_paths(paths)[0])
+    row = {"mode": "whole", "build_s": time.perf_counter() - start, "index_bytes": index_bytes(index)}
+    for kind, (queries, truth) in query_sets.items():
+        found, latencies = [], []
+        for image in queries:
+            start = time.perf_counter()
+            vector = embedder.embed_images([image])
+            faiss.normalize_L2(vector)
+            _, I = index.search(vector, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append([int(i) for i in I[0]])
+        row.update({f"{kind}_{name}": value for name, value in recall(found, truth, k).items()})
+        row[f"{kind}_query_ms"] = float(np.median(latencies))
+    return row
+
+def patch_mode(embedder, paths, query_sets, k, index_type, workers):
+    start = time.perf_counter()
+    patches = PatchIndex(build_patch_index(embedder, paths, TILE_GRIDS, index_type, workers=workers), TILE_GRIDS)
+    row = {"mode": f"tiles/{index_type}", "build_s": time.perf_counter() - start,
+           "index_bytes": index_bytes(patches.index)}
+    for kind, (queries, truth) in query_sets.items():
+        found, latencies = [], []
+        for image in queries:
+            start = time.perf_counter()
+            hits = patches.search(embedder.embed_tiles(image, TILE_GRIDS), k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append([a for a, _, _ in hits])
+        row.update({f"{kind}_{name}": value for name, value in recall(found, truth, k).items()})
+        row[f"{kind}_query_ms"] = float(np.median(latencies))
+    return row
+
+# ========== CLI ==========
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build time, index size, query latency and crop/collage recall "
+                                                 "of whole-image vs multi-scale tile indexing")
+    parser.add_argument("--dataset", default=dataset_path, help="Folder of artwork images")
+    parser.add_argument("--images", type=int, default=NUM_IMAGES)
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--model", choices=list(MODELS), default="resnet50")
+    parser.add_argument("--patch-types", nargs="+", choices=PATCH_TYPES, default=["sq8", "pq"])
+    parser.add_argument("--workers", type=int, default=4, help="Decode threads while building the patch index")
+    parser.add_argument("--out", default=None, help="Also write the report as CSV")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    faiss.omp_set_num_threads(1)  # One query at a time, as the API searches
+
+    rng = np.random.default_rng(0)
+    paths = sorted(glob(os.path.join(args.dataset, "*.jpg")))
+    paths = [paths[i] for i in rng.permutation(len(paths))]
+    corpus_paths, filler_paths = paths[:args.images], paths[args.images:args.images + 50]
+    corpus = [load_image(path) for path in corpus_paths]
+    fillers = [load_image(path) for path in filler_paths] or corpus  # Collage filler outside the corpus if possible
+    truth = [int(i) for i in rng.choice(len(corpus), min(args.queries, len(corpus)), replace=False)]
+    query_sets = {
+        "crop": ([make_crop(corpus[i], rng) for i in truth], truth),
+        "collage": ([make_collage(corpus[i], fillers, rng) for i in truth], truth),
+    }
+    print(f"📏 {len(corpus)} corpus images, {len(truth)} crop and collage queries, k={args.k}, "
+          f"{tiles_per_image(TILE_GRIDS)} tiles per image (grids {TILE_GRIDS})")
+
+    embedder = load_embedder(args.model)
+    rows = [whole_image_mode(embedder, corpus_paths, query_sets, args.k)]
+    rows += [patch_mode(embedder, corpus_paths, query_sets, args.k, index_type, args.workers)
+             for index_type in args.patch_types]
+    for row in rows:
+        print(f"{row['mode']:<12} build={row['build_s']:7.1f}s  size={row['index_bytes'] / 2**20:7.1f} MiB  "
+              f"crop: recall@1={row['crop_recall@1']:.3f} recall@{args.k}={row[f'crop_recall@{args.k}']:.3f} "
+              f"{row['crop_query_ms']:.1f}ms  collage: recall@1={row['collage_recall@1']:.3f} "
+              f"recall@{args.k}={row[f'collage_recall@{args.k}']:.3f} {row['collage_query_ms']:.1f}ms")
+
+    if args.out:
+        with open(args.out, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"💾 Saved report to {args.out}")
+
+if __name__ == "__main__":
+    main()
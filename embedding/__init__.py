@@ -0,0 +1,14 @@
+"""Shared image embedding: model loading, preprocessing, projection and versioning.
+
+Every builder, script and server embeds through this package, so indexed and
+query vectors always come from the same pipeline; index metadata written with
+`embedding_meta` is checked by `load_embedder_for` before serving.
+"""
+
+from .preprocess import INPUT_SIZE, PREPROCESS, transform, make_transform, load_image
+from .extractors import BACKENDS, MODELS, WEIGHTS_DIR, load_backbone, load_extractor, calibration_batches
+from .tiles import TILE_GRIDS, tiles_per_image, tile_boxes, tile_crops
+from .projection import (PROJECTIONS, PROJECTION_FILE, PROJECTION_DIM, OPQ_M, train_projection,
+                         apply_projection, save_projection, load_projection, describe)
+from .embedder import (EMBEDDING_VERSION, EmbeddingMismatchError, Embedder, embedding_meta, embedding_id,
+                       check_compatible, is_compatible, load_embedder, load_embedder_for)
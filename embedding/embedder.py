@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import torch
+
+from .preprocess import PREPROCESS, transform, load_image
+from .extractors import MODELS, load_extractor, calibration_batches
+from .projection import ProjectedExtractor, apply_projection, load_projection
+from .tiles import TILE_GRIDS, tile_crops
+
+# ========== VERSIONING ==========
+# Bumped whenever the same image would embed differently (preprocessing, pooling...).
+# 1: indexes built before this package, without input normalization
+EMBEDDING_VERSION = 2
+
+
+class EmbeddingMismatchError(RuntimeError):
+    """An index or feature file was produced by a different embedding configuration"""
+
+
+def embedding_meta(model_name, projection_meta=None):
+    """What produced a set of vectors; written next to every index and feature file"""
+    return {
+        "embedding_version": EMBEDDING_VERSION,
+        "model": model_name,
+        "preprocess": dict(PREPROCESS),
+        "projection": projection_meta,
+    }
+
+def embedding_id(model_name):
+    """Short key for checkpoints: rows from another id cannot be reused"""
+    return f"{model_name}/v{EMBEDDING_VERSION}"
+
+def check_compatible(meta, model_name=None, what="index"):
+    """Raise EmbeddingMismatchError unless `meta` matches what this code embeds"""
+    version = meta.get("embedding_version", 1)
+    if version != EMBEDDING_VERSION:
+        raise EmbeddingMismatchError(
+            f"{what} was built with embedding version {version}, this code embeds version "
+            f"{EMBEDDING_VERSION}; rebuild it with `python u1.py --full`")
+    if meta.get("preprocess") != PREPROCESS:
+        raise EmbeddingMismatchError(
+            f"{what} was built with preprocessing {meta.get('preprocess')}, this code uses {PREPROCESS}")
+    if model_name is not None and meta.get("model") != model_name:
+        raise EmbeddingMismatchError(f"{what} was built with {meta.get('model')}, not {model_name}")
+
+def is_compatible(meta, model_name=None):
+    try:
+        check_compatible(meta, model_name)
+        return True
+    except EmbeddingMismatchError:
+        return False
+
+# ========== EMBEDDER ==========
+class Embedder:
+    """One embedding configuration: backbone, preprocessing and optional projection.
+
+    Called with a preprocessed (N, C, H, W) batch it returns (N, dim) float32
+    rows in the index's space, so it can be handed straight to the service's
+    InferenceBatcher. `extract` skips the projection (what features.npy holds).
+    """
+
+    def __init__(self, extractor, model_name, projection=None, projection_meta=None):
+        self.extractor = extractor
+        self.model_name = model_name
+        self.projection = projection
+        self.projection_meta = projection_meta
+        self.transform = transform
+        if projection is not None:
+            self.projected = ProjectedExtractor(extractor, projection, projection_meta["kind"])
+        else:
+            self.projected = extractor
+        self.name = self.projected.name
+
+    def __call__(self, tensors):
+        return self.projected(tensors)
+
+    def extract(self, tensors):
+        return self.extractor(tensors)
+
+    def project(self, features):
+        """Bring full-width backbone features (e.g. features.npy rows) into the index's space"""
+        return apply_projection(self.projection, features)
+
+    def preprocess(self, image):
+        return self.transform(image)
+
+    def embed_images(self, images, batch_size=32):
+        """Embed RGB PIL images in batches; returns (N, dim) float32"""
+        if not images:
+            return np.empty((0, self.dim), dtype="float32")
+        return np.concatenate([self(torch.stack([self.transform(im) for im in images[i:i + batch_size]]))
+                               for i in range(0, len(images), batch_size)])
+
+    def embed_tiles(self, image, grids=TILE_GRIDS):
+        """Embed every tile of one RGB PIL image in a single forward pass; returns (tiles, dim)"""
+        return self(torch.stack([self.transform(tile) for tile in tile_crops(image, grids)]))
+
+    def embed_paths(self, paths, batch_size=32):
+        """Embed image files, skipping unreadable ones; returns (features, embedded paths)"""
+        images, ok = [], []
+        for path in paths:
+            try:
+                images.append(load_image(path))
+                ok.append(path)
+            except Exception as e:
+                print(f"⚠️ Error processing {path}: {e}")
+        return self.embed_images(images, batch_size), ok
+
+    @property
+    def dim(self):
+        return self.projection.d_out if self.projection is not None else MODELS[self.model_name]
+
+    def meta(self):
+        return embedding_meta(self.model_name, self.projection_meta)
+
+
+def load_embedder(model_name="resnet50", backend="eager", channels_last=False, calibration_paths=(),
+                  projection_meta=None, base_dir=".", weights_dir=None):
+    """Embedder for `model_name` on `backend`; int8 is calibrated on `calibration_paths`.
+
+    `projection_meta` (from index metadata) names the projection file under `base_dir`;
+    `weights_dir` holds pre-fetched backbone weights (default: EMBEDDING_WEIGHTS_DIR).
+    """
+    calibration = calibration_batches(calibration_paths) if backend == "int8" else None
+    extractor = load_extractor(backend, channels_last, calibration, model_name=model_name, weights_dir=weights_dir)
+    projection = None
+    if projection_meta:
+        projection = load_projection(os.path.join(str(base_dir), projection_meta["file"]))
+    return Embedder(extractor, model_name, projection, projection_meta)
+
+def load_embedder_for(meta, base_dir=".", what="index", **options):
+    """Embedder that reproduces the vectors described by `meta`; refuses foreign indexes"""
+    check_compatible(meta, what=what)
+    return load_embedder(meta["model"], projection_meta=meta.get("projection"), base_dir=base_dir, **options)
@@ -0,0 +1,173 @@
+import os
+
+import torch
+from torchvision.models import get_model
+
+from .preprocess import INPUT_SIZE, transform as default_transform, load_image
+
+# ========== CONFIG ==========
+BACKENDS = ("eager", "torchscript", "compile", "int8", "onnx")
+# Backbone -> pooled feature width; all take 224x224 ImageNet-style input
+MODELS = {
+    "resnet50": 2048,
+    "resnet18": 512,
+    "mobilenet_v3_large": 960,
+    "mobilenet_v3_small": 576,
+    "efficientnet_b0": 1280,
+}
+ONNX_FILE = "{model}_features.onnx"  # Exported on first use of the onnx backend
+CALIBRATION_IMAGES = 64  # Images run through the int8 observers before conversion
+# Pre-fetched "{model}.pth" state dicts (see embedding.prefetch); loaded without any network lookup
+WEIGHTS_DIR = os.environ.get("EMBEDDING_WEIGHTS_DIR")
+WEIGHTS_FILE = "{model}.pth"
+OFFLINE = os.environ.get("EMBEDDING_OFFLINE", "0") == "1"  # Fail instead of downloading missing weights
+
+# ========== MODEL ==========
+def weights_path(model_name, weights_dir=None):
+    weights_dir = weights_dir or WEIGHTS_DIR
+    return os.path.join(weights_dir, WEIGHTS_FILE.format(model=model_name)) if weights_dir else None
+
+def load_pretrained(model_name, weights_dir=None):
+    """Full pretrained torchvision model, from `weights_dir` when its state dict is there.
+
+    A local file skips torchvision's hub cache lookup and any download; otherwise
+    the default weights are fetched (or read from the torch hub cache) unless
+    EMBEDDING_OFFLINE=1.
+    """
+    path = weights_path(model_name, weights_dir)
+    if path and os.path.exists(path):
+        model = get_model(model_name, weights=None)
+        model.load_state_dict(torch.load(path, map_location="cpu", weights_only=True))
+        return model
+    if OFFLINE:
+        raise FileNotFoundError(f"No local weights for {model_name} at {path} and EMBEDDING_OFFLINE=1; "
+                                f"run `python -m embedding.prefetch --models {model_name}`")
+    return get_model(model_name, weights="DEFAULT")
+
+def load_backbone(model_name="resnet50", weights_dir=None):
+    """fp32 pretrained backbone without its classifier: (N, 3, H, W) -> (N, MODELS[model_name], 1, 1)"""
+    if model_name not in MODELS:
+        raise ValueError(f"Unknown model {model_name!r}, expected one of {list(MODELS)}")
+    model = load_pretrained(model_name, weights_dir)
+    model.eval()
+    if model_name.startswith("resnet"):
+        return torch.nn.Sequential(*(list(model.children())[:-1]))  # Remove classifier layer
+    return torch.nn.Sequential(model.features, model.avgpool)  # MobileNet/EfficientNet: drop the classifier head
+
+def example_input(batch_size=1, channels_last=False):
+    example = torch.zeros(batch_size, 3, INPUT_SIZE, INPUT_SIZE)
+    return example.contiguous(memory_format=torch.channels_last) if channels_last else example
+
+def calibration_batches(paths, transform=default_transform, num_images=CALIBRATION_IMAGES, batch_size=16):
+    """Preprocessed tensors of up to `num_images` readable images, for int8 calibration"""
+    tensors = []
+    for path in paths:
+        if len(tensors) >= num_images:
+            break
+        try:
+            tensors.append(transform(load_image(path)))
+        except Exception:
+            continue
+    return [torch.stack(tensors[i:i + batch_size]) for i in range(0, len(tensors), batch_size)]
+
+# ========== EXTRACTORS ==========
+class TorchExtractor:
+    """Runs a torch module on CPU; called with a (N, C, H, W) batch, returns (N, dim) float32 rows"""
+
+    def __init__(self, module, name, channels_last=False):
+        self.module = module
+        self.name = name
+        self.channels_last = channels_last
+
+    def __call__(self, tensors):
+        if self.channels_last:
+            tensors = tensors.contiguous(memory_format=torch.channels_last)
+        with torch.inference_mode():
+            return self.module(tensors).flatten(1).numpy().astype("float32")
+
+
+class OnnxExtractor:
+    """Runs an exported model with ONNX Runtime's CPU provider; same call contract as TorchExtractor"""
+
+    def __init__(self, onnx_path, threads=None, name="onnx"):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("The onnx extractor backend needs onnxruntime (pip install onnxruntime)")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.name = name
+
+    def __call__(self, tensors):
+        features = self.session.run(None, {self.input_name: tensors.contiguous().numpy()})[0]
+        return features.reshape(len(features), -1).astype("float32")
+
+# ========== BACKENDS ==========
+def trace(module, channels_last=False):
+    """TorchScript trace, frozen and optimized for inference (conv-bn folding, fused ops)"""
+    with torch.no_grad():
+        traced = torch.jit.trace(module, example_input(channels_last=channels_last))
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+def quantize_int8(module, calibration):
+    """Static post-training int8 quantization (FX graph mode), calibrated on `calibration` batches.
+
+    Dynamic quantization only covers Linear/LSTM layers, and the headless
+    backbones are all convolutions, so static quantization is the int8 option here.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    if not calibration:
+        raise ValueError("int8 quantization needs calibration images")
+    engines = torch.backends.quantized.supported_engines
+    engine = next(e for e in ("x86", "fbgemm", "qnnpack") if e in engines)
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(module, get_default_qconfig_mapping(engine), example_inputs=(example_input(),))
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch)
+    return convert_fx(prepared)
+
+def export_onnx(module, onnx_path):
+    """Export with a dynamic batch axis, so batched API requests reuse one session"""
+    with torch.no_grad():
+        torch.onnx.export(module, example_input(), onnx_path, input_names=["images"],
+                          output_names=["features"], opset_version=17,
+                          dynamic_axes={"images": {0: "batch"}, "features": {0: "batch"}})
+
+def load_extractor(backend="eager", channels_last=False, calibration=None, onnx_path=None,
+                   module=None, threads=None, model_name="resnet50", weights_dir=None):
+    """Feature extractor for `backend` (one of BACKENDS) around `module` (default: fp32 `model_name`).
+
+    channels_last applies to the torch backends; int8 needs `calibration`, a
+    list of preprocessed batches; onnx exports `module` to `onnx_path` once,
+    and later loads never build the torch backbone at all.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown extractor backend {backend!r}, expected one of {BACKENDS}")
+
+    if backend == "onnx":
+        onnx_path = onnx_path or ONNX_FILE.format(model=model_name)
+        if not os.path.exists(onnx_path):
+            export_onnx(module if module is not None else load_backbone(model_name, weights_dir), onnx_path)
+        return OnnxExtractor(onnx_path, threads, f"{model_name}/onnx")
+
+    module = module if module is not None else load_backbone(model_name, weights_dir)
+
+    if backend == "int8":
+        # Quantized convolutions pick their own layout; channels_last only matters for fp32
+        return TorchExtractor(quantize_int8(module, calibration), f"{model_name}/int8")
+
+    name = f"{model_name}/{backend}" + ("+channels_last" if channels_last else "")
+    if channels_last:
+        module = module.to(memory_format=torch.channels_last)
+    if backend == "torchscript":
+        module = trace(module, channels_last)
+    elif backend == "compile":
+        module = torch.compile(module)
+    return TorchExtractor(module, name, channels_last)
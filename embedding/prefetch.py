@@ -0,0 +1,42 @@
+"""Download backbone weights once and save them for offline loading.
+
+    python -m embedding.prefetch --models resnet50 --out weights
+
+Point EMBEDDING_WEIGHTS_DIR at `--out` and load_backbone reads the saved state
+dicts directly, with no torch hub lookup or download; the Dockerfile runs this
+at build time with PREBAKE_WEIGHTS=1.
+"""
+
+import os
+import argparse
+
+import torch
+from torchvision.models import get_model
+
+from .extractors import MODELS, WEIGHTS_DIR, weights_path
+
+
+def prefetch(model_name, out_dir):
+    path = weights_path(model_name, out_dir)
+    if os.path.exists(path):
+        print(f"✅ {model_name}: already at {path}")
+        return path
+    model = get_model(model_name, weights="DEFAULT")
+    os.makedirs(out_dir, exist_ok=True)
+    torch.save(model.state_dict(), path)
+    print(f"💾 {model_name}: saved to {path}")
+    return path
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Save pretrained backbone weights for offline loading")
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=["resnet50"])
+    parser.add_argument("--out", default=WEIGHTS_DIR or "weights", help="Directory for {model}.pth files")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    for model_name in args.models:
+        prefetch(model_name, args.out)
+
+if __name__ == "__main__":
+    main()
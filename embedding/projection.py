@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import faiss
+
+# ========== CONFIG ==========
+PROJECTIONS = ("none", "pca", "opq")
+PROJECTION_FILE = "projection.vt"
+PROJECTION_DIM = 256
+OPQ_M = 32  # OPQ sub-spaces; the output dim must be a multiple of it
+TRAIN_SAMPLE = 100_000  # Max vectors used to train the projection
+
+# ========== TRAIN ==========
+def train_projection(features, kind="pca", dim=PROJECTION_DIM, opq_m=OPQ_M, train_sample=TRAIN_SAMPLE, seed=0):
+    """Train a `kind` projection from the backbone's width down to `dim`.
+
+    PCA keeps the highest-variance directions; OPQ additionally rotates them
+    so a following PQ index splits the variance evenly across sub-quantizers.
+    """
+    features = np.asarray(features)
+    if kind == "pca":
+        transform = faiss.PCAMatrix(features.shape[1], dim)
+    elif kind == "opq":
+        if dim % opq_m:
+            raise ValueError(f"OPQ output dim {dim} must be a multiple of opq_m={opq_m}")
+        transform = faiss.OPQMatrix(features.shape[1], opq_m, dim)
+    else:
+        raise ValueError(f"Unknown projection {kind!r}, expected one of {PROJECTIONS[1:]}")
+    rng = np.random.default_rng(seed)
+    n = min(len(features), train_sample)
+    sample = features[rng.choice(len(features), n, replace=False)] if n < len(features) else features
+    transform.train(np.ascontiguousarray(sample, dtype="float32"))
+    return transform
+
+def apply_projection(transform, features):
+    """Project (N, d_in) rows to (N, d_out) float32; None passes features through"""
+    features = np.ascontiguousarray(features, dtype="float32")
+    return features if transform is None else transform.apply(features)
+
+def describe(transform, kind, path=PROJECTION_FILE):
+    """Metadata recorded next to every index built on projected vectors"""
+    return {"kind": kind, "dim_in": transform.d_in, "dim_out": transform.d_out, "file": os.path.basename(path)}
+
+# ========== SAVE / LOAD ==========
+def save_projection(transform, path=PROJECTION_FILE):
+    tmp = f"{path}.tmp"
+    faiss.write_VectorTransform(transform, tmp)
+    os.replace(tmp, path)
+
+def load_projection(path=PROJECTION_FILE):
+    return faiss.read_VectorTransform(str(path))
+
+# ========== EXTRACTOR ==========
+class ProjectedExtractor:
+    """Extractor followed by the trained projection, so queries land in the index's space"""
+
+    def __init__(self, extractor, transform, kind):
+        self.extractor = extractor
+        self.transform = transform
+        self.name = f"{extractor.name}+{kind}{transform.d_out}"
+
+    def __call__(self, tensors):
+        return apply_projection(self.transform, self.extractor(tensors))
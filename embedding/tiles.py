@@ -0,0 +1,22 @@
+# ========== CONFIG ==========
+# An n x n grid of tiles per entry; 1 is the whole image. Indexed and query images
+# are cut the same way, so a crop matches the indexed tile it overlaps most and a
+# collage's tiles match the whole artworks they were cut from.
+TILE_GRIDS = (1, 2, 3)
+
+
+def tiles_per_image(grids=TILE_GRIDS):
+    return sum(n * n for n in grids)
+
+def tile_boxes(width, height, grids=TILE_GRIDS):
+    """(left, upper, right, lower) of every tile, coarsest grid first, row by row"""
+    boxes = []
+    for n in grids:
+        xs = [round(i * width / n) for i in range(n + 1)]
+        ys = [round(j * height / n) for j in range(n + 1)]
+        boxes.extend((xs[i], ys[j], xs[i + 1], ys[j + 1]) for j in range(n) for i in range(n))
+    return boxes
+
+def tile_crops(image, grids=TILE_GRIDS):
+    """The image's tiles as PIL images, in tile_boxes order"""
+    return [image.crop(box) for box in tile_boxes(image.width, image.height, grids)]
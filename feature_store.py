@@ -0,0 +1,67 @@
+import os
+import json
+import pickle
+import time
+import numpy as np
+
+# ========== CONFIG ==========
+FEATURES_FILE = "features.npy"
+LEGACY_FEATURES_FILE = "features.pkl"
+FEATURE_DTYPES = ("float32", "float16")
+
+# ========== PATHS ==========
+def meta_path(path):
+    """Sidecar metadata file for a feature array or index: features.npy -> features.json"""
+    return os.path.splitext(str(path))[0] + ".json"
+
+# ========== SAVE ==========
+def save_features(path, features, dtype="float32", **meta):
+    """Write `features` as a .npy file plus a small JSON header.
+
+    .npy is a flat, uncompressed array with a tiny header, so readers can
+    np.load(..., mmap_mode="r") it: every process on a host then shares the
+    same pages through the OS page cache instead of unpickling a private copy.
+    float16 halves the file; readers upcast rows as they use them.
+    """
+    if dtype not in FEATURE_DTYPES:
+        raise ValueError(f"Unsupported feature dtype {dtype!r}, expected one of {FEATURE_DTYPES}")
+    features = np.ascontiguousarray(features, dtype=dtype)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, features)
+    os.replace(tmp, path)
+
+    save_meta(path, count=int(features.shape[0]),
+              dim=int(features.shape[1]) if features.ndim == 2 else 0, dtype=dtype, **meta)
+
+def save_meta(path, **meta):
+    """Write the JSON sidecar of a feature array or index file (features.npy -> features.json)"""
+    header = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), **meta}
+    tmp = f"{meta_path(path)}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp, meta_path(path))
+
+# ========== LOAD ==========
+def load_features(path, mmap=True):
+    """Load a feature array, memory-mapped read-only by default.
+
+    Falls back to the legacy features.pkl next to `path` when no .npy exists.
+    Returns an (N, dim) array, or None if neither file exists.
+    """
+    path = str(path)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="r" if mmap else None)
+    legacy = os.path.join(os.path.dirname(path), LEGACY_FEATURES_FILE)
+    if os.path.exists(legacy):
+        with open(legacy, "rb") as f:
+            return pickle.load(f)
+    return None
+
+def load_meta(path):
+    """Return the JSON header for a feature array, or {} if there is none"""
+    if not os.path.exists(meta_path(path)):
+        return {}
+    with open(meta_path(path), "r", encoding="utf-8") as f:
+        return json.load(f)
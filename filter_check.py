@@ -0,0 +1,74 @@
+import os
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # For OpenMP issue on Windows
+
+import sys
+import argparse
+
+import numpy as np
+import faiss
+
+from ann_index import INDEX_TYPES, build_index, make_index, train_index, search
+from patches import PATCH_TYPES, PatchIndex, normalized, patch_ids
+from rerank import COARSE_TYPES, TwoStage, build_coarse_index
+
+GRIDS = (1, 2)  # 5 tiles per artwork
+
+# ========== CHECK ==========
+def filtered_ok(name, I, allowed):
+    """Every returned id passes the filter and every query found something"""
+    hits = [set(row[row >= 0].tolist()) for row in I]
+    ids_ok = all(row <= allowed for row in hits)
+    found_ok = all(hits)
+    print(f"{'✅' if ids_ok and found_ok else '❌'} {name}: ids {'filtered' if ids_ok else 'LEAK'}, "
+          f"{'every query answered' if found_ok else 'EMPTY rows'}")
+    return ids_ok and found_ok
+
+def build_patches(features, index_type):
+    tiles = sum(n * n for n in GRIDS)
+    vectors = normalized(np.repeat(features, tiles, axis=0) + 0.01 * np.random.default_rng(2).standard_normal(
+        (len(features) * tiles, features.shape[1])).astype("float32"))
+    base = make_index(vectors.shape[1], index_type, len(vectors))
+    train_index(base, vectors)
+    index = faiss.IndexIDMap2(base)
+    for artwork_id in range(len(features)):
+        index.add_with_ids(vectors[artwork_id * tiles:(artwork_id + 1) * tiles], patch_ids(artwork_id, tiles))
+    return PatchIndex(index, GRIDS), vectors, tiles
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a filtered search on every index type the service can load.")
+    parser.add_argument("--n", type=int, default=5000, help="Random vectors")
+    parser.add_argument("--dim", type=int, default=128, help="Dimension (a multiple of ann_index.PQ_M)")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--allowed", type=float, default=0.05, help="Fraction of ids passing the filter")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    features = rng.standard_normal((args.n, args.dim)).astype("float32")
+    ids = np.sort(rng.choice(args.n, max(1, int(args.n * args.allowed)), replace=False)).astype("int64")
+    allowed = set(ids.tolist())
+    queries = features[rng.choice(args.n, args.queries, replace=False)] + 0.01
+    print(f"📦 {args.n} vectors, {args.queries} queries, k={args.k}, {len(ids)} ids pass the filter")
+
+    ok = True
+    for index_type in INDEX_TYPES:
+        _, I = search(build_index(features, index_type), queries, args.k, ids)
+        ok &= filtered_ok(f"index {index_type}", I, allowed)
+
+    for index_type in COARSE_TYPES:
+        two_stage = TwoStage(build_coarse_index(features, index_type), features)
+        for metric in ("l2", "ip"):
+            _, I = two_stage.search(queries, args.k, metric, ids=ids)
+            ok &= filtered_ok(f"two-stage {index_type} coarse, {metric}", I, allowed)
+
+    for index_type in PATCH_TYPES:
+        patch_index, vectors, tiles = build_patches(features, index_type)
+        query_tiles = [vectors[q * tiles:(q + 1) * tiles] for q in rng.choice(args.n, args.queries, replace=False)]
+        results = [patch_index.search(t, args.k, ids=ids, min_similarity=-1.0) for t in query_tiles]
+        I = np.array([[artwork for artwork, _, _ in r] + [-1] * (args.k - len(r)) for r in results])
+        ok &= filtered_ok(f"patch index {index_type}", I, allowed)
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
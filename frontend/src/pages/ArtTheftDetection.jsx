@@ -125,7 +125,10 @@ function ArtTheftDetection() {
                     )}
                   </div>
                   <img 
-                    src={`http://127.0.0.1:8000/${match.replace(/\\/g, '/')}`} 
+                    src={result.thumbnails
+                      ? `http://127.0.0.1:8000${result.thumbnails[index]}`
+                      : `http://127.0.0.1:8000/${match.replace(/\\/g, '/')}`}
+                    loading="lazy"
                     alt="Similar artwork" 
                     className="w-full h-auto rounded"
                     onError={(e) => {
@@ -2,40 +2,36 @@ from fastapi import FastAPI, UploadFile, File, Form
 from fastapi.responses import JSONResponse, StreamingResponse
 from PIL import Image, ImageDraw, ImageFont
 import base64, io, requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import numpy as np
-import torch
-import torchvision.transforms as transforms
-from torchvision.models import resnet50, ResNet50_Weights
 import faiss, pickle
 
+from embedding import load_embedder_for, load_image
+from feature_store import FEATURES_FILE, load_features, load_meta
+
 app = FastAPI()
 
+# === Pooled Stable Diffusion session: keep-alive connections, retries, timeout ===
+SD_URL = "http://127.0.0.1:7860/sdapi/v1/txt2img"
+SD_TIMEOUT = (5, 300)  # (connect, read) seconds
+sd_session = requests.Session()
+sd_session.mount("http://", HTTPAdapter(pool_maxsize=4, max_retries=Retry(
+    total=2, connect=2, read=0, status_forcelist=(502, 503, 504),
+    allowed_methods=frozenset({"POST"}), backoff_factor=0.5, raise_on_status=False)))
+
 # === Load FAISS index and features ===
 index = faiss.read_index("art_index.faiss")
 with open("image_paths.pkl", "rb") as f:
     image_paths = pickle.load(f)
-with open("features.pkl", "rb") as f:
-    features = pickle.load(f)
+# === Load the embedding model the index was built with (refuses mismatches) ===
+embedder = load_embedder_for(load_meta("art_index.faiss"))
 
+features = embedder.project(load_features(FEATURES_FILE))
 norm_features = features / np.linalg.norm(features, axis=1, keepdims=True)
 
-# === Load ResNet50 without final classification layer ===
-weights = ResNet50_Weights.DEFAULT
-model = resnet50(weights=weights)
-model = torch.nn.Sequential(*list(model.children())[:-1])
-model.eval()
-
-# === Image Preprocessing ===
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor()
-])
-
 def extract_feature(img: Image.Image) -> np.ndarray:
-    img_tensor = transform(img).unsqueeze(0)
-    with torch.no_grad():
-        vec = model(img_tensor).squeeze().numpy()
-    return np.expand_dims(vec.astype("float32"), axis=0)
+    return embedder.embed_images([img])
 
 def cosine_similarity(query_vec, feature_matrix):
     query_norm = query_vec / np.linalg.norm(query_vec)
@@ -48,7 +44,7 @@ async def process_image(prompt: str = Form(""), image: UploadFile = File(...)):
     try:
         # Load image
         contents = await image.read()
-        input_image = Image.open(io.BytesIO(contents)).convert("RGB")
+        input_image = load_image(contents)
 
         # Step 1: Feature Extraction
         query_feature = extract_feature(input_image)
@@ -93,7 +89,7 @@ async def process_image(prompt: str = Form(""), image: UploadFile = File(...)):
         if prompt.strip():
             payload["prompt"] = prompt.strip()
 
-        response = requests.post("http://127.0.0.1:7860/sdapi/v1/txt2img", json=payload)
+        response = sd_session.post(SD_URL, json=payload, timeout=SD_TIMEOUT)
         response.raise_for_status()
         output_image_b64 = response.json()["images"][0]
         output_bytes = base64.b64decode(output_image_b64)
@@ -0,0 +1,192 @@
+import os
+import errno
+import shutil
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from manifest import MANIFEST_FILE, HASH_WORKERS, file_hash, file_entry, load_manifest, save_manifest
+
+# ========== CONFIG ==========
+DEST_DIR = "D:\\faiss3\\artvee"  # The indexer's --dataset folder
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+LINK_MODES = ("auto", "reflink", "hardlink", "copy")  # auto: reflink, else hardlink, else copy
+VALIDATE_SIZE = 256  # JPEGs are validated by a reduced-scale decode, which still reads every byte
+DOWNSCALE_QUALITY = 95
+FICLONE = 0x40049409  # Linux ioctl cloning a file's extents (btrfs, XFS, ...)
+
+# ========== DISCOVERY ==========
+def walk_sources(sources):
+    """Yield (source path, target name) for every image under the source trees.
+
+    Targets are named '<parent folder>_<file>', the dataset's naming scheme,
+    so the style filter (shards.style_of) keeps working.
+    """
+    for root in sources:
+        for folder, dirs, files in os.walk(root):
+            dirs.sort()
+            style = os.path.basename(os.path.normpath(folder))
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_SUFFIXES):
+                    yield os.path.join(folder, name), f"{style}_{name}"
+
+def hash_files(paths, manifest, workers):
+    """{path: sha256}, trusting manifest entries whose size and mtime still match"""
+    hashes, to_hash = {}, []
+    for path in paths:
+        old, st = manifest.get(path), os.stat(path)
+        if old and old["size"] == st.st_size and old["mtime"] == st.st_mtime_ns:
+            hashes[path] = old["sha256"]
+        else:
+            to_hash.append(path)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashes.update(zip(to_hash, pool.map(file_hash, to_hash)))
+    return hashes
+
+# ========== VALIDATION ==========
+def check_image(path):
+    """Fully decode an image; returns (width, height, format) or raises on corrupt/truncated files"""
+    with Image.open(path) as image:
+        width, height, fmt = image.width, image.height, image.format
+        if fmt == "JPEG":
+            image.draft("RGB", (VALIDATE_SIZE, VALIDATE_SIZE))
+        image.load()
+    return width, height, fmt
+
+def downscale(source, target, max_side, fmt):
+    """Re-encode `source` to fit in max_side x max_side, in its own format"""
+    with Image.open(source) as image:
+        if fmt == "JPEG":
+            image.draft("RGB", (max_side, max_side))
+        image.load()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if fmt == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        tmp = f"{target}.tmp"
+        image.save(tmp, format=fmt, quality=DOWNSCALE_QUALITY)
+    os.replace(tmp, target)
+
+# ========== PLACEMENT ==========
+def reflink(source, target):
+    import fcntl  # Not on Windows; auto mode falls back to a hardlink there
+
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+    shutil.copystat(source, target)
+
+PLACE = {
+    "reflink": reflink,
+    "hardlink": os.link,  # Same volume only; shares the file, so never edit it in place
+    "copy": shutil.copy2,
+}
+
+def place(source, target, mode="auto"):
+    """Put `source` at `target` without copying bytes where the filesystem allows; returns how"""
+    if mode != "auto":
+        PLACE[mode](source, target)
+        return mode
+    for how in ("reflink", "hardlink"):
+        try:
+            PLACE[how](source, target)
+            return how
+        except (OSError, ImportError) as e:
+            if getattr(e, "errno", None) == errno.EEXIST:
+                raise
+    shutil.copy2(source, target)
+    return "copy"
+
+def target_name(name, sha256, taken):
+    """`name`, or name_<hash prefix> when another file already uses it"""
+    if name.lower() not in taken:
+        return name
+    stem, suffix = os.path.splitext(name)
+    return f"{stem}_{sha256[:8]}{suffix}"
+
+def ingest_one(job, mode, max_side):
+    """Validate, then place or downscale one file. Returns (target, how) or (None, error)"""
+    source, target, _ = job
+    try:
+        width, height, fmt = check_image(source)
+        if max_side and max(width, height) > max_side:
+            downscale(source, target, max_side, fmt)
+            return target, "downscaled"
+        return target, place(source, target, mode)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+# ========== CLI ==========
+def parse_args():
+    parser = argparse.ArgumentParser(description="Gather artwork images into the indexer's dataset folder: "
+                                                 "deduplicated by content, validated, linked instead of copied")
+    parser.add_argument("sources", nargs="+", help="Source folders, walked recursively")
+    parser.add_argument("--dest", default=DEST_DIR, help="Dataset folder (pass the same string as u1.py --dataset)")
+    parser.add_argument("--mode", choices=LINK_MODES, default="auto", help="How files are placed in --dest")
+    parser.add_argument("--max-side", type=int, default=None,
+                        help="Re-encode images larger than this (longest side, pixels) instead of linking them")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS, help="Hash/validate/place threads")
+    parser.add_argument("--manifest", default=MANIFEST_FILE, help="Indexer manifest to add the new files to")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be ingested without writing")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    os.makedirs(args.dest, exist_ok=True)
+    manifest = load_manifest(args.manifest)
+
+    # ========== HASH ==========
+    existing = [os.path.join(args.dest, name) for name in os.listdir(args.dest)
+                if name.lower().endswith(IMAGE_SUFFIXES)]
+    found = list(walk_sources(args.sources))
+    print(f"🔎 Found {len(found)} images in {len(args.sources)} source trees, {len(existing)} already in {args.dest}")
+    hashes = hash_files(existing + [source for source, _ in found], manifest, args.workers)
+
+    # ========== DEDUPLICATE ==========
+    # First copy of each content wins; contents already in the dataset are skipped
+    seen = {hashes[path] for path in existing}
+    taken = {name.lower() for name in os.listdir(args.dest)}
+    jobs, duplicates = [], 0
+    for source, name in found:
+        sha256 = hashes[source]
+        if sha256 in seen:
+            duplicates += 1
+            continue
+        seen.add(sha256)
+        name = target_name(name, sha256, taken)
+        taken.add(name.lower())
+        jobs.append((source, os.path.join(args.dest, name), sha256))
+    print(f"🧹 Skipping {duplicates} exact duplicates; {len(jobs)} new images to ingest")
+    if args.dry_run:
+        return
+
+    # ========== VALIDATE & PLACE ==========
+    placed, invalid = {}, 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = pool.map(lambda job: ingest_one(job, args.mode, args.max_side), jobs)
+        for (source, _, sha256), (target, how) in zip(jobs, results):
+            if target is None:
+                invalid += 1
+                print(f"⚠️ Skipping {source}: {how}")
+                continue
+            placed[how] = placed.get(how, 0) + 1
+            # Downscaled files are new content; linked and copied ones keep the source hash
+            manifest[target] = file_entry(target, None if how == "downscaled" else sha256)
+
+    # The indexer trusts these entries by size and mtime, so it never re-hashes the dataset
+    for path in existing:
+        if path not in manifest:
+            manifest[path] = file_entry(path, hashes[path])
+    save_manifest(manifest, args.manifest)
+    summary = ", ".join(f"{count} {how}" for how, count in sorted(placed.items())) or "nothing"
+    print(f"✅ Ingested {sum(placed.values())} images ({summary}), {invalid} invalid, {duplicates} duplicates "
+          f"in {time.perf_counter() - start:.1f}s; manifest: {args.manifest}")
+
+if __name__ == "__main__":
+    main()
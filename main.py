@@ -2,13 +2,10 @@ import os
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # Fix OpenMP DLL issue on Windows
 
 from glob import glob
-from PIL import Image
-import numpy as np
-import torch
-import torchvision.transforms as transforms
-from torchvision.models import resnet50, ResNet50_Weights
 import faiss
 
+from embedding import load_embedder
+
 # ====== Config ======
 dataset_path = "D:\\faiss3\\artvee"
 query_img_path = "C:\\Users\\ADMIN\\Downloads\\1_5_892f3f03-95af-41fd-bc46-67d61f772c47.jpg"
@@ -20,32 +17,16 @@ if MAX_IMAGES:
     image_paths = image_paths[:MAX_IMAGES]
 print("Found", len(image_paths), "images")
 
-# ====== Load Pretrained Model ======
-weights = ResNet50_Weights.DEFAULT
-model = resnet50(weights=weights)
-model.eval()
-model = torch.nn.Sequential(*(list(model.children())[:-1]))  # Remove final classification layer
-
-# ====== Image Transform ======
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-])
+# ====== Load Pretrained Model (shared preprocessing) ======
+embedder = load_embedder()
 
 # ====== Extract Features ======
 def extract_features(paths):
-    features = []
-    for i, path in enumerate(paths):
-        image = Image.open(path).convert("RGB")
-        img_tensor = transform(image).unsqueeze(0)
-        with torch.no_grad():
-            vec = model(img_tensor).squeeze().numpy()
-        features.append(vec)
-        if i % 10 == 0:
-            print(f"Processed {i+1}/{len(paths)}")
-    return np.array(features).astype("float32")
-
-features = extract_features(image_paths)
+    """Returns (features, paths that could be decoded)"""
+    return embedder.embed_paths(paths)
+
+# Unreadable images are skipped, so rows line up with the returned paths, not the glob
+features, image_paths = extract_features(image_paths)
 
 # ====== Build FAISS Index ======
 dim = features.shape[1]
@@ -53,7 +34,7 @@ index = faiss.IndexFlatL2(dim)
 index.add(features)
 
 # ====== Query ======
-query_feature = extract_features([query_img_path])
+query_feature, _ = extract_features([query_img_path])
 D, I = index.search(query_feature, k=3)
 
 # ====== Show Matches ======
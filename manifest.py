@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# ========== CONFIG ==========
+MANIFEST_FILE = "manifest.json"
+CHECKPOINT_FILE = "index_build.ckpt.json"
+HASH_CHUNK = 1 << 20  # Read files 1 MiB at a time when hashing
+HASH_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
+# ========== FILE IDENTITY ==========
+def file_hash(path):
+    """SHA-256 of a file's contents"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_entry(path, sha256=None):
+    """Manifest entry for `path`; hashes the file unless `sha256` is given"""
+    st = os.stat(path)
+    return {
+        "size": st.st_size,
+        "mtime": st.st_mtime_ns,
+        "sha256": sha256 if sha256 is not None else file_hash(path),
+    }
+
+# ========== LOAD / SAVE ==========
+def load_manifest(path=MANIFEST_FILE):
+    """Return {image path: entry}, or an empty dict when no manifest exists"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["entries"]
+
+def write_json_atomic(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def save_manifest(entries, path=MANIFEST_FILE):
+    write_json_atomic(path, {"version": 1, "entries": entries})
+
+# ========== CHANGE DETECTION ==========
+def plan_update(paths, manifest):
+    """Split `paths` into unchanged and to-embed sets against a previous manifest.
+
+    Files whose size and mtime match the manifest are trusted without
+    hashing; everything else is hashed (in parallel) so a touched-but-identical
+    file is still recognised as unchanged.
+
+    Returns (entries, keep, embed, removed): fresh manifest entries for every
+    path, paths whose stored features are still valid, paths that need a
+    forward pass, and manifest paths that no longer exist.
+    """
+    entries, keep, to_hash = {}, [], []
+    for path in paths:
+        old = manifest.get(path)
+        st = os.stat(path)
+        if old and old["size"] == st.st_size and old["mtime"] == st.st_mtime_ns:
+            entries[path] = old
+            keep.append(path)
+        else:
+            to_hash.append(path)
+
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+        hashed = list(pool.map(file_entry, to_hash))
+
+    embed = []
+    for path, entry in zip(to_hash, hashed):
+        old = manifest.get(path)
+        if old and old["sha256"] == entry["sha256"]:
+            entries[path] = {**old, **entry}  # Same content: keep derived fields such as the pHash
+            keep.append(path)
+        else:
+            entries[path] = entry
+            embed.append(path)
+
+    current = set(paths)
+    removed = [path for path in manifest if path not in current]
+    return entries, keep, embed, removed
+
+# ========== CHECKPOINTS ==========
+def load_checkpoint(model=None, path=CHECKPOINT_FILE):
+    """Return [path, sha256, phash] rows already embedded by an interrupted run, in row order.
+
+    Rows embedded by a different `model` are useless, so they count as none.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if model is not None and checkpoint.get("model", model) != model:
+        return []
+    return checkpoint["embedded"]
+
+def save_checkpoint(embedded, model=None, path=CHECKPOINT_FILE):
+    write_json_atomic(path, {"embedded": embedded, "model": model})
+
+def clear_checkpoint(path=CHECKPOINT_FILE):
+    if os.path.exists(path):
+        os.remove(path)
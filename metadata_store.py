@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from shards import style_of
+
+# ========== CONFIG ==========
+METADATA_FILE = "artworks.db"  # One row per FAISS id, next to the index files
+UPLOAD_SOURCE = "upload"  # Source of artworks registered through the API
+FILTERS = ("style", "source")  # Columns searches can be restricted by
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artworks (
+    id INTEGER PRIMARY KEY,           -- FAISS id (row of the build)
+    path TEXT NOT NULL,               -- POSIX path relative to the index directory
+    style TEXT NOT NULL DEFAULT '',   -- '<style>_<file>' prefix from ingest.py
+    source TEXT NOT NULL DEFAULT '',  -- Dataset folder, or 'upload'
+    sha256 TEXT,
+    phash TEXT,                       -- 64-bit perceptual hash as 16 hex digits
+    removed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS artworks_style ON artworks(style) WHERE removed = 0;
+CREATE INDEX IF NOT EXISTS artworks_source ON artworks(source) WHERE removed = 0;
+"""
+
+# ========== PATHS ==========
+def relative_path(path, root):
+    """`path` relative to `root` with forward slashes; paths on another drive stay absolute"""
+    try:
+        path = os.path.relpath(str(path), str(root))
+    except ValueError:
+        pass
+    return str(path).replace("\\", "/")
+
+def hex_hash(h):
+    return f"{int(h):016x}" if h else None
+
+# ========== STORE ==========
+class MetadataStore:
+    """SQLite table of artwork metadata keyed by FAISS id.
+
+    The service keeps `paths()` in memory for hits and asks the store for the
+    ids matching a filter, which searches push down to FAISS as an ID
+    selector. Writes from registration and deletion go straight to the table;
+    one lock serialises the shared connection across worker threads.
+    """
+
+    def __init__(self, path=METADATA_FILE, wal=True):
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        if wal and self.path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")  # Readers never wait for a registration
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_paths(cls, image_paths, root, source="", path=":memory:"):
+        """Store for a legacy build that only has image_paths.pkl; style comes from the file names"""
+        store = cls(path)
+        store.insert(rows_for(image_paths, root, source))
+        return store
+
+    def insert(self, rows):
+        """Insert or replace (id, path, style, source, sha256, phash) rows in one transaction"""
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO artworks (id, path, style, source, sha256, phash) "
+                                  "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def add(self, artwork_id, path, source=UPLOAD_SOURCE, sha256=None, phash=None):
+        self.insert([(artwork_id, path, style_of(path), source, sha256, hex_hash(phash))])
+
+    def remove(self, artwork_id):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE artworks SET removed = 1 WHERE id = ?", (artwork_id,))
+
+    def paths(self):
+        """Path of every id in order, None for removed ids and gaps"""
+        with self.lock:
+            rows = self.conn.execute("SELECT id, path, removed FROM artworks ORDER BY id").fetchall()
+        paths = [None] * (rows[-1][0] + 1 if rows else 0)
+        for artwork_id, path, removed in rows:
+            paths[artwork_id] = None if removed else path
+        return paths
+
+    def ids(self, **filters):
+        """Sorted int64 ids of live artworks matching every filter ({column: value or [values]})"""
+        clauses, params = ["removed = 0"], []
+        for column, values in filters.items():
+            if column not in FILTERS:
+                raise ValueError(f"Unknown filter {column!r}, expected one of {FILTERS}")
+            if values is None:
+                continue
+            values = [values] if isinstance(values, str) else list(values)
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        with self.lock:
+            rows = self.conn.execute(f"SELECT id FROM artworks WHERE {' AND '.join(clauses)} ORDER BY id",
+                                     params).fetchall()
+        return np.fromiter((r[0] for r in rows), dtype="int64", count=len(rows))
+
+    def values(self, column):
+        """Distinct values of a filter column with their live artwork counts"""
+        if column not in FILTERS:
+            raise ValueError(f"Unknown filter {column!r}, expected one of {FILTERS}")
+        with self.lock:
+            return dict(self.conn.execute(f"SELECT {column}, COUNT(*) FROM artworks WHERE removed = 0 "
+                                          f"GROUP BY {column} ORDER BY {column}").fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+def rows_for(image_paths, root, source="", sha256s=None, phashes=None):
+    """Store rows for a build: id = position in `image_paths`"""
+    rows = []
+    for artwork_id, path in enumerate(image_paths):
+        if path is None:
+            continue
+        rows.append((artwork_id, relative_path(path, root), style_of(path), source,
+                     sha256s[artwork_id] if sha256s is not None else None,
+                     hex_hash(phashes[artwork_id]) if phashes is not None else None))
+    return rows
+
+def save_metadata(path, image_paths, root=".", source="", sha256s=None, phashes=None):
+    """Write a fresh store for a build, replacing any previous one atomically.
+
+    Like the index files, the store is rebuilt offline: stop the service first.
+    """
+    tmp = f"{path}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    store = MetadataStore(tmp, wal=False)  # Single file, so it can be renamed into place
+    store.insert(rows_for(image_paths, root, source, sha256s, phashes))
+    store.close()
+    if os.path.exists(path):
+        # Fold the old store's write-ahead log back in, so no stale -wal file outlives it
+        old = sqlite3.connect(path)
+        old.execute("PRAGMA journal_mode=DELETE")
+        old.close()
+    os.replace(tmp, path)
@@ -0,0 +1,185 @@
+import os
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import faiss
+
+from ann_index import TRAIN_SAMPLE, PQ_M, make_index, train_index, read_index, search
+from feature_store import load_meta, save_meta
+from rwlock import ReadWriteLock
+
+# ========== CONFIG ==========
+PATCH_INDEX_FILE = "patch_index.faiss"  # Tile embeddings, id = artwork id * tiles + tile number
+PATCH_TYPES = ("sq8", "pq", "ivfpq")  # int8 or PQ codes keep 14 tiles per artwork affordable
+PATCH_NEIGHBOURS = 20  # Indexed tiles retrieved per query tile
+MIN_TILE_SIMILARITY = 0.6  # Cosine below which a tile match casts no vote
+
+# ========== IDS ==========
+def patch_ids(artwork_id, tiles):
+    return np.arange(artwork_id * tiles, (artwork_id + 1) * tiles, dtype="int64")
+
+def normalized(vectors):
+    vectors = np.array(vectors, dtype="float32", copy=True)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+# ========== BUILD ==========
+def embed_tiles(embedder, paths, grids, workers=4):
+    """Yield (position, (tiles, dim) vectors) per readable image; one forward pass per image.
+
+    Decoding and cropping run `workers` images ahead on threads while the
+    model embeds the current one.
+    """
+    from embedding import load_image
+
+    def load(path):
+        try:
+            return load_image(path)
+        except Exception as e:
+            print(f"⚠️ Error processing {path}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for position, image in enumerate(pool.map(load, paths)):
+            if image is not None:
+                yield position, embedder.embed_tiles(image, grids)
+
+def build_patch_index(embedder, paths, grids, index_type="sq8", train_sample=TRAIN_SAMPLE, workers=4,
+                      chunk=256, nlist=None, pq_m=PQ_M):
+    """Embed every image's tiles and index them; id = path position * tiles + tile.
+
+    Tiles are streamed: only the training sample and `chunk` images' tiles are
+    in memory at once, never the (N * tiles, dim) matrix. Unreadable images
+    are skipped and own no tiles.
+    """
+    from embedding import tiles_per_image
+
+    if index_type not in PATCH_TYPES:
+        raise ValueError(f"Unknown patch index type {index_type!r}, expected one of {PATCH_TYPES}")
+    tiles = tiles_per_image(grids)
+    rng = np.random.default_rng(0)
+    sample = np.sort(rng.choice(len(paths), min(len(paths), max(1, train_sample // tiles)), replace=False))
+    sampled = {int(sample[i]): v for i, v in embed_tiles(embedder, [paths[i] for i in sample], grids, workers)}
+    if not sampled:
+        raise ValueError("No readable images to train the patch index on")
+
+    train = normalized(np.concatenate(list(sampled.values())))
+    base = make_index(train.shape[1], index_type, len(paths) * tiles, nlist, pq_m)
+    train_index(base, train, train_sample)
+    index = faiss.IndexIDMap2(base)
+    for position, vectors in sampled.items():
+        index.add_with_ids(normalized(vectors), patch_ids(position, tiles))
+
+    rest = sorted(set(range(len(paths))) - set(sample.tolist()))
+    for start in range(0, len(rest), chunk):
+        positions = rest[start:start + chunk]
+        for i, vectors in embed_tiles(embedder, [paths[p] for p in positions], grids, workers):
+            index.add_with_ids(normalized(vectors), patch_ids(positions[i], tiles))
+    return index
+
+# ========== VOTING ==========
+def vote(D, I, tiles, k, min_similarity=MIN_TILE_SIMILARITY):
+    """Aggregate per-tile neighbours into per-artwork scores.
+
+    Each query tile votes once per artwork, with its best tile similarity
+    (unit vectors: cosine = 1 - d/2). An artwork's score is its summed votes
+    over the number of query tiles, so a full copy scores near 1 and a crop
+    covering part of the query scores by the share it covers. Returns the
+    top-k [(artwork_id, score, votes)].
+    """
+    best = {}  # (query tile, artwork) -> similarity
+    for tile, (distances, ids) in enumerate(zip(D, I)):
+        for d, i in zip(distances, ids):
+            if i < 0:
+                continue
+            similarity = 1.0 - float(d) / 2
+            if similarity < min_similarity:
+                continue
+            key = (tile, int(i) // tiles)
+            if similarity > best.get(key, -1.0):
+                best[key] = similarity
+    scores, votes = {}, {}
+    for (_, artwork_id), similarity in best.items():
+        scores[artwork_id] = scores.get(artwork_id, 0.0) + similarity
+        votes[artwork_id] = votes.get(artwork_id, 0) + 1
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [(a, scores[a] / len(D), votes[a]) for a in ranked]
+
+# ========== INDEX ==========
+class PatchIndex:
+    """Tile index of the corpus for partial-copy detection.
+
+    Every artwork owns `tiles` consecutive ids from artwork_id * tiles, so the
+    owner of a hit is id // tiles and an artwork's tiles are added and removed
+    together. All tiles of a query are searched in one FAISS call and voted
+    per artwork. As in LiveIndex, searches run concurrently: without any
+    lock on a read-only (mmapped) index, else sharing a reader/writer lock
+    that registrations and removals take exclusively.
+    """
+
+    def __init__(self, index, grids, read_only=False):
+        self.index = index
+        self.grids = tuple(grids)
+        self.tiles = sum(n * n for n in self.grids)  # embedding.tiles_per_image, without importing torch
+        self.read_only = read_only
+        self.dirty = False
+        self.lock = ReadWriteLock()
+
+    @classmethod
+    def load(cls, path=PATCH_INDEX_FILE, mmap=False):
+        index, mapped = read_index(path, mmap)
+        return cls(index, load_meta(path)["grids"], read_only=mapped)
+
+    def __len__(self):
+        return self.index.ntotal // self.tiles
+
+    def search(self, tile_vectors, k, neighbours=PATCH_NEIGHBOURS, min_similarity=MIN_TILE_SIMILARITY, ids=None):
+        """Artworks sharing tiles with a query's (tiles, dim) vectors; returns [(artwork_id, score, votes)].
+
+        `ids` restricts the search to those artworks' tiles.
+        """
+        queries = normalized(np.atleast_2d(tile_vectors))
+        if ids is not None:
+            ids = (np.asarray(ids, dtype="int64")[:, None] * self.tiles + np.arange(self.tiles)).ravel()
+        with nullcontext() if self.read_only else self.lock.read():
+            D, I = search(self.index, queries, neighbours, ids)
+        return vote(D, I, self.tiles, k, min_similarity)
+
+    def add(self, artwork_id, tile_vectors):
+        if self.read_only:
+            raise RuntimeError("patch index is memory-mapped read-only")
+        with self.lock.write():
+            self.index.add_with_ids(normalized(tile_vectors), patch_ids(artwork_id, self.tiles))
+            self.dirty = True
+
+    def remove(self, artwork_id):
+        if self.read_only:
+            raise RuntimeError("patch index is memory-mapped read-only")
+        with self.lock.write():
+            self.index.remove_ids(patch_ids(artwork_id, self.tiles))
+            self.dirty = True
+
+    def snapshot(self, path=PATCH_INDEX_FILE):
+        """Write the index if it changed; the metadata sidecar is left as built"""
+        with self.lock.write():
+            if not self.dirty:
+                return False
+            data = faiss.serialize_index(self.index)
+            self.dirty = False
+        try:
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data.tobytes())
+            os.replace(tmp, path)
+        except Exception:
+            self.dirty = True
+            raise
+        return True
+
+
+def save_patch_index(index, path, grids, **meta):
+    tmp = f"{path}.tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+    save_meta(path, **meta, grids=list(grids))
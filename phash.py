@@ -0,0 +1,82 @@
+from collections import defaultdict
+import numpy as np
+from PIL import Image
+
+# ========== CONFIG ==========
+HASH_SIZE = 8  # 8x8 low-frequency DCT block -> 64-bit hash
+HIGHFREQ_FACTOR = 4  # Hash is computed from a 32x32 thumbnail
+MAX_DISTANCE = 6  # Hamming distance still treated as "the same artwork"
+NUM_CHUNKS = 8  # Multi-index hashing: 8 x 8-bit chunks supports distances up to 7
+
+_N = HASH_SIZE * HIGHFREQ_FACTOR
+_DCT = np.cos(np.pi * (2 * np.arange(_N)[None, :] + 1) * np.arange(_N)[:, None] / (2 * _N))
+
+# ========== HASHING ==========
+def phash(image):
+    """64-bit DCT perceptual hash of a PIL image, as a Python int.
+
+    Robust to re-encoding, resizing and small colour shifts; a handful of
+    differing bits means the same picture.
+    """
+    if image.format == "JPEG":
+        image.draft("L", (_N * 2, _N * 2))  # Let libjpeg decode at reduced scale
+    pixels = np.asarray(image.convert("L").resize((_N, _N), Image.BILINEAR), dtype=np.float32)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    bits = low[1:] > np.median(low[1:])  # Skip the DC term, which only encodes brightness
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+def phash_file(path):
+    """pHash of an image file, or None if it cannot be decoded"""
+    try:
+        with Image.open(path) as image:
+            return phash(image)
+    except Exception:
+        return None
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+# ========== LOOKUP ==========
+class MultiIndexHash:
+    """Near-duplicate lookup over 64-bit hashes by multi-index hashing.
+
+    Each hash is split into NUM_CHUNKS chunks with one exact-match table per
+    chunk. Two hashes within Hamming distance d < NUM_CHUNKS must agree
+    exactly on at least one chunk (pigeonhole), so a query only verifies the
+    ids sharing a chunk with it instead of scanning the corpus.
+    """
+
+    def __init__(self, num_chunks=NUM_CHUNKS):
+        self.num_chunks = num_chunks
+        self.bits = 64 // num_chunks
+        self.mask = (1 << self.bits) - 1
+        self.tables = [defaultdict(set) for _ in range(num_chunks)]
+        self.hashes = {}
+
+    def _chunks(self, h):
+        return [(h >> (i * self.bits)) & self.mask for i in range(self.num_chunks)]
+
+    def add(self, item_id, h):
+        self.hashes[item_id] = h
+        for table, chunk in zip(self.tables, self._chunks(h)):
+            table[chunk].add(item_id)
+
+    def remove(self, item_id):
+        h = self.hashes.pop(item_id, None)
+        if h is None:
+            return
+        for table, chunk in zip(self.tables, self._chunks(h)):
+            table[chunk].discard(item_id)
+
+    def search(self, h, max_distance=MAX_DISTANCE):
+        """[(distance, id)] within `max_distance`, closest first"""
+        if max_distance >= self.num_chunks:
+            raise ValueError(f"max_distance must be < {self.num_chunks} for exact multi-index lookup")
+        candidates = set()
+        for table, chunk in zip(self.tables, self._chunks(h)):
+            candidates |= table.get(chunk, set())
+        hits = [(hamming(h, self.hashes[i]), i) for i in candidates]
+        return sorted(hit for hit in hits if hit[0] <= max_distance)
+
+    def __len__(self):
+        return len(self.hashes)
@@ -0,0 +1,141 @@
+import os
+from contextlib import nullcontext
+
+import numpy as np
+import faiss
+
+from ann_index import build_index, read_index, search, set_search_params
+from feature_store import load_features, load_meta
+
+# ========== CONFIG ==========
+COARSE_FILE = "coarse_index.faiss"  # Compressed first-stage index, ids = feature rows
+VECTORS_FILE = "rerank_vectors.npy"  # Projected vectors for the exact stage (features.npy when unprojected)
+COARSE_TYPES = ("pq", "sq8", "ivfpq")
+DEFAULT_CANDIDATES = 100  # K': coarse candidates re-scored exactly per query
+
+
+def no_timer(name):
+    return nullcontext()
+
+# ========== BUILD ==========
+def build_coarse_index(vectors, index_type="pq", **index_options):
+    """ID-mapped compressed index over index-space `vectors`; ids = row positions"""
+    if index_type not in COARSE_TYPES:
+        raise ValueError(f"Unknown coarse index type {index_type!r}, expected one of {COARSE_TYPES}")
+    return build_index(vectors, index_type, with_ids=True, **index_options)
+
+# ========== SEARCH ==========
+class TwoStage:
+    """Compressed coarse search, then exact re-scoring of the top-K' candidates.
+
+    Only the coarse index's codes (e.g. 64 bytes per vector for PQ64) live in
+    RAM. `vectors` is the memory-mapped full-precision store, row = id, and only
+    the candidates' rows are read from it per query, so the page cache holds
+    what is actually being re-ranked. The exact stage scores by L2 or cosine;
+    cosine candidates come from the same L2 coarse search, which K' absorbs.
+    `timer(name)` returns a context manager around each stage (coarse_search,
+    fetch_vectors, rerank), e.g. the service's metrics.Registry.stage.
+    Nothing is mutated after loading, so `search` is safe from many threads
+    at once and callers must not serialise it: the disk reads of one
+    query's re-rank would stall every other query.
+    """
+
+    def __init__(self, coarse, vectors, candidates=DEFAULT_CANDIDATES, timer=None):
+        self.coarse = coarse
+        self.vectors = vectors
+        self.candidates = candidates
+        self.timer = timer or no_timer
+
+    @property
+    def ntotal(self):
+        return self.coarse.ntotal
+
+    def search(self, queries, k, metric="l2", candidates=None, ids=None):
+        """Exact top-k among the coarse top-K'; returns (D, I) like FAISS.
+
+        D holds squared L2 distances for "l2" and cosine similarities for "ip";
+        missing results are padded with id -1. `ids` restricts the coarse
+        search, so all K' candidates already pass the filter.
+        """
+        queries = np.atleast_2d(np.ascontiguousarray(queries, dtype="float32"))
+        n = len(queries)
+        with self.timer("coarse_search"):
+            _, C = search(self.coarse, queries, max(k, candidates or self.candidates), ids)
+
+        with self.timer("fetch_vectors"):
+            # One sorted gather for the whole batch: mmapped rows are read in file order, once each
+            unique = np.unique(C[C >= 0])
+            rows = np.asarray(self.vectors[unique], dtype="float32")
+
+        with self.timer("rerank"):
+            if metric == "ip":
+                rows = rows / np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+                queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+            D = np.full((n, k), -np.inf if metric == "ip" else np.inf, dtype="float32")
+            I = np.full((n, k), -1, dtype="int64")
+            for q, ids in enumerate(C):
+                ids = ids[ids >= 0]
+                if not len(ids):
+                    continue
+                candidate_rows = rows[np.searchsorted(unique, ids)]
+                if metric == "ip":
+                    scores = candidate_rows @ queries[q]
+                    order = np.argsort(-scores)[:k]
+                else:
+                    scores = ((candidate_rows - queries[q]) ** 2).sum(axis=1)
+                    order = np.argsort(scores)[:k]
+                D[q, :len(order)] = scores[order]
+                I[q, :len(order)] = ids[order]
+        return D, I
+
+    def view(self, metric):
+        return TwoStageIndex(self, metric)
+
+    def stats(self):
+        codes = self.coarse.index if isinstance(self.coarse, faiss.IndexIDMap2) else self.coarse
+        try:
+            code_bytes = codes.sa_code_size()
+        except RuntimeError:
+            code_bytes = None
+        return {
+            "vectors": self.ntotal,
+            "candidates": self.candidates,
+            "code_bytes_per_vector": code_bytes,
+            "full_bytes_per_vector": int(self.vectors.shape[1] * self.vectors.dtype.itemsize),
+        }
+
+
+class TwoStageIndex:
+    """Read-only FAISS-like view of a TwoStage search for one metric ("l2" or "ip")"""
+
+    def __init__(self, two_stage, metric):
+        self.two_stage = two_stage
+        self.metric = metric
+
+    @property
+    def ntotal(self):
+        return self.two_stage.ntotal
+
+    def search(self, queries, k, ids=None):
+        return self.two_stage.search(queries, k, self.metric, ids=ids)
+
+    def add_with_ids(self, vectors, ids):
+        raise RuntimeError("two-stage index is read-only")
+
+    def remove_ids(self, ids):
+        raise RuntimeError("two-stage index is read-only")
+
+# ========== LOAD ==========
+def load_two_stage(coarse_path=COARSE_FILE, candidates=DEFAULT_CANDIDATES, nprobe=None, timer=None):
+    """TwoStage from a saved coarse index and the vector store named in its metadata"""
+    meta = load_meta(coarse_path)
+    vectors_path = os.path.join(os.path.dirname(str(coarse_path)), meta.get("vectors", VECTORS_FILE))
+    vectors = load_features(vectors_path, mmap=True)
+    if vectors is None:
+        raise FileNotFoundError(f"Re-rank vectors {vectors_path} not found; rebuild with `python u1.py --coarse-index`")
+    coarse, _ = read_index(coarse_path)
+    if coarse.d != vectors.shape[1] or coarse.ntotal > len(vectors):
+        raise ValueError(f"{coarse_path} ({coarse.ntotal} x {coarse.d}) does not match "
+                         f"{vectors_path} ({vectors.shape[0]} x {vectors.shape[1]})")
+    set_search_params(coarse, nprobe=nprobe)
+    return TwoStage(coarse, vectors, candidates, timer)
@@ -0,0 +1,118 @@
+import os
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # For OpenMP issue on Windows
+
+import sys
+import time
+import argparse
+import pickle
+import secrets
+import subprocess
+import tempfile
+
+import numpy as np
+import faiss
+
+from ann_index import build_index, build_cosine_index
+from feature_store import FEATURES_FILE, load_features
+from shards import AUTHKEY_ENV, SHARD_BY, build_shards, open_shards
+
+# ========== DATA ==========
+def load_corpus(args):
+    """(features, image_paths) from the built index, or a random corpus with style prefixes"""
+    if args.random:
+        rng = np.random.default_rng(0)
+        features = rng.standard_normal((args.random, args.dim)).astype("float32")
+        image_paths = [f"style{i % 7}_{i}.jpg" for i in range(args.random)]
+        return features, image_paths
+    features = np.ascontiguousarray(load_features(FEATURES_FILE), dtype="float32")
+    with open("image_paths.pkl", "rb") as f:
+        image_paths = pickle.load(f)
+    return features, image_paths
+
+# ========== SHARD SERVERS ==========
+SHARD_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shard_server.py")
+
+def start_servers(shard_dir, num_shards, base_port):
+    os.environ.setdefault(AUTHKEY_ENV, secrets.token_hex(32))  # Throwaway key shared with the servers started here
+    procs = [subprocess.Popen([sys.executable, SHARD_SERVER, str(s), "--shard-dir", shard_dir,
+                               "--port", str(base_port + s)])
+             for s in range(num_shards)]
+    return procs, [f"127.0.0.1:{base_port + s}" for s in range(num_shards)]
+
+def wait_ready(index, timeout=30.0):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return index.ntotal
+        except (ConnectionError, OSError, EOFError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+# ========== CHECK ==========
+def same_results(name, expected, got):
+    D0, I0 = expected
+    D1, I1 = got
+    # Ties may come back in either order, so compare ids as sets per row plus distances
+    ids_ok = all(set(a) == set(b) for a, b in zip(I0, I1))
+    dist_ok = np.allclose(D0, D1, rtol=1e-4, atol=1e-4)
+    print(f"{'✅' if ids_ok and dist_ok else '❌'} {name}: ids {'match' if ids_ok else 'DIFFER'}, "
+          f"distances {'match' if dist_ok else 'DIFFER'}")
+    return ids_ok and dist_ok
+
+def timed_search(index, queries, k):
+    start = time.perf_counter()
+    result = index.search(queries, k)
+    return result, (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Check sharded search against one unsharded flat index.")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--shard-by", choices=SHARD_BY, default="hash")
+    parser.add_argument("--random", type=int, default=None, help="Use N random vectors instead of features.npy")
+    parser.add_argument("--dim", type=int, default=2048, help="Dimension of random vectors")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--base-port", type=int, default=7300)
+    args = parser.parse_args()
+
+    features, image_paths = load_corpus(args)
+    queries = features[np.random.default_rng(1).choice(len(features), args.queries, replace=False)] + 0.01
+    normalized = queries.copy()
+    faiss.normalize_L2(normalized)
+    print(f"📦 {len(features)} vectors, {args.queries} queries, k={args.k}, {args.shards} shards by {args.shard_by}")
+
+    flat = build_index(features, "flat")
+    cosine = build_cosine_index(features)
+    expected_l2, flat_ms = timed_search(flat, queries, args.k)
+    expected_ip, _ = timed_search(cosine, normalized, args.k)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as shard_dir:
+        counts = build_shards(features, image_paths, args.shards, args.shard_by, shard_dir, index_type="flat")
+        print(f"🧩 Shard sizes: {counts}")
+
+        l2, ip = open_shards(shard_dir)
+        got, local_ms = timed_search(l2, queries, args.k)
+        ok &= same_results("local threads, L2", expected_l2, got)
+        ok &= same_results("local threads, cosine", expected_ip, ip.search(normalized, args.k))
+
+        procs, servers = start_servers(shard_dir, args.shards, args.base_port)
+        try:
+            l2, ip = open_shards(servers=servers)
+            wait_ready(l2)
+            got, remote_ms = timed_search(l2, queries, args.k)
+            ok &= same_results("shard servers, L2", expected_l2, got)
+            ok &= same_results("shard servers, cosine", expected_ip, ip.search(normalized, args.k))
+        finally:
+            for proc in procs:
+                proc.terminate()
+            for proc in procs:
+                proc.wait()
+
+    print(f"⏱️ {args.queries} queries: unsharded {flat_ms:.1f} ms, local shards {local_ms:.1f} ms, "
+          f"shard servers {remote_ms:.1f} ms")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # For OpenMP issue on Windows
+
+import argparse
+import threading
+from multiprocessing.connection import Listener
+
+from ann_index import search
+from shards import SHARD_DIR, read_shard, shard_authkey
+
+# ========== SERVING ==========
+def serve_connection(conn, indexes):
+    """Answer ("search", metric, queries, k, ids) and ("ntotal", metric) until the client hangs up"""
+    with conn:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            try:
+                if message[0] == "search":
+                    _, metric, queries, k, *ids = message  # ids (or None) restrict the search
+                    conn.send(search(indexes[metric], queries, k, ids[0] if ids else None))
+                elif message[0] == "ntotal":
+                    conn.send(indexes[message[1]].ntotal)
+                else:
+                    raise ValueError(f"unknown request {message[0]!r}")
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                conn.send(e)  # RemoteShard re-raises it in the API process
+
+def serve(address, indexes, authkey):
+    """Serve shard indexes, one thread per client connection.
+
+    FAISS releases the GIL while searching, so connections from several API
+    workers are answered concurrently.
+    """
+    with Listener(address, authkey=authkey) as listener:
+        print(f"🧩 Serving {indexes['l2'].ntotal} vectors on {address[0]}:{address[1]}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"⚠️ Rejected connection: {e}")
+                continue
+            threading.Thread(target=serve_connection, args=(conn, indexes), daemon=True).start()
+
+# ========== MAIN ==========
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve one index shard to the detection API.")
+    parser.add_argument("shard", type=int, help="Shard number, as written by u1.py --shards")
+    parser.add_argument("--shard-dir", default=SHARD_DIR)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="Default 7100 + shard number")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF lists probed per query")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW efSearch")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    try:
+        authkey = shard_authkey()
+    except RuntimeError as e:
+        raise SystemExit(f"❌ {e}")
+    indexes = {metric: read_shard(args.shard_dir, args.shard, metric, args.nprobe, args.ef_search)
+               for metric in ("l2", "ip")}
+    port = args.port if args.port is not None else 7100 + args.shard
+    serve((args.host, port), indexes, authkey)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import json
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client
+
+import numpy as np
+import faiss
+
+from ann_index import build_index, build_cosine_index, search, set_search_params
+
+# ========== CONFIG ==========
+SHARD_DIR = "shards"
+SHARD_BY = ("hash", "style")
+AUTHKEY_ENV = "SHARD_AUTHKEY"  # Shared secret of shard servers and the API; required, there is no default
+
+def shard_authkey():
+    """The shard RPC secret from SHARD_AUTHKEY.
+
+    Messages are unpickled on both ends, so anyone holding the key can run
+    code in the other process; without a key of its own, nothing starts.
+    """
+    key = os.environ.get(AUTHKEY_ENV)
+    if not key:
+        raise RuntimeError(f"{AUTHKEY_ENV} is not set; shard servers and the API need a shared secret "
+                           f"(e.g. `python -c \"import secrets; print(secrets.token_hex(32))\"`)")
+    return key.encode()
+
+# ========== PARTITIONING ==========
+def style_of(path):
+    """Style folder encoded in the file name by ingest.py: '<folder>_<file>'"""
+    name = os.path.basename(path)
+    return name.split("_", 1)[0] if "_" in name else ""
+
+def shard_of(path, num_shards, by="hash"):
+    """Stable shard number for an image path (crc32, so it survives restarts)"""
+    key = style_of(path) if by == "style" else os.path.basename(path)
+    return zlib.crc32(key.encode("utf-8")) % num_shards
+
+def shard_file(shard_dir, shard, metric="l2"):
+    suffix = ".cosine" if metric == "ip" else ""
+    return os.path.join(shard_dir, f"shard_{shard:03d}{suffix}.faiss")
+
+# ========== BUILD ==========
+def build_shards(features, image_paths, num_shards, by="hash", shard_dir=SHARD_DIR, meta=None, **index_options):
+    """Split the corpus into `num_shards` L2 + cosine index pairs.
+
+    Every shard keeps the global row ids (IndexIDMap2), so merged results
+    index straight into image_paths. `meta` (model, projection) goes into shards.json.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    assignment = np.array([shard_of(path, num_shards, by) for path in image_paths])
+    counts = []
+    for shard in range(num_shards):
+        ids = np.flatnonzero(assignment == shard).astype("int64")
+        counts.append(len(ids))
+        shard_features = np.ascontiguousarray(features[ids], dtype="float32")
+
+        if len(ids):
+            l2 = build_index(shard_features, ids=ids, **index_options)
+        else:
+            l2 = faiss.IndexIDMap2(faiss.IndexFlatL2(features.shape[1]))
+        faiss.write_index(l2, shard_file(shard_dir, shard, "l2"))
+        faiss.write_index(build_cosine_index(shard_features, ids=ids), shard_file(shard_dir, shard, "ip"))
+
+    with open(os.path.join(shard_dir, "shards.json"), "w", encoding="utf-8") as f:
+        json.dump({"num_shards": num_shards, "by": by, "counts": counts, **(meta or {})}, f, indent=2)
+    return counts
+
+# ========== SEARCH ==========
+class LocalShard:
+    """A shard index held in this process"""
+
+    def __init__(self, index):
+        self.index = index
+        self.ids = faiss.vector_to_array(index.id_map)  # Shards are read-only, so this never changes
+
+    def search(self, queries, k, ids=None):
+        return search(self.index, queries, k, ids)
+
+    def owns(self, ids):
+        """Which of `ids` live in this shard"""
+        return np.isin(ids, self.ids)
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+
+class RemoteShard:
+    """A shard served by shard_server.py, reached over multiprocessing.connection.
+
+    Messages are pickled, so only connect to shard servers on a trusted network.
+    One connection per shard, serialised by a lock; fan-out across shards is
+    still parallel.
+    """
+
+    def __init__(self, address, metric="l2", authkey=None):
+        host, port = address.rsplit(":", 1)
+        self.address = (host, int(port))
+        self.metric = metric
+        self.authkey = authkey or shard_authkey()
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _call(self, *message):
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.conn is None:
+                        self.conn = Client(self.address, authkey=self.authkey)
+                    self.conn.send(message)
+                    reply = self.conn.recv()
+                    break
+                except (EOFError, OSError):
+                    self.conn = None  # Reconnect once, e.g. after a shard server restart
+                    if attempt:
+                        raise
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def search(self, queries, k, ids=None):
+        return self._call("search", self.metric, np.ascontiguousarray(queries, dtype="float32"), k, ids)
+
+    def owns(self, ids):
+        return np.ones(len(ids), dtype=bool)  # Unknown here: the server applies the filter
+
+    @property
+    def ntotal(self):
+        return self._call("ntotal", self.metric)
+
+
+class ShardedIndex:
+    """Fans a search out to every shard in parallel and merges the top-k.
+
+    For exact shard indexes the merged result equals searching one index over
+    the whole corpus. Quacks like the read side of a FAISS index; writes raise
+    RuntimeError, because ids are owned by the offline builder. A filtered
+    search only visits the shards owning some of the ids, so a style filter on
+    style-partitioned shards searches just that style's shards.
+    """
+
+    def __init__(self, shards, metric="l2"):
+        self.shards = shards
+        self.metric = metric
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(shards)), thread_name_prefix="shard")
+
+    def search(self, queries, k, ids=None):
+        shards = self.shards
+        if ids is not None:
+            shards = [shard for shard in shards if shard.owns(ids).any()]
+            if not shards:
+                return (np.full((len(queries), k), -np.inf if self.metric == "ip" else np.inf, dtype="float32"),
+                        np.full((len(queries), k), -1, dtype="int64"))
+        results = list(self.pool.map(lambda shard: shard.search(queries, k, ids), shards))
+        D = np.concatenate([d for d, _ in results], axis=1)
+        I = np.concatenate([i for _, i in results], axis=1)
+        # Empty slots come back as id -1; push them to the end whatever the metric
+        worst = -np.inf if self.metric == "ip" else np.inf
+        D = np.where(I < 0, worst, D)
+        order = np.argsort(-D if self.metric == "ip" else D, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+    @property
+    def ntotal(self):
+        return sum(shard.ntotal for shard in self.shards)
+
+    def add_with_ids(self, *args):
+        raise RuntimeError("sharded index is read-only; rebuild the shards offline")
+
+    remove_ids = add_with_ids
+
+
+def load_shard_meta(shard_dir=SHARD_DIR):
+    """shards.json: shard count, partitioning and the model/projection the shards were built with"""
+    with open(os.path.join(shard_dir, "shards.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def open_shards(shard_dir=SHARD_DIR, servers=None, nprobe=None, ef_search=None):
+    """(L2, cosine) ShardedIndex pair from local shard files or shard servers.
+
+    nprobe/efSearch apply to local shards only; shard servers take their own.
+    """
+    if servers:
+        return (ShardedIndex([RemoteShard(a, "l2") for a in servers], "l2"),
+                ShardedIndex([RemoteShard(a, "ip") for a in servers], "ip"))
+    num_shards = load_shard_meta(shard_dir)["num_shards"]
+    return tuple(
+        ShardedIndex([LocalShard(read_shard(shard_dir, s, metric, nprobe, ef_search))
+                      for s in range(num_shards)], metric)
+        for metric in ("l2", "ip")
+    )
+
+def read_shard(shard_dir, shard, metric="l2", nprobe=None, ef_search=None):
+    index = faiss.read_index(shard_file(shard_dir, shard, metric))
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    return index
@@ -2,13 +2,12 @@ import os
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # Fix OpenMP DLL issue on Windows
 
 from glob import glob
-from PIL import Image, ImageFile
+from PIL import ImageFile
 import numpy as np
-import torch
-import torchvision.transforms as transforms
-from torchvision.models import resnet50, ResNet50_Weights
 import faiss
 
+from embedding import load_embedder
+
 # ====== Handle Truncated Images ======
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
@@ -22,35 +21,13 @@ image_paths = glob(os.path.join(dataset_path, "*.jpg"))
 image_paths = image_paths[:MAX_IMAGES]
 print("Found", len(image_paths), "images")
 
-# ====== Load Pretrained Model ======
-weights = ResNet50_Weights.DEFAULT
-model = resnet50(weights=weights)
-model.eval()
-model = torch.nn.Sequential(*(list(model.children())[:-1]))  # Remove final classification layer
-
-# ====== Image Transform ======
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-])
+# ====== Load Pretrained Model (shared preprocessing) ======
+embedder = load_embedder()
 
 # ====== Extract Features ======
 def extract_features(paths):
-    features = []
-    valid_paths = []
-    for i, path in enumerate(paths):
-        try:
-            image = Image.open(path).convert("RGB")
-            img_tensor = transform(image).unsqueeze(0)
-            with torch.no_grad():
-                vec = model(img_tensor).squeeze().numpy()
-            features.append(vec)
-            valid_paths.append(path)
-        except Exception as e:
-            print(f"Error processing {path}: {e}")
-        if i % 10 == 0:
-            print(f"Processed {i+1}/{len(paths)}")
-    return np.array(features).astype("float32"), valid_paths
+    """Returns (features, paths that could be decoded)"""
+    return embedder.embed_paths(paths)
 
 # ====== Extract Features for Dataset ======
 features, image_paths = extract_features(image_paths)
@@ -0,0 +1,127 @@
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# ========== CONFIG ==========
+THUMBNAIL_DIR = "thumbnails"  # Derivative cache, next to the index files
+THUMBNAIL_SIZES = (128, 256, 512)  # Longest side in pixels; only these are generated
+THUMBNAIL_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+THUMBNAIL_QUALITY = 80
+DEFAULT_SIZE = 256  # Result cards
+DEFAULT_FORMAT = "webp"
+
+# ========== DERIVATIVES ==========
+def make_thumbnail(source, dest, size, fmt=DEFAULT_FORMAT, quality=THUMBNAIL_QUALITY):
+    """Downscale `source` to fit in size x size and write it to `dest` atomically.
+
+    JPEG originals are decoded at reduced scale with draft(), so a
+    multi-megabyte scan never decodes at full resolution.
+    """
+    with Image.open(source) as image:
+        if image.format == "JPEG":
+            image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+    image.thumbnail((size, size), Image.LANCZOS)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{threading.get_ident()}.tmp"
+    try:
+        image.save(tmp, format=fmt.upper(), quality=quality, method=4 if fmt == "webp" else 0)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):  # A failed encode leaves no partial file behind
+            os.remove(tmp)
+
+
+class ThumbnailCache:
+    """On-demand, disk-cached thumbnails of the images under `root`.
+
+    A derivative is named by its strong ETag, a hash of the image's relative
+    path, mtime and byte size plus the size, format and quality it was made
+    with. A replaced original therefore gets a new file and a new ETag, and
+    conditional requests are answered from one stat() without touching the
+    derivative. Concurrent requests for the same missing derivative wait on
+    one per-file lock, so it is generated once.
+    """
+
+    def __init__(self, root, cache_dir=THUMBNAIL_DIR, sizes=THUMBNAIL_SIZES, quality=THUMBNAIL_QUALITY):
+        self.root = os.path.abspath(str(root))
+        self.cache_dir = str(cache_dir)
+        self.sizes = tuple(sizes)
+        self.quality = quality
+        self.generated = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.locks = {}  # Derivative path -> lock held while generating it
+        self.lock = threading.Lock()
+
+    def source(self, image_path):
+        """Absolute path of an image relative to `root`; FileNotFoundError if missing or outside it"""
+        path = os.path.abspath(os.path.join(self.root, image_path))  # Symlinked dataset folders are fine
+        if os.path.commonpath([self.root, path]) != self.root or not os.path.isfile(path):
+            raise FileNotFoundError(image_path)  # Paths escaping the root look missing
+        return path
+
+    def etag(self, image_path, size, fmt=DEFAULT_FORMAT):
+        if size not in self.sizes:
+            raise ValueError(f"Unsupported thumbnail size {size}, expected one of {self.sizes}")
+        if fmt not in THUMBNAIL_FORMATS:
+            raise ValueError(f"Unsupported thumbnail format {fmt!r}, expected one of {tuple(THUMBNAIL_FORMATS)}")
+        stat = os.stat(self.source(image_path))
+        key = f"{image_path}\0{stat.st_mtime_ns}\0{stat.st_size}\0{size}\0{fmt}\0{self.quality}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def not_modified(self, etag, if_none_match):
+        """Whether an If-None-Match header already names `etag` (conditional GET -> 304)"""
+        if not if_none_match:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in tags or f'"{etag}"' in tags:
+            self.revalidated += 1
+            return True
+        return False
+
+    def path(self, etag, size, fmt=DEFAULT_FORMAT):
+        return os.path.join(self.cache_dir, str(size), etag[:2], f"{etag}.{fmt}")
+
+    def get(self, image_path, size, fmt=DEFAULT_FORMAT):
+        """(derivative path, etag), generating the derivative on first use"""
+        etag = self.etag(image_path, size, fmt)
+        dest = self.path(etag, size, fmt)
+        if os.path.exists(dest):
+            self.hits += 1
+            return dest, etag
+        with self.lock:
+            file_lock = self.locks.setdefault(dest, threading.Lock())
+        try:
+            with file_lock:
+                if os.path.exists(dest):  # Generated by the request we waited for
+                    self.hits += 1
+                else:
+                    make_thumbnail(self.source(image_path), dest, size, fmt, self.quality)
+                    self.generated += 1
+        finally:
+            with self.lock:  # Also after a failed decode or write, so entries never accumulate
+                self.locks.pop(dest, None)
+        return dest, etag
+
+    def pregenerate(self, image_paths, sizes=None, fmt=DEFAULT_FORMAT, workers=4):
+        """Generate every size of every image in parallel; returns how many failed"""
+        jobs = [(path, size) for path in image_paths for size in (sizes or self.sizes)]
+
+        def run(job):
+            try:
+                self.get(*job, fmt)
+                return 0
+            except Exception as e:
+                print(f"⚠️ Error making {job[1]}px thumbnail of {job[0]}: {e}")
+                return 1
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return sum(pool.map(run, jobs))
+
+    def stats(self):
+        return {"generated": self.generated, "hits": self.hits, "revalidated": self.revalidated,
+                "in_progress": len(self.locks)}
@@ -1,75 +1,375 @@
 import os
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"  # For OpenMP issue on Windows
 
+import argparse
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
-from PIL import Image
 import numpy as np
 import torch
-import torchvision.transforms as transforms
-from torchvision.models import resnet50, ResNet50_Weights
+from torch.utils.data import Dataset, DataLoader
 import faiss
-import pickle
+
+from ann_index import (INDEX_TYPES, TRAIN_SAMPLE, PQ_M, HNSW_M, DEFAULT_NPROBE,
+                       DEFAULT_EF_SEARCH, build_index, build_cosine_index, set_search_params)
+from feature_store import (FEATURE_DTYPES, FEATURES_FILE, save_features, save_meta, load_meta,
+                           load_features as load_feature_store)
+from phash import phash, phash_file
+from shards import SHARD_BY, SHARD_DIR, build_shards
+from patches import PATCH_INDEX_FILE, PATCH_TYPES, build_patch_index, save_patch_index
+from rerank import COARSE_FILE, COARSE_TYPES, VECTORS_FILE, build_coarse_index
+from metadata_store import METADATA_FILE, relative_path, save_metadata
+from thumbnails import THUMBNAIL_DIR, THUMBNAIL_SIZES, ThumbnailCache
+from embedding import (BACKENDS, MODELS, PROJECTIONS, PROJECTION_FILE, PROJECTION_DIM, OPQ_M, transform,
+                       load_image, load_embedder, embedding_meta, embedding_id, is_compatible,
+                       train_projection, apply_projection, save_projection, describe, TILE_GRIDS, tiles_per_image)
+from manifest import (load_manifest, save_manifest, plan_update,
+                      load_checkpoint, save_checkpoint, clear_checkpoint)
 
 # ========== CONFIG ==========
 dataset_path = "D:\\faiss3\\artvee"  # Path to your folder of artwork images
 MAX_IMAGES = None # Set to a number to limit for testing (e.g., 100), or None to include all
+BATCH_SIZE = 32  # Images per ResNet50 forward pass
+NUM_WORKERS = min(8, os.cpu_count() or 1)  # Decode/preprocess worker processes
+PREFETCH_FACTOR = 4  # Batches each worker keeps ready ahead of the model
+FEATURES_PART = "features.part.f32"  # Raw float32 rows, appended batch by batch
+CHECKPOINT_EVERY = 20  # Batches between resumable checkpoints
+PHASHES_FILE = "phashes.npy"  # uint64 perceptual hash per feature row
 
-# ========== LOAD IMAGE PATHS ==========
-image_paths = glob(os.path.join(dataset_path, "*.jpg"))
-if MAX_IMAGES:
-    image_paths = image_paths[:MAX_IMAGES]
-print(f"✅ Found {len(image_paths)} images.")
+# ========== DATASET ==========
+class ArtworkDataset(Dataset):
+    """Decodes, hashes and preprocesses artwork images inside DataLoader workers"""
 
-# ========== LOAD MODEL ==========
-weights = ResNet50_Weights.DEFAULT
-model = resnet50(weights=weights)
-model.eval()
-model = torch.nn.Sequential(*(list(model.children())[:-1]))  # Remove classifier layer
+    def __init__(self, paths):
+        self.paths = paths
 
-# ========== TRANSFORM ==========
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-])
+    def __len__(self):
+        return len(self.paths)
 
-# ========== FEATURE EXTRACTION FUNCTION ==========
-def extract_features(paths):
-    features = []
-    for i, path in enumerate(paths):
+    def __getitem__(self, i):
+        path = self.paths[i]
         try:
-            image = Image.open(path).convert("RGB")
-            img_tensor = transform(image).unsqueeze(0)  # Add batch dim
-            with torch.no_grad():
-                vec = model(img_tensor).squeeze().numpy()
-            features.append(vec)
+            image = load_image(path)
+            return transform(image), i, phash(image)
         except Exception as e:
             print(f"⚠️ Error processing {path}: {e}")
+            return None
+
+def collate_skip_errors(batch):
+    """Stack a batch, dropping images that failed to decode"""
+    batch = [item for item in batch if item is not None]
+    if not batch:
+        return None
+    tensors, positions, hashes = zip(*batch)
+    return torch.stack(tensors), list(positions), list(hashes)
+
+# ========== FEATURE EXTRACTION FUNCTION ==========
+def extract_features(paths, model, out_file, batch_size=BATCH_SIZE,
+                     num_workers=NUM_WORKERS, prefetch_factor=PREFETCH_FACTOR,
+                     append=False, on_checkpoint=None):
+    """Embed `paths` in batches, appending each batch's float32 rows to `out_file`.
+
+    Every CHECKPOINT_EVERY batches the file is fsynced and `on_checkpoint` is
+    called with the positions and pHashes so far, so an interrupted run can resume.
+    Returns the positions (into `paths`) that were embedded, in row order, and
+    their perceptual hashes.
+    """
+    loader = DataLoader(
+        ArtworkDataset(paths),
+        batch_size=batch_size,
+        num_workers=num_workers,
+        collate_fn=collate_skip_errors,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+    )
+    done, hashes = [], []
+    start = time.perf_counter()
+    with open(out_file, "ab" if append else "wb") as f:
+        for n_batch, batch in enumerate(loader, 1):
+            if batch is None:
+                continue
+            tensors, positions, batch_hashes = batch
+            vecs = model(tensors)
+            vecs.tofile(f)
+            done.extend(positions)
+            hashes.extend(batch_hashes)
+            if on_checkpoint and n_batch % CHECKPOINT_EVERY == 0:
+                f.flush()
+                os.fsync(f.fileno())
+                on_checkpoint(done, hashes)
+            rate = len(done) / (time.perf_counter() - start)
+            print(f"Processed {len(done)}/{len(paths)} | {rate:.1f} images/sec")
+    elapsed = time.perf_counter() - start
+    print(f"⏱️ Embedded {len(done)} images in {elapsed:.1f}s "
+          f"({len(done) / max(elapsed, 1e-9):.1f} images/sec, "
+          f"batch_size={batch_size}, workers={num_workers}, backend={model.name})")
+    return done, hashes
+
+def load_features(out_file, dim):
+    if not os.path.exists(out_file):
+        return np.empty((0, dim), dtype="float32")
+    return np.fromfile(out_file, dtype="float32").reshape(-1, dim)
+
+def truncate_rows(out_file, rows, dim):
+    """Drop any partially written rows past the last checkpoint"""
+    with open(out_file, "r+b") as f:
+        f.truncate(rows * dim * 4)
+
+# ========== PREVIOUS BUILD ==========
+def path_key(path):
+    """Match key of an image path: absolute, normalised separators and (on Windows) case"""
+    return os.path.normcase(os.path.abspath(path))
+
+def load_previous_build(model_name="resnet50"):
+    """Return (image_paths, features) from the last completed build with the same embedding, if any"""
+    features = load_feature_store(FEATURES_FILE)
+    same_embedding = is_compatible(load_meta(FEATURES_FILE), model_name)
+    if not os.path.exists("image_paths.pkl") or features is None or not same_embedding:
+        return [], np.empty((0, MODELS[model_name]), dtype="float32")
+    with open("image_paths.pkl", "rb") as f:
+        image_paths = pickle.load(f)
+    return image_paths, features
+
+def save_atomic(path, write):
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+def pickle_to(obj):
+    def write(path):
+        with open(path, "wb") as f:
+            pickle.dump(obj, f)
+    return write
+
+def npy_to(array):
+    def write(path):
+        with open(path, "wb") as f:
+            np.save(f, array)
+    return write
+
+# ========== CLI ==========
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the FAISS artwork index")
+    parser.add_argument("--dataset", default=dataset_path, help="Folder of artwork images")
+    parser.add_argument("--limit", type=int, default=MAX_IMAGES, help="Only index the first N images")
+    parser.add_argument("--from-manifest", action="store_true",
+                        help="Index the --dataset images listed in the manifest (as written by ingest.py) "
+                             "instead of globbing *.jpg")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Decode/preprocess worker processes")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH_FACTOR, help="Batches prefetched per worker")
+    parser.add_argument("--threads", type=int, default=None, help="Torch intra-op threads for the forward pass")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and checkpoint and re-embed everything")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="FAISS index family")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(N))")
+    parser.add_argument("--pq-m", type=int, default=PQ_M, help="PQ sub-quantizers (ivfpq, pq)")
+    parser.add_argument("--hnsw-m", type=int, default=HNSW_M, help="HNSW neighbours per node")
+    parser.add_argument("--train-sample", type=int, default=TRAIN_SAMPLE, help="Vectors sampled to train IVF/PQ")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="Default IVF lists probed per query")
+    parser.add_argument("--ef-search", type=int, default=DEFAULT_EF_SEARCH, help="Default HNSW efSearch")
+    parser.add_argument("--feature-dtype", choices=FEATURE_DTYPES, default="float32", help="On-disk dtype of features.npy")
+    parser.add_argument("--model", choices=list(MODELS), default="resnet50", help="Embedding backbone")
+    parser.add_argument("--projection", choices=PROJECTIONS, default="none", help="Trained dimensionality reduction")
+    parser.add_argument("--projection-dim", type=int, default=PROJECTION_DIM, help="Output dim of the projection")
+    parser.add_argument("--opq-m", type=int, default=OPQ_M, help="OPQ sub-spaces (divides --projection-dim)")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Feature extractor backend")
+    parser.add_argument("--channels-last", action="store_true", help="channels_last memory format (torch backends)")
+    parser.add_argument("--coarse-index", choices=("none",) + COARSE_TYPES, default="none",
+                        help="Also build a compressed index for two-stage search (TWO_STAGE=1 in the service)")
+    parser.add_argument("--tiles", action="store_true",
+                        help=f"Also build {PATCH_INDEX_FILE} of multi-scale tiles for partial-copy detection (PATCH_MODE=1)")
+    parser.add_argument("--patch-index-type", choices=PATCH_TYPES, default="sq8", help="Codes of the patch index")
+    parser.add_argument("--thumbnails", action="store_true",
+                        help=f"Pre-generate {THUMBNAIL_SIZES}px WebP thumbnails under {THUMBNAIL_DIR}/ for the service")
+    parser.add_argument("--shards", type=int, default=0, help="Also split the index into N shards under shards/")
+    parser.add_argument("--shard-by", choices=SHARD_BY, default="hash", help="Partition by path hash or style folder")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    # ========== LOAD IMAGE PATHS ==========
+    if args.from_manifest:
+        # Every format ingest.py validated, without listing the folder again
+        dataset = os.path.normpath(args.dataset)
+        image_paths = sorted(path for path in load_manifest()
+                             if os.path.normpath(os.path.dirname(path)) == dataset and os.path.exists(path))
+    else:
+        image_paths = glob(os.path.join(args.dataset, "*.jpg"))
+    if args.limit:
+        image_paths = image_paths[:args.limit]
+    print(f"✅ Found {len(image_paths)} images.")
+
+    # ========== DIFF AGAINST LAST BUILD ==========
+    dim = MODELS[args.model]
+    previous = load_manifest()
+    if args.full:
+        clear_checkpoint()
+        manifest, old_paths, old_features = {}, [], load_features("", dim)
+    else:
+        manifest = previous
+        old_paths, old_features = load_previous_build(args.model) if manifest else ([], load_features("", dim))
+    # Keyed by normalised absolute path: the service's snapshots may spell a path differently than glob
+    old_rows = {path_key(path): row for row, path in enumerate(old_paths) if path is not None}
+
+    entries, keep, embed, removed = plan_update(image_paths, manifest)
+    # Files this build doesn't cover (other formats ingest.py listed, images past --limit) stay in the manifest
+    unindexed = {path: entry for path, entry in previous.items() if path not in entries and os.path.exists(path)}
+    removed = [path for path in removed if path not in unindexed]
+    embed += [path for path in keep if path_key(path) not in old_rows]
+    keep = [path for path in keep if path_key(path) in old_rows]
+    print(f"♻️ {len(keep)} unchanged, {len(embed)} new or changed, {len(removed)} removed")
+
+    # ========== RESUME INTERRUPTED RUN ==========
+    resumed = load_checkpoint(embedding_id(args.model)) if os.path.exists(FEATURES_PART) else []
+    if resumed:
+        truncate_rows(FEATURES_PART, len(resumed), dim)
+        print(f"⏯️ Resuming: {len(resumed)} images already embedded")
+    embed_hash = {path: entries[path]["sha256"] for path in embed}
+    already = {path for path, sha, _ in resumed if embed_hash.get(path) == sha}
+    pending = [path for path in embed if path not in already]
+
+    # ========== EXTRACT FEATURES ==========
+    if pending:
+        print("🔍 Extracting features...")
+        # No projection here: features.npy keeps the backbone's full width
+        model = load_embedder(args.model, args.backend, args.channels_last, calibration_paths=pending)
+
+        def checkpoint(positions, hashes):
+            save_checkpoint(resumed + [[pending[i], embed_hash[pending[i]], h]
+                                       for i, h in zip(positions, hashes)], model=embedding_id(args.model))
+
+        done, hashes = extract_features(pending, model, FEATURES_PART, args.batch_size, args.workers,
+                                args.prefetch, append=bool(resumed), on_checkpoint=checkpoint)
+    else:
+        done, hashes = [], []
+
+    # ========== MERGE KEPT AND NEW ROWS ==========
+    part = load_features(FEATURES_PART, dim)
+    part_rows = {path: row for row, (path, sha, _) in enumerate(resumed) if embed_hash.get(path) == sha}
+    part_rows.update({pending[i]: len(resumed) + k for k, i in enumerate(done)})
+    for path, sha, h in resumed:
+        if embed_hash.get(path) == sha:
+            entries[path]["phash"] = h
+    for i, h in zip(done, hashes):
+        entries[pending[i]]["phash"] = h
+
+    final_paths, features = [], np.empty((len(keep) + len(part_rows), dim), dtype="float32")
+    for path in image_paths:
+        if path in part_rows:
+            features[len(final_paths)] = part[part_rows[path]]
+        elif path_key(path) in old_rows and path not in embed_hash:
+            features[len(final_paths)] = old_features[old_rows[path_key(path)]]
+        else:
+            entries.pop(path, None)  # Failed to decode; retried on the next build
             continue
-        if i % 10 == 0:
-            print(f"Processed {i + 1}/{len(paths)}")
-    return np.array(features).astype("float32")
-
-# ========== EXTRACT FEATURES ==========
-print("🔍 Extracting features...")
-features = extract_features(image_paths)
-print(f"📏 Feature array shape: {features.shape}")
-
-
-# ========== BUILD & SAVE FAISS INDEX ==========
-dim = features.shape[1]
-index = faiss.IndexFlatL2(dim)
-index.add(features)
-faiss.write_index(index, "art_index.faiss")
-print("💾 Saved FAISS index to art_index.faiss")
-
-# ========== SAVE IMAGE PATHS ==========
-with open("image_paths.pkl", "wb") as f:
-    pickle.dump(image_paths, f)
-    
-# Assuming 'features' is the array you used to build FAISS index
-with open("features.pkl", "wb") as f:
-    pickle.dump(features, f)
-
-print("💾 Saved image paths to image_paths.pkl")
-
-print("✅ FAISS index building completed.")
+        final_paths.append(path)
+    features = features[:len(final_paths)]
+    print(f"📏 Feature array shape: {features.shape}")
+
+    # ========== PERCEPTUAL HASHES ==========
+    # Manifests from before pHashes existed: hash the kept files once, in parallel
+    missing = [path for path in final_paths if entries[path].get("phash") is None]
+    if missing:
+        print(f"🔑 Hashing {len(missing)} images missing a pHash...")
+        with ThreadPoolExecutor(max_workers=args.workers or 1) as pool:
+            for path, h in zip(missing, pool.map(phash_file, missing)):
+                entries[path]["phash"] = h
+    phashes = np.array([entries[path]["phash"] or 0 for path in final_paths], dtype="uint64")
+
+    # ========== PROJECTION ==========
+    # features.npy keeps the full backbone width so the projection can be retrained;
+    # the indexes hold projected vectors, and the service projects queries the same way
+    projection, projection_meta = None, None
+    if args.projection != "none":
+        print(f"📐 Training {args.projection} projection {dim} -> {args.projection_dim}...")
+        projection = train_projection(features, args.projection, args.projection_dim,
+                                      opq_m=args.opq_m, train_sample=args.train_sample)
+        save_projection(projection, PROJECTION_FILE)
+        projection_meta = describe(projection, args.projection, PROJECTION_FILE)
+        print(f"💾 Saved projection to {PROJECTION_FILE}")
+    vectors = apply_projection(projection, features)
+    index_meta = {**embedding_meta(args.model, projection_meta), "dim": int(vectors.shape[1]),
+                  "index_type": args.index_type, "count": len(final_paths)}
+
+    # ========== BUILD & SAVE FAISS INDEX ==========
+    print(f"🏗️ Building {args.index_type} index over {vectors.shape[1]}-d vectors...")
+    index = build_index(vectors, args.index_type, nlist=args.nlist, pq_m=args.pq_m,
+                        hnsw_m=args.hnsw_m, train_sample=args.train_sample)
+    set_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+    save_atomic("art_index.faiss", lambda path: faiss.write_index(index, path))
+    save_meta("art_index.faiss", **index_meta)
+    print("💾 Saved FAISS index to art_index.faiss")
+
+    cosine_index = build_cosine_index(vectors)
+    save_atomic("cosine_index.faiss", lambda path: faiss.write_index(cosine_index, path))
+    save_meta("cosine_index.faiss", **index_meta, metric="ip")
+    print("💾 Saved cosine index to cosine_index.faiss")
+
+    if args.coarse_index != "none":
+        # The exact stage reads index-space rows: features.npy itself unless a projection changes them
+        vectors_file = FEATURES_FILE
+        if projection is not None:
+            vectors_file = VECTORS_FILE
+            save_features(VECTORS_FILE, vectors, dtype=args.feature_dtype, **index_meta)
+            print(f"💾 Saved re-rank vectors to {VECTORS_FILE}")
+        coarse_index = build_coarse_index(vectors, args.coarse_index, nlist=args.nlist, pq_m=args.pq_m,
+                                          train_sample=args.train_sample)
+        set_search_params(coarse_index, nprobe=args.nprobe)
+        save_atomic(COARSE_FILE, lambda path: faiss.write_index(coarse_index, path))
+        save_meta(COARSE_FILE, **{**index_meta, "index_type": args.coarse_index}, vectors=vectors_file)
+        print(f"💾 Saved {args.coarse_index} coarse index to {COARSE_FILE} (re-ranks from {vectors_file})")
+
+    if args.shards:
+        counts = build_shards(vectors, final_paths, args.shards, args.shard_by, SHARD_DIR, meta=index_meta,
+                              index_type=args.index_type, nlist=args.nlist, pq_m=args.pq_m,
+                              hnsw_m=args.hnsw_m, train_sample=args.train_sample)
+        print(f"🧩 Saved {args.shards} shards by {args.shard_by} to {SHARD_DIR}/ (sizes {counts})")
+
+    if args.tiles:
+        # Rebuilt in full each time: every image costs one forward pass over its tiles
+        print(f"🧩 Embedding {tiles_per_image(TILE_GRIDS)} tiles per image (grids {TILE_GRIDS}) for the patch index...")
+        start = time.perf_counter()
+        tile_model = load_embedder(args.model, args.backend, args.channels_last, calibration_paths=final_paths,
+                                   projection_meta=projection_meta)
+        patch_index = build_patch_index(tile_model, final_paths, TILE_GRIDS, args.patch_index_type,
+                                        train_sample=args.train_sample, workers=args.workers or 1,
+                                        nlist=args.nlist, pq_m=args.pq_m)
+        save_patch_index(patch_index, PATCH_INDEX_FILE, TILE_GRIDS,
+                         **{**index_meta, "index_type": args.patch_index_type})
+        print(f"💾 Saved {patch_index.ntotal} tiles to {PATCH_INDEX_FILE} in {time.perf_counter() - start:.1f}s")
+
+    # ========== SAVE IMAGE PATHS ==========
+    save_atomic("image_paths.pkl", pickle_to(final_paths))
+    save_features(FEATURES_FILE, features, dtype=args.feature_dtype,
+                  index_type=args.index_type, **embedding_meta(args.model))
+    print(f"💾 Saved features to {FEATURES_FILE}")
+    save_atomic(PHASHES_FILE, npy_to(phashes))
+    print(f"💾 Saved perceptual hashes to {PHASHES_FILE}")
+    print("💾 Saved image paths to image_paths.pkl")
+    # Relative paths, style and hashes per FAISS id; the service filters searches with it
+    save_metadata(METADATA_FILE, final_paths, root=".", source=os.path.basename(os.path.normpath(args.dataset)),
+                  sha256s=[entries[path]["sha256"] for path in final_paths], phashes=phashes)
+    print(f"💾 Saved artwork metadata to {METADATA_FILE}")
+
+    if args.thumbnails:
+        # Same relative paths and cache layout the service uses, so these are served as cache hits
+        thumbnails = ThumbnailCache(".", THUMBNAIL_DIR)
+        start = time.perf_counter()
+        failed = thumbnails.pregenerate([relative_path(path, ".") for path in final_paths],
+                                        workers=args.workers or 1)
+        print(f"🖼️ {thumbnails.generated} thumbnails made, {thumbnails.hits} already cached, {failed} failed "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    # The manifest goes last: a crash before this point just re-checks a few files next time
+    save_manifest({**unindexed, **entries})
+    clear_checkpoint()
+    if os.path.exists(FEATURES_PART):
+        os.remove(FEATURES_PART)
+
+    print("✅ FAISS index building completed.")
+
+if __name__ == "__main__":
+    main()